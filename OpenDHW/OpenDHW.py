@@ -4,12 +4,37 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
+import os
+import functools
+import collections
 import math
-import statistics
-import random
 import scipy
 from scipy.stats import beta
 import matplotlib.dates as mdates
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from OpenDHW import core
+from OpenDHW.core import (
+    rho, cp, cache_size_profiles, ProfileMeta, DrawoffEvents,
+    FactorizedProfile, ProfilePyramid, generate_profile,
+    generate_dhw_profiles, get_data_drawoff_categories,
+    generate_daily_probability_step_function, get_p_norm_integral,
+    shift_weekend_weekday, generate_yearly_probabilities,
+    generate_factorized_probability_profile, get_day_types,
+    get_seasonal_factors, normalize_and_sum_list, get_seed_sequence, get_rng,
+    get_child_seed_sequence, place_drawoffs,
+    generate_single_drawoff_inside_boundaries,
+    generate_drawoffs_inside_boundaries, compute_heat_profiles,
+    resample_profiles, compute_storage_load, StorageModel,
+    StratifiedStorageModel)
+from OpenDHW.dhwcalc_library import (
+    get_dhwcalc_dir, get_dhwcalc_file_name, load_dhwcalc_profile,
+    convert_dhwcalc_library, read_flow_file, detect_s_step)
+from OpenDHW.dhwcalc_catalog import (
+    get_catalog, find_dhwcalc_profiles, find_nearest_dhwcalc_profile)
+from OpenDHW import distributions
+from OpenDHW.distributions import (
+    FlowDistribution, get_flow_distribution, get_distribution_distance)
 
 """
 This is the script that stores all function of the DHWcalc package.
@@ -22,6 +47,9 @@ https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html
 
 OpenDHW_Utilities stores a few other functions that do not generate DHW 
 Timeseries directly, like the StorageLoad Function.
+
+The NumPy kernels live in OpenDHW.core and are imported here, most functions
+in this script wrap them into Dataframes.
 """
 
 # RWTH colours
@@ -30,13 +58,20 @@ rwth_red = "#CC071E"
 # sns.set_style("white")
 sns.set_context("paper")
 
-# --- Constants ---
-rho = 980 / 1000  # kg/L for Water (at 60°C? at 10°C its = 1)
-cp = 4180  # J/kgK
+# --- Metadata, kept in df.attrs. Older dataframes hold it in these columns.
+meta_cols = ['method', 's_step', 'categories', 'initial_day',
+             'weekend_weekday_factor', 'mean_drawoff_vol_per_day',
+             'sdtdev_drawoff_vol_per_day', 'mean_vol_per_drawoff',
+             'mean_drawoff_flow_rate_LperH', 'sdtdev_drawoff_flow_rate_LperH',
+             'mean_no_drawoffs_per_day', 'dwellings']
+
+# --- How columns are resampled, see 'get_column_schema' ---
+column_kinds = ('intensive', 'extensive', 'constant', 'constant_flow')
 
 
 def import_from_dhwcalc(s_step, daylight_saving, categories,
-                        mean_drawoff_vol_per_day=200, max_flowrate=1200):
+                        mean_drawoff_vol_per_day=200, max_flowrate=1200,
+                        nearest=False):
     """
     DHWcalc yields Volume Flow TimeSeries (in Liters per hour).
 
@@ -45,70 +80,85 @@ def import_from_dhwcalc(s_step, daylight_saving, categories,
     :param  mean_drawoff_vol_per_day:   int:    daily water demand in Liters
     :param  daylight_saving:            Bool:   apply daylight saving or not
     :param  max_flowrate:               int:    maximum water flowrate in L/h
+    :param  nearest:                    Bool:   if there is no file with these
+                                                parameters, use the closest
+                                                one of the catalog.
 
     :return timeseries_df:              df:     dataframe that holds the data
     """
 
-    if daylight_saving:
-        ds_string = 'ds'
-    else:
-        ds_string = 'nods'
-
     # --- DHWcalc result files, saved in the OpenDHW Package
-    dhw_file = "{vol}L_{s_step}min_{cats}cat_sf_{ds}_max{max_flow}.txt".format(
-        vol=mean_drawoff_vol_per_day,
-        s_step=int(s_step / 60),
-        cats=categories,
-        ds=ds_string,
-        max_flow=max_flowrate,
+    dhw_file = get_dhwcalc_file_name(
+        s_step=s_step,
+        daylight_saving=daylight_saving,
+        categories=categories,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+        max_flowrate=max_flowrate
     )
 
-    dhw_profile = Path.cwd().parent / "DHWcalc_Files" / dhw_file
+    dhw_profile = get_dhwcalc_dir() / dhw_file
+
+    if nearest and not dhw_profile.exists():
+        record = find_nearest_dhwcalc_profile(
+            s_step=s_step,
+            categories=categories,
+            mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+            daylight_saving=daylight_saving,
+            max_flowrate=max_flowrate
+        )
+        dhw_profile = record['path']
+        s_step = int(record['s_step'])
+        mean_drawoff_vol_per_day = int(record['mean_drawoff_vol_per_day'])
 
     assert dhw_profile.exists(), 'No DHWcalc File for the selected ' \
                                  'parameters: {}'.format(dhw_file)
 
-    # Flowrate in Liter per Hour in each Step
-    water_LperH = [int(word.strip('\n')) for word in
-                   open(dhw_profile).readlines()]  # L/h each step
+    # Flowrate in Liter per Hour in each Step, from the binary cache
+    water_LperH = load_dhwcalc_profile(dhw_profile)
 
-    date_range = pd.date_range(start='2019-01-01', end='2020-01-01',
-                               freq=str(s_step) + 'S')
-    date_range = date_range[:-1]
+    date_range = get_date_range(s_step)
 
     # make dataframe
-    timeseries_df = pd.DataFrame(water_LperH, index=date_range, columns=[
-        'Water_LperH'])
+    timeseries_df = pd.DataFrame(index=date_range, data={
+        'Water_LperH': water_LperH,
+        'Water_L': water_LperH / 3600 * s_step
+    })
 
-    timeseries_df['Water_L'] = timeseries_df['Water_LperH'] / 3600 * s_step
-    timeseries_df['method'] = 'DHWcalc'
-    timeseries_df['mean_drawoff_vol_per_day'] = mean_drawoff_vol_per_day
-    timeseries_df['categories'] = categories
-    timeseries_df['initial_day'] = 0
-    timeseries_df['weekend_weekday_factor'] = 1.2
-    timeseries_df['sdtdev_drawoff_vol_per_day'] = mean_drawoff_vol_per_day / 4
+    # --- metadata
+    timeseries_df.attrs = ProfileMeta(
+        s_step=s_step,
+        categories=categories,
+        weekend_weekday_factor=1.2,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+        initial_day=0,
+        method='DHWcalc'
+    ).to_dict()
+    timeseries_df.attrs['sdtdev_drawoff_vol_per_day'] = \
+        mean_drawoff_vol_per_day / 4
 
     if categories == 1:
         mean_vol_per_drawoff = 8  # constant DHWcalc 1 category
-        timeseries_df['mean_vol_per_drawoff'] = 8
+        timeseries_df.attrs['mean_vol_per_drawoff'] = 8
 
         mean_drawoff_flow_rate_LperH = mean_vol_per_drawoff * 3600 / s_step
-        timeseries_df[
+        timeseries_df.attrs[
             'mean_drawoff_flow_rate_LperH'] = mean_drawoff_flow_rate_LperH
 
         sdt_dev_drawoff_flow_rate = mean_drawoff_flow_rate_LperH / 4  # in L/h
-        timeseries_df[
+        timeseries_df.attrs[
             'sdtdev_drawoff_flow_rate_LperH'] = sdt_dev_drawoff_flow_rate
 
         mean_no_drawoffs_per_day \
             = mean_drawoff_vol_per_day / mean_vol_per_drawoff
-        timeseries_df['mean_no_drawoffs_per_day'] = mean_no_drawoffs_per_day
+        timeseries_df.attrs[
+            'mean_no_drawoffs_per_day'] = mean_no_drawoffs_per_day
 
     return timeseries_df
 
 
 def generate_dhw_profile(s_step, categories, weekend_weekday_factor=1.2,
-                         mean_drawoff_vol_per_day=200, initial_day=0):
+                         mean_drawoff_vol_per_day=200, initial_day=0,
+                         seed=None, run=0, return_events=False):
     """
     Generates a DHW profile. The generation is split up in different
     functions and generally follows the methodology described in the DHWcalc
@@ -120,15 +170,40 @@ def generate_dhw_profile(s_step, categories, weekend_weekday_factor=1.2,
         profile p_norm_integral.
     4)  Add some additionally stats to the dataframe.
 
+    The profile is fully defined by its key (seed, run): every category
+    draws from its own stream (see 'get_rng'). The same key yields the same
+    profile as row 'run' of 'generate_dhw_profiles' with the same seed.
+
     :param s_step:                      int:    timestep width in seconds.
     :param categories:                  int:    1 or 4 (see DHWcalc)
     :param weekend_weekday_factor:      int:    taken from DHWcalc
     :param mean_drawoff_vol_per_day:    int:    function of number of people in
                                                 the house of floor area.
     :param initial_day:                 int:    0:Mon - 1:Tues ... 6:Sun
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param run:                         int:    run number, part of the key
+    :param return_events:               bool:   return the sparse drawoff
+                                                events (DrawoffEvents) instead
+                                                of the dataframe.
     :return: timeseries_df              df:     dataframe with all timeseries
     """
 
+    meta = ProfileMeta(
+        s_step=s_step,
+        categories=categories,
+        weekend_weekday_factor=weekend_weekday_factor,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+        initial_day=initial_day
+    )
+
+    events = generate_dhw_profiles(n_runs=1, seed=seed, first_run=run,
+                                   return_events=True,
+                                   **meta.generation_params())
+
+    if return_events:
+        return events
+
     # --- holds statistic info about the drawoffs
     cats_df = get_data_drawoff_categories(
         s_step=s_step,
@@ -136,461 +211,734 @@ def generate_dhw_profile(s_step, categories, weekend_weekday_factor=1.2,
         mean_drawoff_vol_per_day=mean_drawoff_vol_per_day
     )
 
-    # --- deterministic function
-    timeseries_df = generate_yearly_probability_profile(
-        s_step=s_step,
-        weekend_weekday_factor=1.2,
-        initial_day=0
+    # --- collect all columns first and build the dataframe at once
+    columns = {
+        'p_norm_integral': get_p_norm_integral(
+            s_step=s_step,
+            weekend_weekday_factor=weekend_weekday_factor,
+            initial_day=initial_day
+        ),
+        'Water_LperH': events.to_dense().astype(np.int16)
+    }
+
+    for cat_id in cats_df['mean_flow_rate_per_drawoff_LperH'].astype(int):
+        water_LperH_cat = events.to_dense(category=cat_id).astype(np.int16)
+        columns['Water_LperH_cat{}'.format(cat_id)] = water_LperH_cat
+        columns['Water_L_cat{}'.format(cat_id)] = \
+            water_LperH_cat.astype(float) * s_step / 3600
+
+    # --- add some additional stats
+    columns['Water_L'] = columns['Water_LperH'] / 3600 * s_step
+
+    timeseries_df = pd.DataFrame(index=get_date_range(s_step), data=columns)
+    timeseries_df.attrs = meta.to_dict()
+
+    return timeseries_df
+
+
+def generate_dhw_profiles_parallel(n_runs, s_step, categories,
+                                   weekend_weekday_factor=1.2,
+                                   mean_drawoff_vol_per_day=200,
+                                   initial_day=0, dtype=np.int16,
+                                   n_workers=None, max_memory_mb=1024,
+                                   seed=None, first_run=0):
+    """
+    Parallel version of 'generate_dhw_profiles'. The runs are split into
+    tasks that are generated in a process pool. See 'sweep_dhw_profiles'.
+    The runs use the same random streams as in 'generate_dhw_profiles', so
+    both return the same profiles for the same seed.
+
+    :param n_runs:                      int:    number of profiles
+    :param s_step:                      int:    timestep width in seconds.
+    :param categories:                  int:    1 or 4 (see DHWcalc)
+    :param weekend_weekday_factor:      int:    taken from DHWcalc
+    :param mean_drawoff_vol_per_day:    int:    function of number of people in
+                                                the house of floor area.
+    :param initial_day:                 int:    0:Mon - 1:Tues ... 6:Sun
+    :param dtype:                       dtype:  dtype of the returned array
+    :param n_workers:                   int:    number of processes. Defaults
+                                                to the number of CPUs.
+    :param max_memory_mb:               int:    working memory of all workers
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param first_run:                   int:    run number of the first row
+    :return: water_LperH:               array:  flow rates in L/h, one row
+                                                per run.
+    """
+
+    params = dict(s_step=s_step,
+                  categories=categories,
+                  weekend_weekday_factor=weekend_weekday_factor,
+                  mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+                  initial_day=initial_day)
+
+    water_LperH_lst = _generate_dhw_profiles_in_pool(
+        params_lst=[params],
+        seed_seqs=[get_seed_sequence(seed)],
+        n_runs=n_runs,
+        dtype=dtype,
+        n_workers=n_workers,
+        max_memory_mb=max_memory_mb,
+        first_run=first_run
     )
 
-    # --- empty drawoffs list, will be filled afterwards
-    timeseries_df['Water_LperH'] = [0] * int(365 * 24 * 3600 / s_step)
+    return water_LperH_lst[0]
 
-    # --- for each category, generate and distribute drawoffs.
-    for i in range(len(cats_df)):
-        timeseries_df = generate_and_distribute_drawoffs(
-            timeseries_df=timeseries_df,
-            cats_series=cats_df.iloc[i],
-        )
 
-    # --- add some additional stats
-    timeseries_df['Water_L'] = timeseries_df['Water_LperH'] / 3600 * s_step
-    timeseries_df['method'] = 'OpenDHW'
-    timeseries_df['categories'] = categories
-    timeseries_df['initial_day'] = initial_day
-    timeseries_df['weekend_weekday_factor'] = weekend_weekday_factor
-    timeseries_df['mean_drawoff_vol_per_day'] = mean_drawoff_vol_per_day
+def sweep_dhw_profiles(params_lst, n_runs, dtype=np.int16, n_workers=None,
+                       max_memory_mb=1024, seed=None):
+    """
+    Generates n_runs profiles for each parameter set in params_lst in a
+    process pool. Each parameter set is a dict with the arguments of
+    'generate_dhw_profiles' (s_step, categories, weekend_weekday_factor,
+    mean_drawoff_vol_per_day, initial_day).
+
+    The runs are split into tasks. Every parameter set gets its own child of
+    the SeedSequence and every run its own stream (see 'get_rng'), so the
+    streams of the workers are independent and the result does not depend
+    on the number of workers. The workers write their profiles straight
+    into shared memory, so no arrays or dataframes have to be pickled on the
+    way back.
+
+    The memory budget is shared between the workers. It limits the number
+    of runs per task and the block size used for placing the drawoffs. The
+    returned arrays themselves are not part of the budget.
+
+    :param params_lst:      list:   dicts with the generation parameters
+    :param n_runs:          int:    number of profiles per parameter set
+    :param dtype:           dtype:  dtype of the returned arrays
+    :param n_workers:       int:    number of processes. Defaults to the
+                                    number of CPUs.
+    :param max_memory_mb:   int:    working memory of all workers
+    :param seed:            int:    seed, SeedSequence or Generator
+    :return: water_LperH_lst: list: one array (runs x timesteps) per set
+    """
 
-    return timeseries_df
+    water_LperH_lst = _generate_dhw_profiles_in_pool(
+        params_lst=params_lst,
+        seed_seqs=get_seed_sequence(seed).spawn(len(params_lst)),
+        n_runs=n_runs,
+        dtype=dtype,
+        n_workers=n_workers,
+        max_memory_mb=max_memory_mb
+    )
 
+    return water_LperH_lst
 
-def get_data_drawoff_categories(s_step, categories, mean_drawoff_vol_per_day):
-    """
-    Get some data for each drawoff category. If only one category is chosen,
-    a simplified datafarme is returned.
-
-    :param s_step:                      int:    seconds in a timestep. f.e 900
-    :param categories:                  int:    1 or 4, see DHWcalc
-    :param mean_drawoff_vol_per_day:    int:    volume per day used in house
-    :return: cats_df:                   df:     Categores Data
-    """
-    if categories == 4:
-        cats_data_60 = {'mean_flow_rate_per_drawoff_LperH': [60, 360, 840, 480],
-                        'drawoff_duration_min': [1, 1, 10, 5],
-                        'portion': [0.14, 0.36, 0.1, 0.4],
-                        'stddev_flow_rate_per_drawoff_LperH': [120, 120, 12,
-                                                               24],
-                        'min_flow_rate_per_drawoff_LperH': [1, 1, 1, 1]
-                        }
-
-        cats_df = pd.DataFrame(data=cats_data_60)
-        # sort by duration distributes long drawoff types first.
-        # todo: second sort by portion, biggest portion distributed first
-        cats_df.sort_values(by=['drawoff_duration_min'], ascending=False,
-                            inplace=True)
-
-    elif categories == 1:
-        cats_data_60 = {'mean_flow_rate_per_drawoff_LperH': [480],
-                        'drawoff_duration_min': [1],
-                        'portion': [1],
-                        'stddev_flow_rate_per_drawoff_LperH': [120],
-                        'min_flow_rate_per_drawoff_LperH': [6]
-                        }
-
-        cats_df = pd.DataFrame(data=cats_data_60)
-    else:
-        raise Exception('unkown number of categories')
 
-    # if DHWcalc uses 4 categories with a timestep other than 60s,
-    # the drawoffs data has to be altered.
-    if s_step != 60:
-        cats_df['drawoff_duration_min_old'] = cats_df['drawoff_duration_min']
+def _generate_dhw_profiles_in_pool(params_lst, seed_seqs, n_runs, dtype,
+                                   n_workers, max_memory_mb, first_run=0):
+    """
+    Process pool behind 'sweep_dhw_profiles' and
+    'generate_dhw_profiles_parallel'. seed_seqs holds the root of the random
+    streams for each parameter set.
+    """
 
-        cats_df['drawoff_duration_min'] = int(s_step / 60)
+    if n_workers is None:
+        n_workers = os.cpu_count()
 
-        cats_df['conversion_factor'] = cats_df['drawoff_duration_min'] / \
-                                       cats_df['drawoff_duration_min_old']
+    itemsize = np.dtype(dtype).itemsize
+    worker_mb = max_memory_mb / n_workers
 
-        cats_df['mean_flow_rate_per_drawoff_LperH'] \
-            = cats_df['mean_flow_rate_per_drawoff_LperH'] / cats_df[
-            'conversion_factor']
-        cats_df['stddev_flow_rate_per_drawoff_LperH'] = \
-            cats_df['stddev_flow_rate_per_drawoff_LperH'] / cats_df[
-                'conversion_factor']
+    # --- one shared memory block per parameter set, split into tasks ---
+    shms = []
+    tasks = []
+    for params, seed_seq in zip(params_lst, seed_seqs):
+        n_steps = int(365 * 24 * 3600 / params['s_step'])
+        shape = (n_runs, n_steps)
 
-    # add more data to the category dataframe.
-    cats_df['mean_vol_per_drawoff'] = \
-        cats_df['mean_flow_rate_per_drawoff_LperH'] \
-        / 60 * cats_df['drawoff_duration_min']
+        shm = shared_memory.SharedMemory(
+            create=True, size=max(n_runs * n_steps * itemsize, 1))
+        shms.append((shm, shape))
 
-    cats_df['mean_vol_per_day'] = mean_drawoff_vol_per_day * cats_df[
-        'portion']
+        # a task keeps its runs in memory (output and two float arrays to
+        # place the drawoffs). Spread the runs evenly over the workers.
+        mb_per_run = n_steps * (itemsize + 2 * 8) / 1e6
+        runs_per_task = max(1, min(int(worker_mb / mb_per_run),
+                                   math.ceil(n_runs / n_workers)))
 
-    cats_df['mean_vol_per_year'] = cats_df['mean_vol_per_day'] * 365
+        for first_row in range(0, n_runs, runs_per_task):
+            last_row = min(first_row + runs_per_task, n_runs)
+            tasks.append((shm.name, shape, params, first_row, last_row,
+                          seed_seq, first_run + first_row))
 
-    cats_df['mean_no_drawoffs_per_day'] = \
-        cats_df['mean_vol_per_day'] / cats_df['mean_vol_per_drawoff']
+    try:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(_generate_dhw_profiles_task, *task,
+                                dtype=dtype, max_block_mb=worker_mb)
+                for task in tasks]
 
-    cats_df['mean_no_drawoffs_per_year'] = \
-        cats_df['mean_no_drawoffs_per_day'] * 365
+            for future in futures:
+                future.result()
 
-    # add max flow rate: Max(1200, highest category mean flow rate)
-    cats_df['max_flow_rate_per_drawoff_LperH'] \
-        = max(cats_df['mean_flow_rate_per_drawoff_LperH'].max(), 1200)
+        water_LperH_lst = [
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+            for shm, shape in shms]
 
-    return cats_df
+    finally:
+        for shm, _ in shms:
+            shm.close()
+            shm.unlink()
 
+    return water_LperH_lst
 
-def generate_daily_probability_step_function(mode, s_step, save_fig=False,
-                                             test_concentrated_ps=False):
-    """
-    Generates probabilities for a day with 6 periods. Corresponds to the mode
-    "step function for weekdays and weekends" in DHWcalc and uses the same
-    standard values. Each Day starts at 0:00. Steps in hours. Sum of steps
-    has to be 24. Sum of probabilities has to be 1.
 
-    :param test_concentrated_ps:    bool:   different probabilities,
-                                            very concentrated in the morning
-    :param mode:                    string: weekday or weekend day
-    :param s_step:                  int:    seconds within a timestep
-    :param save_fig:                Bool:   plot the probability distribution
-    :return: p_day                  list:   distribution for one day.
+def _generate_dhw_profiles_task(shm_name, shape, params, first_row, last_row,
+                                seed_seq, first_run, dtype, max_block_mb):
+    """
+    Runs in a worker process of 'sweep_dhw_profiles'. Generates the rows
+    first_row to last_row and writes them into the shared memory block.
     """
 
-    # todo: add profiles for non-residential buildings, no more heavy periods
-    #  in the morning and evening? different for every industry type? more
-    #  during the night?
+    water_LperH = generate_dhw_profiles(
+        n_runs=last_row - first_row,
+        dtype=dtype,
+        max_block_mb=max_block_mb,
+        seed=seed_seq,
+        first_run=first_run,
+        **params
+    )
 
-    if s_step <= 1800:
-        if mode == 'weekday':
-            steps_and_ps = [(6.5, 0.01), (1, 0.5), (4.5, 0.06), (1, 0.16),
-                            (5, 0.06), (4, 0.2), (2, 0.01)]
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        out[first_row:last_row] = water_LperH
+        del out
+    finally:
+        shm.close()
 
-        elif mode == 'weekend':
-            steps_and_ps = [(7, 0.02), (2, 0.475), (6, 0.071), (2, 0.237),
-                            (3, 0.036), (3, 0.143), (1, 0.018)]
 
-        else:
-            raise Exception('Unknown Mode. Please Choose "Weekday" or '
-                            '"Weekend".')
-    else:
-        # no more half-hourly steps
-        if mode == 'weekday':
-            steps_and_ps = [(7, 0.01), (1, 0.5), (4, 0.06), (1, 0.16),
-                            (5, 0.06), (4, 0.2), (2, 0.01)]
+def iter_dhw_profile(s_step, categories, start='2019-01-01', end=None,
+                     n_years=1, weekend_weekday_factor=1.2,
+                     mean_drawoff_vol_per_day=200, chunk_days=7, seed=None,
+                     run=0, as_frame=True):
+    """
+    Generates a DHW profile chunk by chunk, so long horizons (f.e. 20 years
+    at s_step=60) never have to be held in memory at once. Only one chunk
+    of chunk_days days is built at a time.
+
+    The model is the same as in 'generate_dhw_profile', but follows the
+    calendar: weekend days are the real Saturdays and Sundays, leap years
+    have 366 days and the seasonal sine-function is evaluated on the day of
+    the year. Each day gets the share of the yearly volume
+    (mean_drawoff_vol_per_day * days in the year) that corresponds to its
+    share of the yearly probability. Drawoffs are generated until the
+    cumulative volume target of each category is reached, so the volume a
+    chunk over- or undershoots is balanced in the next chunk. Drawoffs that
+    reach beyond the end of a chunk are carried over into the next one.
 
-        elif mode == 'weekend':
-            steps_and_ps = [(7, 0.02), (2, 0.475), (6, 0.071), (2, 0.237),
-                            (3, 0.036), (3, 0.143), (1, 0.018)]
+    :param s_step:                      int:    timestep width in seconds.
+    :param categories:                  int:    1 or 4 (see DHWcalc)
+    :param start:                       str:    first day, f.e. '2019-01-01'
+    :param end:                         str:    day after the last day. If
+                                                None, n_years are generated.
+    :param n_years:                     int:    horizon if end is None
+    :param weekend_weekday_factor:      int:    taken from DHWcalc
+    :param mean_drawoff_vol_per_day:    int:    function of number of people in
+                                                the house of floor area.
+    :param chunk_days:                  int:    days per chunk, f.e. 1 or 7
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param run:                         int:    run number, part of the key
+    :param as_frame:                    bool:   yield dataframes with a
+                                                'Water_LperH' and 'Water_L'
+                                                column. Otherwise, yield
+                                                tuples of (start timestamp,
+                                                flow rates in L/h).
+    :return: chunks:                    generator
+    """
 
-        else:
-            raise Exception('Unknown Mode. Please Choose "Weekday" or '
-                            '"Weekend".')
+    assert (24 * 3600) % s_step == 0, 's_step has to fit into a day'
+    steps_per_day = int(24 * 3600 / s_step)
 
-    if test_concentrated_ps:
-        # just as a test, if p is very concentrated, only 2 hours in the morning
-        steps_and_ps = [(7, 0), (2, 1), (15, 0)]
+    start_day = np.datetime64(pd.Timestamp(start).date(), 'D')
+    if end is None:
+        end = pd.Timestamp(start) + pd.DateOffset(years=n_years)
+    end_day = np.datetime64(pd.Timestamp(end).date(), 'D')
 
-    steps = [tup[0] for tup in steps_and_ps]
-    ps = [tup[1] for tup in steps_and_ps]
+    seed_seq = get_seed_sequence(seed)
 
-    assert sum(steps) == 24
-    assert sum(ps) == 1
+    cats_df = get_data_drawoff_categories(
+        s_step=s_step,
+        categories=categories,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day
+    )
 
-    p_day = []
+    # --- daily probabilities, row 0: weekday, row 1: weekend day ---
+    p_wd_weighted, p_we_weighted, _ = shift_weekend_weekday(
+        p_weekday=generate_daily_probability_step_function(
+            mode='weekday', s_step=s_step),
+        p_weekend=generate_daily_probability_step_function(
+            mode='weekend', s_step=s_step),
+        factor=weekend_weekday_factor
+    )
+    p_days = np.array([p_wd_weighted, p_we_weighted])
+    p_days_sum = p_days.sum(axis=1)
+
+    def day_probabilities(days):
+        """
+        day type (0: weekday, 1: weekend) and probability sum of each day
+        """
+        # 1970-01-01 was a Thursday (weekday 3)
+        day_types = ((days.astype(np.int64) + 3) % 7 >= 5).astype(int)
+        year_starts = days.astype('datetime64[Y]').astype('datetime64[D]')
+        year_ends = (days.astype('datetime64[Y]') + 1).astype(
+            'datetime64[D]')
+        day_of_year = (days - year_starts).astype(np.int64)
+        days_in_year = (year_ends - year_starts).astype(np.int64)
+
+        # seasonal factor, like in 'generate_yearly_probabilities'
+        arg = np.pi * (2 / days_in_year * day_of_year - 1 / 4)
+        probability_season = 1 + 0.1 * np.cos(arg)
 
-    for tup in steps_and_ps:
-        p_lst = [tup[1] for _ in range(int(tup[0] * 3600 / s_step))]
-        p_day.extend(p_lst)
+        return day_types, probability_season, \
+            p_days_sum[day_types] * probability_season
+
+    year_sums = {}
+
+    def daily_volumes(days):
+        """
+        expected volume of each day in L, from its share of its year
+        """
+        _, _, day_sums = day_probabilities(days)
+        years = days.astype('datetime64[Y]')
+        volumes = np.empty(len(days))
+
+        for year in np.unique(years):
+            if year not in year_sums:
+                year_days = np.arange(year.astype('datetime64[D]'),
+                                      (year + 1).astype('datetime64[D]'))
+                year_sums[year] = (day_probabilities(year_days)[2].sum(),
+                                   len(year_days))
+            year_sum, days_in_year = year_sums[year]
+            in_year = years == year
+            volumes[in_year] = mean_drawoff_vol_per_day * days_in_year \
+                * day_sums[in_year] / year_sum
+
+        return volumes
+
+    # drawoffs may reach into the next chunk
+    tail_steps = int(cats_df['drawoff_duration_min'].max() * 60 / s_step) - 1
+    carry_over = np.zeros(tail_steps)
+
+    # volume targets and generated volumes of each category
+    V_target = np.zeros(len(cats_df))
+    V_generated = np.zeros(len(cats_df))
+
+    for chunk, chunk_start in enumerate(
+            np.arange(start_day, end_day, chunk_days)):
+
+        days = np.arange(chunk_start, min(chunk_start + chunk_days, end_day))
+        n_steps = len(days) * steps_per_day
+
+        # --- probability profile of the chunk ---
+        day_types, probability_season, _ = day_probabilities(days)
+        p_chunk = (p_days[day_types] * probability_season[:, None]).ravel()
+        p_norm_integral = np.cumsum(p_chunk) / p_chunk.sum()
+        min_rand = p_norm_integral.min()
+        max_rand = p_norm_integral.max()
+
+        # the chunk is extended by the tail, in which no drawoff can start.
+        p_norm_integral = np.concatenate(
+            [p_norm_integral, np.full(tail_steps, max_rand)])
+        water_LperH = np.zeros(n_steps + tail_steps)
+        water_LperH[:tail_steps] = carry_over
+
+        chunk_volume = daily_volumes(days).sum()
+
+        for i in range(len(cats_df)):
+            cats_series = cats_df.iloc[i]
+            rng = get_rng(seed_seq, run, chunk, i)
+            drawoff_steps = int(cats_series['drawoff_duration_min'] * 60
+                                / s_step)
+
+            V_target[i] += chunk_volume * cats_series['portion']
+            drawoffs = generate_drawoffs_inside_boundaries(
+                cats_series, s_step, rng=rng,
+                V_max=V_target[i] - V_generated[i])
+            V_generated[i] += drawoffs.sum() * s_step / 3600 * drawoff_steps
+
+            water_LperH, _ = place_drawoffs(
+                p_norm_integral=p_norm_integral,
+                p_drawoffs=rng.uniform(min_rand, max_rand,
+                                       size=len(drawoffs)),
+                drawoffs=drawoffs,
+                drawoff_steps=drawoff_steps,
+                max_flow_rate=cats_series['max_flow_rate_per_drawoff_LperH'],
+                water_LperH=water_LperH
+            )
 
-    # check if length of daily intervals fits into the stepwidth.
-    assert len(p_day) == 24 * 3600 / s_step
+        carry_over = water_LperH[n_steps:]
+        water_LperH = water_LperH[:n_steps]
 
-    if save_fig:
-        fig, ax = plt.subplots()
-        plt.plot(p_day)
-        plt.show()
-        dir_output = Path.cwd() / "plots"
-        dir_output.mkdir(exist_ok=True)
-        fname = "Daily_Probability_Profile_{}S_{}".format(s_step, mode)
-        fig.savefig(dir_output / (fname + '.pdf'))
-        fig.savefig(dir_output / (fname + '.svg'))
-        fig.savefig(dir_output / (fname + '.png'))
+        if as_frame:
+            index = pd.date_range(start=pd.Timestamp(chunk_start),
+                                  periods=n_steps, freq=str(s_step) + 'S')
+            chunk_df = pd.DataFrame(index=index,
+                                    data={'Water_LperH': water_LperH})
+            chunk_df['Water_L'] = chunk_df['Water_LperH'] / 3600 * s_step
+            yield chunk_df
 
-    return p_day
+        else:
+            yield pd.Timestamp(chunk_start), water_LperH
 
 
-def generate_yearly_probability_profile(s_step, weekend_weekday_factor=1.2,
-                                        initial_day=0):
+def generate_coarse_dhw_profile(s_step, categories, weekend_weekday_factor=1.2,
+                                mean_drawoff_vol_per_day=200, initial_day=0,
+                                seed=None, run=0):
     """
-    generate a summed yearly probability profile. The whole function is
-    deterministic. The same inputs always produce the same outputs.
-
-    1)  Probabilities for weekdays and weekend-days are loaded (p_we, p_wd).
-    2)  Probability of weekend-days is increased relative to weekdays (shift).
-    3)  Based on an initial day, the yearly probability distribution (p_final)
-        is generated. The seasonal influence is modelled by a sine-function.
-    4)  p_final is normalized and integrated. The sum over the year is thus
-        equal to 1 (p_norm_integral).
-
-    :param s_step:                  int:    seconds in a timestep
-    :param weekend_weekday_factor:  float:  shift probabilities towards weekend
-    :param initial_day:             int:    Mon: 0 ... Sun: 6
-    :return: timeseries_df:         df:     df that holds the yearly profile
+    Generates a DHW profile for coarse timesteps (f.e. 900 or 3600 seconds)
+    directly from the drawoffs of the 60 seconds model, instead of
+    stretching every drawoff to a full timestep or generating and
+    resampling a 60 seconds profile.
+
+    1)  For each category, the drawoffs of the year are generated with the
+        categories of the 60 seconds model. Their number and flow rates are
+        the same as in 'generate_dhw_profile' with s_step=60.
+    2)  The number of drawoffs in each coarse timestep is drawn from a
+        multinomial distribution. The probability of a timestep is the sum of
+        the 60 seconds probabilities inside it.
+    3)  Each drawoff starts at a random minute inside its timestep. The part
+        of a drawoff that reaches into the next timestep is added there.
+
+    The work is proportional to the number of timesteps and drawoffs. Unlike
+    the 60 seconds model, drawoffs are not limited by a max flow rate.
+
+    :param s_step:                      int:    timestep width in seconds. A
+                                                multiple of 60 that fits
+                                                into a day.
+    :param categories:                  int:    1 or 4 (see DHWcalc)
+    :param weekend_weekday_factor:      int:    taken from DHWcalc
+    :param mean_drawoff_vol_per_day:    int:    function of number of people in
+                                                the house of floor area.
+    :param initial_day:                 int:    0:Mon - 1:Tues ... 6:Sun
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param run:                         int:    run number, part of the key
+    :return: timeseries_df              df:     dataframe with all timeseries
     """
 
-    # load daily probabilities (deterministic)
-    p_we = generate_daily_probability_step_function(
-        mode='weekend',
-        s_step=s_step
-    )
+    assert s_step % 60 == 0 and (24 * 3600) % s_step == 0, \
+        's_step has to be a multiple of 60 that fits into a day'
+    min_per_step = int(s_step / 60)
+    n_steps = int(365 * 24 * 3600 / s_step)
 
-    p_wd = generate_daily_probability_step_function(
-        mode='weekday',
-        s_step=s_step
-    )
+    seed_seq = get_seed_sequence(seed)
 
-    # shift towards weekend (deterministic)
-    p_wd_weighted, p_we_weighted, av_p_week_weighted = shift_weekend_weekday(
-        p_weekday=p_wd,
-        p_weekend=p_we,
-        factor=weekend_weekday_factor
+    # --- drawoff data of the 60 seconds model
+    cats_df = get_data_drawoff_categories(
+        s_step=60,
+        categories=categories,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day
     )
 
-    # yearly curve (deterministic)
-    p_final = generate_yearly_probabilities(
-        initial_day=initial_day,
-        p_weekend=p_we_weighted,
-        p_weekday=p_wd_weighted,
-        s_step=s_step
-    )
+    # --- probability of each coarse timestep from the 60 seconds profile
+    profile = generate_factorized_probability_profile(
+        s_step=60,
+        weekend_weekday_factor=weekend_weekday_factor,
+        initial_day=initial_day
+    ).resample(s_step)
 
-    # sum and normalize to range between 0 and 1.
-    p_norm_integral = normalize_and_sum_list(lst=p_final)
+    p_steps = profile.expand()
+    p_steps = p_steps / p_steps.sum()
 
-    # make timeseries dataframe and append the final list
-    date_range = pd.date_range(start='2019-01-01', end='2020-01-01',
-                               freq=str(s_step) + 'S')
-    date_range = date_range[:-1]
+    # --- for each category, draw the drawoffs and their timesteps
+    water_L = np.zeros(n_steps)
+
+    for i in range(len(cats_df)):
+        cats_series = cats_df.iloc[i]
+        rng = get_rng(seed_seq, run, i)
+        duration = int(cats_series['drawoff_duration_min'])
+
+        drawoffs = generate_drawoffs_inside_boundaries(cats_series, 60,
+                                                       rng=rng)
+        volumes = drawoffs / 60 * duration
+
+        # drawoffs are independent, so they can be assigned in order.
+        counts = rng.multinomial(len(drawoffs), p_steps)
+        steps = np.repeat(np.arange(n_steps), counts)
+        start_min = rng.integers(0, min_per_step, size=len(drawoffs))
+
+        # split the volume of each drawoff over the timesteps it touches
+        for j in range(-(-(min_per_step - 1 + duration) // min_per_step)):
+            overlap = np.minimum(start_min + duration,
+                                 (j + 1) * min_per_step) \
+                - np.maximum(start_min, j * min_per_step)
+            overlap = np.maximum(overlap, 0)
+
+            # volume reaching beyond the end of the year is dropped
+            in_year = steps + j < n_steps
+            water_L += np.bincount(
+                steps[in_year] + j,
+                weights=(volumes * overlap / duration)[in_year],
+                minlength=n_steps)
+
+    date_range = get_date_range(s_step)
 
     timeseries_df = pd.DataFrame(index=date_range,
-                                 data={'p_norm_integral': p_norm_integral})
+                                 data={'p_norm_integral': np.cumsum(p_steps)})
+    timeseries_df['Water_LperH'] = water_L * 3600 / s_step
+    timeseries_df['Water_L'] = water_L
+    timeseries_df.attrs = ProfileMeta(
+        s_step=s_step,
+        categories=categories,
+        weekend_weekday_factor=weekend_weekday_factor,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+        initial_day=initial_day,
+        method='OpenDHW (coarse)'
+    ).to_dict()
 
     return timeseries_df
 
 
-def shift_weekend_weekday(p_weekday, p_weekend, factor=1.2):
+def generate_district_profile(s_step, categories, n_dwellings=None,
+                              daily_volumes=None, mean_drawoff_vol_per_day=200,
+                              weekend_weekday_factor=1.2, initial_day=0,
+                              seed=None, n_workers=1, max_memory_mb=1024,
+                              keep_events=False):
     """
-    Shifts the probabilities between the weekday list and the weekend list by a
-    defined factor. If the factor is bigger than 1, the probability on the
-    weekend is increased. If its smaller than 1, the probability on the
-    weekend is decreased.
+    Generates the aggregated DHW profile of many dwellings, f.e. for a multi
+    family house or a district heating network. Every dwelling gets its own
+    profile with its own max flow rate, but the dwellings are only kept as
+    sparse drawoff events and are added up batch by batch, so the memory
+    does not grow with the number of dwellings.
 
-    :param p_weekday:   list:   probabilities for 1 day of the week [0...1]
-    :param p_weekend:   list:   probabilities for 1 day of the weekend [0...1]
-    :param factor:      float:  factor to shift the probabilities between
-                                weekdays and weekend-days
-    :return:
-    """
+    Dwellings with the same daily volume are generated together. Dwelling
+    number j of the volume group g uses the random streams with the key
+    (g, j, category).
 
-    p_wd_factor = 1 / (5 / 7 + factor * 2 / 7)
-    p_we_factor = 1 / (1 / factor * 5 / 7 + 2 / 7)
+    :param s_step:                      int:    timestep width in seconds.
+    :param categories:                  int:    1 or 4 (see DHWcalc)
+    :param n_dwellings:                 int:    number of dwellings with
+                                                mean_drawoff_vol_per_day
+    :param daily_volumes:               list:   daily volume of each dwelling
+                                                in L, instead of n_dwellings
+    :param mean_drawoff_vol_per_day:    int:    volume per dwelling and day
+    :param weekend_weekday_factor:      int:    taken from DHWcalc
+    :param initial_day:                 int:    0:Mon - 1:Tues ... 6:Sun
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param n_workers:                   int:    number of processes. 1 runs
+                                                in this process, None uses
+                                                all CPUs.
+    :param max_memory_mb:               int:    working memory of all workers
+    :param keep_events:                 bool:   also return the drawoff
+                                                events of all dwellings (one
+                                                run per dwelling).
+    :return: timeseries_df:             df:     aggregated timeseries
+    :return: events:                    DrawoffEvents, if keep_events
+    """
 
-    assert p_wd_factor * 5 / 7 + p_we_factor * 2 / 7 == 1
+    if daily_volumes is None:
+        assert n_dwellings is not None, \
+            'either n_dwellings or daily_volumes is needed'
+        daily_volumes = np.full(n_dwellings, mean_drawoff_vol_per_day)
+    daily_volumes = np.asarray(daily_volumes)
+    n_dwellings = len(daily_volumes)
+
+    if n_workers is None:
+        n_workers = os.cpu_count()
+
+    seed_seq = get_seed_sequence(seed)
+    n_steps = int(365 * 24 * 3600 / s_step)
+
+    # placing the drawoffs needs two float arrays per dwelling
+    runs_per_task = max(1, int(max_memory_mb / n_workers * 1e6
+                               / (2 * 8 * n_steps)))
+
+    # --- split the dwellings into groups of the same volume and batches ---
+    volumes, volume_groups = np.unique(daily_volumes, return_inverse=True)
+    tasks = []
+    for group, volume in enumerate(volumes):
+        dwellings = np.flatnonzero(volume_groups == group)
+        params = dict(s_step=s_step,
+                      categories=categories,
+                      weekend_weekday_factor=weekend_weekday_factor,
+                      mean_drawoff_vol_per_day=volume,
+                      initial_day=initial_day)
+
+        for first_run in range(0, len(dwellings), runs_per_task):
+            tasks.append((params,
+                          get_child_seed_sequence(seed_seq, group),
+                          first_run,
+                          dwellings[first_run:first_run + runs_per_task],
+                          keep_events))
+
+    # --- generate the batches and add them up ---
+    water_LperH = np.zeros(n_steps)
+    events_lst = []
+
+    if n_workers == 1:
+        results = (_generate_district_task(*task) for task in tasks)
+        for batch_LperH, batch_events in results:
+            water_LperH += batch_LperH
+            events_lst.append(batch_events)
 
-    p_wd_weighted = [p * p_we_factor for p in p_weekday]
-    p_we_weighted = [p * p_we_factor for p in p_weekend]
+    else:
+        # only a few batches are in flight, each result is added up in
+        # order and dropped, so the memory does not grow with the tasks
+        max_in_flight = 2 * n_workers
+        futures = collections.deque()
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for task in tasks:
+                futures.append(executor.submit(_generate_district_task,
+                                               *task))
+                if len(futures) < max_in_flight:
+                    continue
+                batch_LperH, batch_events = futures.popleft().result()
+                water_LperH += batch_LperH
+                events_lst.append(batch_events)
+
+            while futures:
+                batch_LperH, batch_events = futures.popleft().result()
+                water_LperH += batch_LperH
+                events_lst.append(batch_events)
+
+    date_range = get_date_range(s_step)
 
-    av_p_wd_weighted = statistics.mean(p_wd_weighted)
-    av_p_we_weighted = statistics.mean(p_we_weighted)
+    timeseries_df = pd.DataFrame(index=date_range,
+                                 data={'Water_LperH': water_LperH})
+    timeseries_df['Water_L'] = timeseries_df['Water_LperH'] / 3600 * s_step
+    timeseries_df.attrs = ProfileMeta(
+        s_step=s_step,
+        categories=categories,
+        weekend_weekday_factor=weekend_weekday_factor,
+        mean_drawoff_vol_per_day=daily_volumes.sum(),
+        initial_day=initial_day
+    ).to_dict()
+    timeseries_df.attrs['dwellings'] = n_dwellings
 
-    av_p_week_weighted = av_p_wd_weighted * 5 / 7 + av_p_we_weighted * 2 / 7
+    if keep_events:
+        events = DrawoffEvents.concatenate(events_lst, n_runs=n_dwellings)
+        return timeseries_df, events.sort()
 
-    return p_wd_weighted, p_we_weighted, av_p_week_weighted
+    return timeseries_df
 
 
-def generate_yearly_probabilities(initial_day, p_weekend, p_weekday,
-                                  s_step, plot_p_yearly=False):
+def _generate_district_task(params, seed_seq, first_run, dwellings,
+                            keep_events):
+    """
+    Generates one batch of dwellings for 'generate_district_profile'.
+    Returns their summed flow rates and, if keep_events, their events with
+    the dwelling numbers as runs.
     """
-    Takes the probabilities of a weekday and a weekendday and generates a
-    list of yearly probabilities by adding a seasonal probability factor.
-    The seasonal factor is a sine-function, like in DHWcalc.
 
-    :param initial_day:     int:    0: Mon, 1: Tue, 2: Wed, 3: Thur, 4: Fri,
-                                    5 : Sat, 6 : Sun
-    :param p_weekend:       list:   probabilities of a weekend day
-    :param p_weekday:       list:   probabilities of a weekday
-    :param s_step:          int:    seconds within a timestep
-    :param plot_p_yearly:   bool:   plot the yearly probabilities
+    events = generate_dhw_profiles(
+        n_runs=len(dwellings),
+        seed=seed_seq,
+        first_run=first_run,
+        return_events=True,
+        **params
+    )
 
-    :return: p_final:       list:   probabilities of a full year
-    """
+    water_LperH = events.to_dense(sum_runs=True)
 
-    p_final = []
-    timesteps_day = int(24 * 3600 / s_step)
+    if not keep_events:
+        return water_LperH, None
 
-    for day in range(365):
+    events.run = dwellings[events.run].astype(np.int32)
+    return water_LperH, events
 
-        # Is the current day on a weekend?
-        if (day + initial_day) % 7 >= 5:
-            p_day = p_weekend
-        else:
-            p_day = p_weekday
 
-        # Compute seasonal factor
-        arg = math.pi * (2 / 365 * day - 1 / 4)
-        probability_season = 1 + 0.1 * np.cos(arg)
+def generate_yearly_probability_profile(s_step, weekend_weekday_factor=1.2,
+                                        initial_day=0):
+    """
+    generate a summed yearly probability profile. The whole function is
+    deterministic. The same inputs always produce the same outputs.
+
+    1)  Probabilities for weekdays and weekend-days are loaded (p_we, p_wd).
+    2)  Probability of weekend-days is increased relative to weekdays (shift).
+    3)  Based on an initial day, the yearly probability distribution (p_final)
+        is generated. The seasonal influence is modelled by a sine-function.
+    4)  p_final is normalized and integrated. The sum over the year is thus
+        equal to 1 (p_norm_integral).
 
-        for step in range(timesteps_day):
-            probability = p_day[step] * probability_season
-            p_final.append(probability)
+    The profile is cached (see 'clear_cache'), only the dataframe is new.
 
-    if plot_p_yearly:
-        fig, ax = plt.subplots()
-        plt.plot(p_final)
-        plt.show()
-        dir_output = Path.cwd() / "plots"
-        dir_output.mkdir(exist_ok=True)
-        fname = "Yearly_Probability_Profile_{}initalday_{}S".format(
-            initial_day, s_step)
-        fig.savefig(dir_output / (fname + '.pdf'))
-        fig.savefig(dir_output / (fname + '.svg'))
-        fig.savefig(dir_output / (fname + '.png'))
+    :param s_step:                  int:    seconds in a timestep
+    :param weekend_weekday_factor:  float:  shift probabilities towards weekend
+    :param initial_day:             int:    Mon: 0 ... Sun: 6
+    :return: timeseries_df:         df:     df that holds the yearly profile
+    """
 
-    return p_final
+    p_norm_integral = get_p_norm_integral(
+        s_step=s_step,
+        weekend_weekday_factor=weekend_weekday_factor,
+        initial_day=initial_day
+    )
 
+    # make timeseries dataframe and append the final list
+    timeseries_df = pd.DataFrame(index=get_date_range(s_step),
+                                 data={'p_norm_integral': p_norm_integral})
 
-def normalize_and_sum_list(lst, save_fig=False):
+    return timeseries_df
+
+
+@functools.lru_cache(maxsize=cache_size_profiles)
+def get_date_range(s_step):
     """
-    takes a list and normalizes it based on the sum of all list elements.
-    then generates a new list based on the current sum of each list entry.
+    Returns the index of a year (2019) with a timestep of s_step. The index
+    is cached, pandas indices can not be changed in place.
 
-    :param lst:                 list:   input list
-    :param save_fig:            bool:   plot the output list
-    :return: lst_norm_integral: list    output list
+    :param s_step:          int:            seconds in a timestep
+    :return: date_range:    DatetimeIndex
     """
 
-    sum_lst = sum(lst)
-    lst_norm = [float(i) / sum_lst for i in lst]
+    date_range = pd.date_range(start='2019-01-01', end='2020-01-01',
+                               freq=str(s_step) + 'S')
+    date_range = date_range[:-1]
 
-    current_sum = 0
-    lst_norm_integral = []
+    return date_range
 
-    for entry in lst_norm:
-        current_sum += entry
-        lst_norm_integral.append(current_sum)
 
-    if save_fig:
-        fig, ax = plt.subplots()
-        plt.plot(lst_norm_integral)
-        plt.show()
-        dir_output = Path.cwd() / "plots"
-        dir_output.mkdir(exist_ok=True)
-        fname = "Normed_and_summed_probability_profile"
-        fig.savefig(dir_output / (fname + '.pdf'))
-        fig.savefig(dir_output / (fname + '.svg'))
-        fig.savefig(dir_output / (fname + '.png'))
+def clear_cache():
+    """
+    Empties the caches of the deterministic parts of the generation: the
+    probability profiles, the category tables and the date ranges. Also
+    the cached flow rate distributions of the plots.
+    """
 
-    return lst_norm_integral
+    core.clear_cache()
+    distributions.clear_cache()
+    get_date_range.cache_clear()
 
 
-def generate_and_distribute_drawoffs(timeseries_df, cats_series):
+def generate_and_distribute_drawoffs(timeseries_df, cats_series, rng=None):
     """
     generate and distribute drawoffs
 
     :param      timeseries_df:          df:     holds the timeseries
     :param      cats_series:            series: constants for a category
+    :param      rng:                    rng:    Generator or seed
     """
 
+    rng = np.random.default_rng(rng)
+
     # --- compute how many timesteps the drawoff occupies. some take more than 1
-    s_step = int(timeseries_df.index.freqstr[:-1])
+    s_step = get_s_step(timeseries_df)
     drawoff_duration = cats_series['drawoff_duration_min'] * 60
     drawoff_steps = int(drawoff_duration / s_step)
 
     # --- generate drawoffs until V_max is reached ---
-    V_curr = 0
-    V_max = cats_series['mean_vol_per_year']
-    drawoffs = []  # L/h
-
-    while V_curr <= V_max:
-        drawoff = generate_single_drawoff_inside_boundaries(cats_series, s_step)
-        drawoffs.append(drawoff)
-
-        drawoff_L = drawoff / 3600 * s_step * drawoff_steps
-        V_curr += drawoff_L
+    drawoffs = generate_drawoffs_inside_boundaries(cats_series, s_step,
+                                                   rng=rng)
 
     # --- generate a probability for each drawoff ---
-    p_norm_integral = list(timeseries_df['p_norm_integral'])
-    min_rand = min(p_norm_integral)
-    max_rand = max(p_norm_integral)
-    p_drawoffs = [random.uniform(min_rand, max_rand) for _ in range(
-        len(drawoffs))]
-
-    # --- sort both lists for the distribution algorithm ---
-    p_drawoffs.sort()
-    p_norm_integral.sort()
+    p_norm_integral = timeseries_df['p_norm_integral'].to_numpy()
+    min_rand = p_norm_integral.min()
+    max_rand = p_norm_integral.max()
+    p_drawoffs = rng.uniform(min_rand, max_rand, size=len(drawoffs))
 
     # --- distribute drawoffs ---
-    water_LperH_cat = [0] * int(365 * 24 * 3600 / s_step)
-    water_LperH = list(timeseries_df['Water_LperH'])
-    max_flow_rate = cats_series['max_flow_rate_per_drawoff_LperH']
-
-    # counter for the drawoffs
-    drawoff_count = 0
-
-    # loop p_norm_integral and place drawoffs:
-    for time_step, p_current_sum in enumerate(p_norm_integral):
-
-        # dont place drawoff if timestep has already reached the max flowrate
-        if water_LperH[time_step] >= max_flow_rate:
-            continue
-
-        # if all drawoffs are palced, break the loop.
-        if drawoff_count >= len(drawoffs):
-            break
-
-        # if the looping of p_norm_integral results in surpassing the
-        # probability of the chosen drawoff, that drawoff might be placed at
-        # that timestep!
-        while p_drawoffs[drawoff_count] < p_current_sum:
-
-            # if the drawoff event occupies more than one timestep,
-            # a list (drawoffs_time_step_delta) is placed, rather than a
-            # single number.
-            drawoff = drawoffs[drawoff_count]
-            drawoffs_time_step_delta = [drawoff] * drawoff_steps
-
-            # boolean, to count the drawoff events, but not the timesteps
-            # occupied by all drawoffs. this is needed when the drawoff
-            # event occupies more than one timestep.
-            drawoff_occured = True
-
-            for i in range(drawoff_steps):
-
-                # if the added drawoff surpasses the max flowrate in any of
-                # the possible timesteps it would occupy, it should not occur!
-                if water_LperH[time_step + i] + \
-                        drawoffs_time_step_delta[i] > max_flow_rate:
-                    drawoff_occured = False
-                    break
-
-            if drawoff_occured:
-                for i in range(drawoff_steps):
-                    # if the added drawoff would not surpass the max
-                    # flowrate, add it to both return lists! for the
-                    # category, and for the whole list.
-                    water_LperH[time_step + i] \
-                        += drawoffs_time_step_delta[i]
-                    water_LperH_cat[time_step + i] \
-                        += drawoffs_time_step_delta[i]
-
-                drawoff_count += 1
-
-            else:
-                break  # break the while loop.
-
-            if drawoff_count >= len(drawoffs):
-                break
+    water_LperH, water_LperH_cat = place_drawoffs(
+        p_norm_integral=p_norm_integral,
+        p_drawoffs=p_drawoffs,
+        drawoffs=drawoffs,
+        drawoff_steps=drawoff_steps,
+        max_flow_rate=cats_series['max_flow_rate_per_drawoff_LperH'],
+        water_LperH=timeseries_df['Water_LperH'].to_numpy()
+    )
 
     # update the sum of all categories
     timeseries_df['Water_LperH'] = water_LperH
@@ -606,45 +954,6 @@ def generate_and_distribute_drawoffs(timeseries_df, cats_series):
     return timeseries_df
 
 
-def generate_single_drawoff_inside_boundaries(cats_series, s_step):
-    """
-    From the data of one category, generate a drawoff inside the defined
-    boundaries, similar to DHWcalc.
-
-    :param cats_series: df:     pandas series that holds the drawoff data
-    :param s_step:      int:    seconds in a timestep
-    :return: drawoff:   int:    drawoff eevnt in L/h
-    """
-
-    # --- get mean and stddev from series ---
-    mu = cats_series['mean_flow_rate_per_drawoff_LperH']  # in L/h
-    sig = cats_series['stddev_flow_rate_per_drawoff_LperH']  # in L/h
-
-    # --- generate drawoff
-    drawoff = random.gauss(mu, sig)
-
-    # --- get min and max allowed flowrate
-    max_drawoff_flow_rate = cats_series['max_flow_rate_per_drawoff_LperH']
-    min_drawoff_flow_rate = cats_series['min_flow_rate_per_drawoff_LperH']
-
-    # --- set boundaries for drawoff
-    low_lim = max(float(mu - 2 * sig), min_drawoff_flow_rate)
-    up_lim = min(float(mu + 2 * sig), max_drawoff_flow_rate)
-
-    # --- if drawoff is outside boundaries, generate it again until its inside.
-    while drawoff < low_lim or drawoff > up_lim:
-        drawoff = random.gauss(mu, sig)
-
-    # --- DHWcalc uses a fixed flow rate step width rather than floats.
-    if s_step == 60:
-        flow_rate_step = 6
-    else:
-        flow_rate_step = 1
-    drawoff = flow_rate_step * round(drawoff / flow_rate_step)
-
-    return drawoff  # in L/h
-
-
 def compute_heat(timeseries_df, temp_dT=35):
     """
     Add heat columns to the timeseries
@@ -657,17 +966,64 @@ def compute_heat(timeseries_df, temp_dT=35):
     :return: timeseries_df: df:     Dataframe with added 'Heat' Column
     """
 
-    timeseries_df['Heat_W'] = \
-        timeseries_df['Water_LperH'] / 3600 * rho * cp * temp_dT
+    timeseries_df['Heat_W'] = compute_heat_profiles(
+        timeseries_df['Water_LperH'].to_numpy(), temp_dT=temp_dT)
     timeseries_df['Heat_kW'] = timeseries_df['Heat_W'] / 1000
 
-    s_step = int(timeseries_df.index.freqstr[:-1])
+    s_step = get_s_step(timeseries_df)
     timeseries_df['Heat_J'] = timeseries_df['Heat_W'] * s_step
     timeseries_df['Heat_kWh'] = timeseries_df['Heat_J'] / (3600 * 1000)
 
     return timeseries_df
 
 
+def get_profile_stats(water_LperH, s_step, max_block_mb=256):
+    """
+    Computes the stats that are shown in the plot titles for each run of a
+    2-D flow rate array, like the one from 'generate_dhw_profiles'.
+
+    :param water_LperH:     array:  flow rates in L/h, one row per run
+    :param s_step:          int:    seconds in a timestep
+    :param max_block_mb:    int:    memory used for the temporary arrays
+    :return: stats_df:      df:     one row with stats per run
+    """
+
+    water_LperH = np.atleast_2d(water_LperH)
+    n_runs, n_steps = water_LperH.shape
+
+    sum_flows = np.zeros(n_runs)
+    sum_squares = np.zeros(n_runs)
+    no_drawoffs = np.zeros(n_runs, dtype=int)
+    peaks = np.zeros(n_runs)
+
+    block_runs = max(1, int(max_block_mb * 1e6 / (8 * n_steps)))
+
+    for first_run in range(0, n_runs, block_runs):
+        block = water_LperH[first_run:first_run + block_runs].astype(float)
+        runs = slice(first_run, first_run + len(block))
+
+        sum_flows[runs] = block.sum(axis=1)
+        sum_squares[runs] = np.square(block).sum(axis=1)
+        no_drawoffs[runs] = np.count_nonzero(block, axis=1)
+        peaks[runs] = block.max(axis=1)
+
+    # mean and sample standard deviation of the non-zero flow rates
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_flows = sum_flows / no_drawoffs
+        var_flows = (sum_squares - no_drawoffs * mean_flows ** 2) \
+            / (no_drawoffs - 1)
+
+    stats_df = pd.DataFrame({
+        'yearly_water_demand_L': sum_flows / 3600 * s_step,
+        'no_drawoffs': no_drawoffs,
+        'peak_flow_rate_LperH': peaks,
+        'mean_flow_rate_LperH': mean_flows,
+        'sdtdev_flow_rate_LperH': np.sqrt(np.maximum(var_flows, 0)),
+    })
+
+    return stats_df
+
+
 def draw_lineplot(timeseries_df, plot_var='water', start_plot='2019-02-01',
                   end_plot='2019-02-05', save_fig=False):
     """
@@ -685,7 +1041,9 @@ def draw_lineplot(timeseries_df, plot_var='water', start_plot='2019-02-01',
 
     if plot_var == 'water':
         # make subset of dataframe for plotting
-        plot_df = timeseries_df[['Water_LperH', 'mean_drawoff_vol_per_day']]
+        plot_df = timeseries_df[['Water_LperH']].assign(
+            mean_drawoff_vol_per_day=get_meta(timeseries_df,
+                                              'mean_drawoff_vol_per_day'))
 
         ax1 = sns.lineplot(ax=ax1, data=plot_df[start_plot:end_plot],
                            linewidth=1.0, palette=[rwth_blue, rwth_red])
@@ -707,8 +1065,8 @@ def draw_lineplot(timeseries_df, plot_var='water', start_plot='2019-02-01',
         # compute some stats for figure title.
         # todo: add to make_title_str function for Heat plots.
         max_water_flow = timeseries_df['Water_LperH'].max()  # in L/h
-        s_step = timeseries_df.index.freqstr
-        method = timeseries_df['method'][0]
+        s_step = get_s_step(timeseries_df)
+        method = get_meta(timeseries_df, 'method')
 
         plt.title('Heat Time-series from {}, timestep = {}\n'
                   'with a Peak of {:.1f} L/h'.format(method, s_step,
@@ -724,10 +1082,10 @@ def draw_lineplot(timeseries_df, plot_var='water', start_plot='2019-02-01',
     plt.show()
 
     if save_fig:
-        method = timeseries_df['method'][0]
+        method = get_meta(timeseries_df, 'method')
         s_step = get_s_step(timeseries_df)
-        vol_per_day = timeseries_df['mean_drawoff_vol_per_day'][0]
-        cats = timeseries_df['categories'][0]
+        vol_per_day = get_meta(timeseries_df, 'mean_drawoff_vol_per_day')
+        cats = get_meta(timeseries_df, 'categories')
 
         dir_output = Path.cwd() / "plots"
         dir_output.mkdir(exist_ok=True)
@@ -739,7 +1097,8 @@ def draw_lineplot(timeseries_df, plot_var='water', start_plot='2019-02-01',
         fig.savefig(dir_output / (fname + '.png'))
 
 
-def draw_histplot(timeseries_df, extra_kde=False, save_fig=False):
+def draw_histplot(timeseries_df, extra_kde=False, save_fig=False,
+                  drawoffs=None):
     """
     Takes a DHW profile and plots a histogram with some stats in the title
 
@@ -747,26 +1106,29 @@ def draw_histplot(timeseries_df, extra_kde=False, save_fig=False):
     :param timeseries_df:   df:     Dataframe that holds the water timeseries
     :param extra_kde:       bool:   plot a detailed kde plot behind the main
                                     histogram.
+    :param drawoffs:        dict:   drawoffs from 'get_drawoffs' with
+                                    remove_cats=False. Default: taken from
+                                    timeseries_df.
     """
 
     # get non-zero values of the profile
-    drawoffs_df = get_drawoffs(timeseries_df=timeseries_df, remove_cats=False)
+    if drawoffs is None:
+        drawoffs = get_drawoffs(timeseries_df=timeseries_df,
+                                remove_cats=False)
 
-    cats = timeseries_df['categories'][0]
+    cats = get_meta(timeseries_df, 'categories')
     if cats == 1:
-        drawoffs_df = drawoffs_df['Water_LperH']
+        drawoffs = drawoffs['Water_LperH']
 
     fig, ax1 = plt.subplots()
     ax2 = ax1.twinx()
 
-    # https://seaborn.pydata.org/generated/seaborn.histplot.html
-    sns.histplot(data=drawoffs_df, ax=ax2, stat='count', kde=True,
-                 kde_kws={'bw_adjust': 1})
+    draw_distribution(drawoffs, ax=ax2, stat='count', kde=True,
+                      bw_adjust=1)
 
     if extra_kde:
-        # https://seaborn.pydata.org/generated/seaborn.kdeplot.html
-        sns.kdeplot(data=drawoffs_df, ax=ax1, alpha=.05, bw_adjust=0.05,
-                    legend=False, color='r')
+        draw_distribution(drawoffs, ax=ax1, hist=False, stat='density',
+                          bw_adjust=0.05, alpha=.05, legend=False, color='r')
 
     # title
     title_str = make_title_str(timeseries_df=timeseries_df)
@@ -775,10 +1137,10 @@ def draw_histplot(timeseries_df, extra_kde=False, save_fig=False):
     plt.show()
 
     if save_fig:
-        method = timeseries_df['method'][0]
+        method = get_meta(timeseries_df, 'method')
         s_step = get_s_step(timeseries_df)
-        vol_per_day = timeseries_df['mean_drawoff_vol_per_day'][0]
-        cats = timeseries_df['categories'][0]
+        vol_per_day = get_meta(timeseries_df, 'mean_drawoff_vol_per_day')
+        cats = get_meta(timeseries_df, 'categories')
 
         dir_output = Path.cwd() / "plots"
         dir_output.mkdir(exist_ok=True)
@@ -795,14 +1157,14 @@ def draw_detailed_histplot(timeseries_df):
     https://towardsdatascience.com/advanced-histogram-using-python-bceae288e715
     plot to further analyse timeseries with 1 drawoff category.
     """
-    cats = timeseries_df['categories'][0]
-    method = timeseries_df['method'][0]
+    cats = get_meta(timeseries_df, 'categories')
+    method = get_meta(timeseries_df, 'method')
 
     if cats == 1 and method == 'DHWcalc':
 
         # create bin values
-        mean = timeseries_df['mean_drawoff_flow_rate_LperH'][0]
-        sdtdev = timeseries_df['sdtdev_drawoff_flow_rate_LperH'][0]
+        mean = get_meta(timeseries_df, 'mean_drawoff_flow_rate_LperH')
+        sdtdev = get_meta(timeseries_df, 'sdtdev_drawoff_flow_rate_LperH')
         non_zero_min = timeseries_df[timeseries_df['Water_LperH'] > 0][
             'Water_LperH'].min()  # smallest entry that is not 0.
 
@@ -857,38 +1219,85 @@ def draw_detailed_histplot(timeseries_df):
               'with one drawoff category.')
 
 
-def add_additional_runs(timeseries_df, total_runs=5, dir_output=None):
+def add_additional_runs(timeseries_df, total_runs=5, dir_output=None,
+                        parallel=False, n_workers=None, max_memory_mb=1024,
+                        seed=None):
     """
     method to add more runs to a timeseries dataframe with the same input
     parameters as the original timeseries.
 
-    :param timeseries_df:
-    :param total_runs:
-    :param dir_output:
-    :return:
+    :param timeseries_df:   df:     timeseries with the first run
+    :param total_runs:      int:    number of runs including the first one
+    :param dir_output:      Path:   save the dataframe as csv if given
+    :param parallel:        bool:   generate the runs in a process pool
+    :param n_workers:       int:    number of processes (parallel only)
+    :param max_memory_mb:   int:    working memory of all workers
+                                    (parallel only)
+    :param seed:            int:    seed of the original timeseries. The
+                                    added runs continue with run 1, 2, ...
+    :return: timeseries_df: df:     timeseries with added runs
     """
     added_runs = total_runs - 1
 
-    s_step = int(timeseries_df.index.freqstr[:-1])
-    mean_drawoff_vol_per_day = timeseries_df['mean_drawoff_vol_per_day'][0]
-    weekend_weekday_factor = timeseries_df['weekend_weekday_factor'][0]
-    initial_day = timeseries_df['initial_day'][0]
-    method = timeseries_df['method'][0]
-    categories = timeseries_df['categories'][0]
+    s_step = get_s_step(timeseries_df)
+    meta = get_meta(timeseries_df)
+    mean_drawoff_vol_per_day = meta['mean_drawoff_vol_per_day']
+    weekend_weekday_factor = meta['weekend_weekday_factor']
+    initial_day = meta['initial_day']
+    method = meta['method']
+    categories = meta['categories']
 
     if method == 'OpenDHW':
 
-        for run in range(added_runs):
-            extra_timeseries_df = generate_dhw_profile(
+        if parallel:
+            water_LperH = generate_dhw_profiles_parallel(
+                n_runs=added_runs,
+                s_step=s_step,
+                categories=categories,
+                weekend_weekday_factor=weekend_weekday_factor,
+                mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+                initial_day=initial_day,
+                n_workers=n_workers,
+                max_memory_mb=max_memory_mb,
+                seed=seed,
+                first_run=1
+            )
+
+        else:
+            water_LperH = generate_dhw_profiles(
+                n_runs=added_runs,
                 s_step=s_step,
                 categories=categories,
                 weekend_weekday_factor=weekend_weekday_factor,
                 mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
-                initial_day=initial_day
+                initial_day=initial_day,
+                seed=seed,
+                first_run=1
             )
 
-            additional_profile = extra_timeseries_df['Water_LperH']
-            timeseries_df['Water_LperH_' + str(run)] = additional_profile
+        # add all runs at once instead of widening the dataframe run by run
+        cols = ['Water_LperH_' + str(run) for run in range(added_runs)]
+        runs_df = pd.DataFrame(water_LperH.T, index=timeseries_df.index,
+                               columns=cols)
+        timeseries_df = pd.concat([timeseries_df, runs_df], axis=1)
+        timeseries_df.attrs = meta
+
+    elif method == 'OpenDHW (coarse)':
+
+        runs_df = pd.DataFrame(index=timeseries_df.index)
+        for run in range(1, total_runs):
+            runs_df['Water_LperH_' + str(run - 1)] = \
+                generate_coarse_dhw_profile(
+                    s_step=s_step,
+                    categories=categories,
+                    weekend_weekday_factor=weekend_weekday_factor,
+                    mean_drawoff_vol_per_day=mean_drawoff_vol_per_day,
+                    initial_day=initial_day,
+                    seed=seed,
+                    run=run
+                )['Water_LperH']
+        timeseries_df = pd.concat([timeseries_df, runs_df], axis=1)
+        timeseries_df.attrs = meta
 
     elif method == 'DHWcalc':
 
@@ -903,53 +1312,130 @@ def add_additional_runs(timeseries_df, total_runs=5, dir_output=None):
         # make a directory. if it already exists, no problem, just use it
         dir_output.mkdir(exist_ok=True)
 
-        # save the dataframe in the folder as a csv with the chosen name
-        timeseries_df.to_csv(dir_output / save_name)
+        # save the dataframe in the folder as a csv with the chosen name.
+        # df.attrs are not written to a csv, so the metadata goes into
+        # constant columns, where 'get_meta' finds it after loading.
+        add_meta_cols(timeseries_df).to_csv(dir_output / save_name)
 
     return timeseries_df
 
 
 def get_drawoffs(timeseries_df, remove_cats=True):
     """
-    get sorted drawoff events from a timeseries Dataframe.
+    get sorted drawoff events from a timeseries Dataframe. Only the non-zero
+    values of each 'Water_LperH' column are taken, so the columns have
+    different lengths.
+
+    :param timeseries_df:   df:     Dataframe that holds the water timeseries
+    :param remove_cats:     bool:   leave out the columns of the categories
+    :return: drawoffs:      dict:   sorted non-zero flow rates of each column
     """
 
-    # only columns that contain 'Water_LperH'
-    cols_bool_str = timeseries_df.columns.str.contains('Water_LperH')
-    water_LperH_df = timeseries_df.loc[:, cols_bool_str]
+    drawoffs = {}
 
-    if remove_cats:
-        # not columns that contain 'cat'
-        cols_bool_str2 = water_LperH_df.columns.str.contains('cat')
-        cols_bool_str2 = [not i for i in cols_bool_str2]
-        water_LperH_df = water_LperH_df.loc[:, cols_bool_str2]
+    for col_name in timeseries_df.columns:
+        if 'Water_LperH' not in col_name:
+            continue
+        if remove_cats and 'cat' in col_name:
+            continue
 
-    drawoffs_df = water_LperH_df.reset_index(drop=True)
+        water_LperH = timeseries_df[col_name].to_numpy()
+        drawoffs[col_name] = np.sort(water_LperH[water_LperH != 0])
 
-    for col_name in drawoffs_df.columns:
-        #  From each column, get only values != 0.
-        drawoffs_series = water_LperH_df[water_LperH_df[col_name] != 0][
-            col_name]
-        drawoffs_lst = list(drawoffs_series)
+    return drawoffs
 
-        #  fill zero-values with NaN's
-        empty_cells_len = len(timeseries_df) - len(drawoffs_lst)
-        empty_cells_lst = [np.nan] * empty_cells_len
-        drawoffs_lst.extend(empty_cells_lst)
-        drawoffs_lst.sort()
 
-        # append to the drawoff dataframe
-        drawoffs_df[col_name] = drawoffs_lst
+def draw_distribution(drawoffs, ax=None, hist=True, kde=True, bw_adjust=1,
+                      stat='count', element='bars', fill=True, bin_width=None,
+                      color=None, alpha=None, linewidth=None, legend=True):
+    """
+    draws histograms and KDEs of drawoffs. They are read from the cached
+    distributions (see 'get_flow_distribution'), so the drawoffs are only
+    binned once per profile, no matter how often they are plotted. All
+    entries of a dict share the same bins and are normalized together.
+
+    :param drawoffs:    dict:   drawoffs from 'get_drawoffs', or one array
+    :param ax:          ax:     default: current axes
+    :param hist:        bool:   draw the histogram
+    :param kde:         bool:   draw the KDE
+    :param bw_adjust:   float:  factor on the bandwidth of the KDE
+    :param stat:        str:    'count' or 'density'
+    :param element:     str:    'bars' or 'step'
+    :param fill:        bool:   fill the histogram
+    :param bin_width:   int:    in L/h, default: the default bin width of
+                                the entry with the most drawoffs
+    :param color:       str:    one color for all entries, default: the
+                                seaborn palette
+    :param alpha:       float:  transparency of the lines and bars
+    :param linewidth:   float:  width of the lines
+    :param legend:      bool:   label the entries of a dict
+    :return: ax:        ax
+    """
 
-    # Drop rows that have only NaN's as values
-    drawoffs_df = drawoffs_df.dropna(how='all')
+    if ax is None:
+        ax = plt.gca()
 
-    return drawoffs_df
+    if not isinstance(drawoffs, dict):
+        drawoffs = {None: drawoffs}
+
+    dists = {name: get_flow_distribution(values)
+             for name, values in drawoffs.items()}
+    dists = {name: dist for name, dist in dists.items() if dist.n}
+    if not dists:
+        return ax
+
+    n_total = sum(dist.n for dist in dists.values())
+    if bin_width is None:
+        bin_width = max(dists.values(), key=lambda dist: dist.n).bin_width
+    start = min(dist.offset for dist in dists.values())
+    stop = max(dist.offset + len(dist.counts) for dist in dists.values())
+
+    if color is None:
+        colors = sns.color_palette(n_colors=len(dists))
+    else:
+        colors = [color] * len(dists)
+
+    for (name, dist), color in zip(dists.items(), colors):
+        label = name if legend else None
+
+        # histograms are in counts per bin, KDEs in probability per L/h
+        if stat == 'count':
+            hist_scale = 1
+            kde_scale = dist.n * bin_width
+        else:
+            hist_scale = 1 / (n_total * bin_width)
+            kde_scale = dist.n / n_total
+
+        if hist:
+            edges, counts = dist.get_histogram(bin_width, start, stop)
+            if element == 'bars':
+                ax.bar(edges[:-1], counts * hist_scale, width=bin_width,
+                       align='edge', color=color, edgecolor=color,
+                       alpha=0.75 if alpha is None else alpha, fill=fill,
+                       label=label)
+            else:
+                ax.stairs(counts * hist_scale, edges, color=color,
+                          alpha=alpha, linewidth=linewidth, fill=fill,
+                          label=label)
+            label = None
+
+        if kde:
+            flows, density = dist.get_kde(bw_adjust)
+            ax.plot(flows, density * kde_scale, color=color, alpha=alpha,
+                    linewidth=linewidth, label=label)
+
+    ax.set_xlabel('Flowrate [L/h]')
+    ax.set_ylabel(stat.capitalize())
+
+    if legend and len(dists) > 1:
+        ax.legend()
+
+    return ax
 
 
 def plot_multiple_runs(timeseries_df, plot_demands_overlay=True,
                        start_plot='2019-02-01', end_plot='2019-02-02',
-                       plot_hist=True, plot_kde=True):
+                       plot_hist=True, plot_kde=True, drawoffs=None):
     """
     This function should only be used when the 'add_additional_runs' function
     has been used before.
@@ -960,9 +1446,12 @@ def plot_multiple_runs(timeseries_df, plot_demands_overlay=True,
     :param end_plot:                str:    end date
     :param plot_hist:               bool:   plot histogram
     :param plot_kde:                bool:   plot kde plot
+    :param drawoffs:                dict:   drawoffs from 'get_drawoffs'.
+                                            Default: taken from timeseries_df
     """
 
-    drawoffs_df = get_drawoffs(timeseries_df=timeseries_df)
+    if drawoffs is None:
+        drawoffs = get_drawoffs(timeseries_df=timeseries_df)
 
     if plot_demands_overlay:
         fig, ax1 = plt.subplots()
@@ -990,8 +1479,8 @@ def plot_multiple_runs(timeseries_df, plot_demands_overlay=True,
         plt.show()
 
     if plot_hist:
-        sns.histplot(data=drawoffs_df, kde=False, element="step", fill=False,
-                     stat='count', line_kws={'alpha': 0.8, 'linewidth': 0.9})
+        draw_distribution(drawoffs, kde=False, element='step', fill=False,
+                          stat='count')
 
         title_str = make_title_str(timeseries_df)
         plt.title(title_str)
@@ -999,8 +1488,8 @@ def plot_multiple_runs(timeseries_df, plot_demands_overlay=True,
         plt.show()
 
     if plot_kde:
-        sns.kdeplot(data=drawoffs_df, bw_adjust=0.1, alpha=0.5, fill=False,
-                    linewidth=0.5, legend=True)
+        draw_distribution(drawoffs, hist=False, stat='density',
+                          bw_adjust=0.1, alpha=0.5, linewidth=0.5)
 
         title_str = make_title_str(timeseries_df)
         plt.title(title_str)
@@ -1011,7 +1500,7 @@ def plot_multiple_runs(timeseries_df, plot_demands_overlay=True,
 def plot_multiple_timeseries(timeseries_lst, col_part='Water_LperH',
                              plot_demands_overlay=True,
                              start_plot='2019-02-01', end_plot='2019-02-02',
-                             plot_hist=True, plot_kde=True):
+                             plot_hist=True, plot_kde=True, drawoffs=None):
     """
     plots multiple timeseries given in a list. better than "plot multiple runs?"
 
@@ -1023,6 +1512,10 @@ def plot_multiple_timeseries(timeseries_lst, col_part='Water_LperH',
     :param end_plot:                str:    end of lineplot
     :param plot_hist:               bool:   plot histogram
     :param plot_kde:                bool:   plot kde plot
+    :param drawoffs:                dict:   drawoffs to plot, f.e. from
+                                            'get_drawoffs'. Default: taken
+                                            from the timeseries, keyed by
+                                            their position in the list.
     :return:
     """
 
@@ -1041,7 +1534,12 @@ def plot_multiple_timeseries(timeseries_lst, col_part='Water_LperH',
         # fill the plot dataframe with the matching column
         plot_df[i] = df[cols_LperH]
 
-    drawoffs_df = get_drawoffs(timeseries_df=plot_df)
+    if drawoffs is None:
+        # the columns of plot_df are numbered, so not via 'get_drawoffs'
+        drawoffs = {}
+        for col_name in plot_df.columns:
+            values = plot_df[col_name].to_numpy()
+            drawoffs[col_name] = np.sort(values[values != 0])
 
     if plot_demands_overlay:
         fig, ax1 = plt.subplots()
@@ -1060,24 +1558,31 @@ def plot_multiple_timeseries(timeseries_lst, col_part='Water_LperH',
         plt.show()
 
     if plot_hist:
-        sns.histplot(data=drawoffs_df, kde=True, element="step", fill=False,
-                     stat='count', line_kws={'alpha': 0.8, 'linewidth': 0.9})
+        draw_distribution(drawoffs, element='step', fill=False,
+                          stat='count', alpha=0.8, linewidth=0.9)
         plt.show()
 
     if plot_kde:
-        sns.kdeplot(data=drawoffs_df, bw_adjust=0.1, alpha=0.5, fill=False,
-                    linewidth=0.5, legend=True)
+        draw_distribution(drawoffs, hist=False, stat='density',
+                          bw_adjust=0.1, alpha=0.5, linewidth=0.5)
         plt.show()
 
 
 def compare_generators(timeseries_df_1, timeseries_df_2,
                        start_plot='2019-03-01', end_plot='2019-03-08',
                        plot_date_slice=True, plot_distribution=True,
-                       plot_detailed_distribution=True, save_fig=False):
+                       plot_detailed_distribution=True,
+                       distance_method='timeseries', save_fig=False):
     """
     Compares two timeseries by plotting them next to each other with the same
     x and y axis limits.
 
+    The Jensen Shannon Distance in the titles of the histplots is either
+    computed on the two timeseries step by step ('timeseries') or on the
+    flow rate distributions of their drawoffs ('distribution', see
+    'get_distribution_distance'), which does not depend on when the drawoffs
+    happen.
+
     :param timeseries_df_1:             df:     first timeseries dataframe
     :param timeseries_df_2:             df:     second timeseries dataframe
     :param start_plot:                  str:    date, f.e. 2019-03-01
@@ -1085,11 +1590,12 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
     :param plot_date_slice:             bool:   plot lineplots
     :param plot_distribution:           bool:   plot histplots
     :param plot_detailed_distribution:  bool:    plot detailed histplots
+    :param distance_method:             str:    'timeseries' or 'distribution'
     :param save_fig:                    bool:   save the plot
     """
 
-    cats_1 = timeseries_df_1['categories'][0]
-    cats_2 = timeseries_df_2['categories'][0]
+    cats_1 = get_meta(timeseries_df_1, 'categories')
+    cats_2 = get_meta(timeseries_df_2, 'categories')
     if cats_1 or cats_2 == 1:
         print("detailed distribution is designed to compare timeseries with "
               "one drawoff category")
@@ -1102,11 +1608,27 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
     drawoffs_2 = timeseries_df_2[timeseries_df_2['Water_LperH'] != 0][
         'Water_LperH']
 
+    # compute Jensen Shannon Distance
+    if distance_method == 'timeseries':
+        distance = jensen_shannon_distance(q=timeseries_df_1['Water_LperH'],
+                                           p=timeseries_df_2['Water_LperH'])
+    elif distance_method == 'distribution':
+        distance = get_distribution_distance(
+            get_flow_distribution(timeseries_df_1['Water_LperH'].values),
+            get_flow_distribution(timeseries_df_2['Water_LperH'].values))
+    else:
+        raise Exception("Unknown distance_method '{}', use 'timeseries' or "
+                        "'distribution'".format(distance_method))
+
     if plot_date_slice:
 
         # make dataframe for plotting with seaborn
-        plot_df_1 = timeseries_df_1[['Water_LperH', 'mean_drawoff_vol_per_day']]
-        plot_df_2 = timeseries_df_2[['Water_LperH', 'mean_drawoff_vol_per_day']]
+        plot_df_1 = timeseries_df_1[['Water_LperH']].assign(
+            mean_drawoff_vol_per_day=get_meta(timeseries_df_1,
+                                              'mean_drawoff_vol_per_day'))
+        plot_df_2 = timeseries_df_2[['Water_LperH']].assign(
+            mean_drawoff_vol_per_day=get_meta(timeseries_df_2,
+                                              'mean_drawoff_vol_per_day'))
 
         fig, (ax1, ax2) = plt.subplots(2, 1)
         fig.tight_layout()
@@ -1158,17 +1680,13 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
             fig.savefig(dir_output / (fname + '.png'))
 
     if plot_distribution:
-        # compute Jensen Shannon Distance
-        distance = jensen_shannon_distance(q=timeseries_df_1['Water_LperH'],
-                                           p=timeseries_df_2['Water_LperH'])
-
         fig, (ax1, ax2) = plt.subplots(2, 1)
         fig.tight_layout()
 
         # plot the distribution
         # https://seaborn.pydata.org/generated/seaborn.displot.html
-        ax1 = sns.histplot(ax=ax1, data=drawoffs_1, kde=True)
-        ax2 = sns.histplot(ax=ax2, data=drawoffs_2, kde=True)
+        ax1 = draw_distribution(drawoffs_1, ax=ax1)
+        ax2 = draw_distribution(drawoffs_2, ax=ax2)
 
         # --- Set titles and Labels ---
         title_str_1 = make_title_str(timeseries_df=timeseries_df_1)
@@ -1218,10 +1736,6 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
 
         # https://towardsdatascience.com/advanced-histogram-using-python-bceae288e715
 
-        # compute Jensen Shannon Distance
-        distance = jensen_shannon_distance(q=timeseries_df_1['Water_LperH'],
-                                           p=timeseries_df_2['Water_LperH'])
-
         fig, axes = plt.subplots(2, 1)
         ax1 = axes[0]
         ax2 = axes[1]
@@ -1230,8 +1744,8 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
         drawoffs_lst = [drawoffs_1, drawoffs_2]
 
         # create bin values
-        mean1 = timeseries_df_1['mean_drawoff_flow_rate_LperH'][0]
-        sdtdev1 = timeseries_df_1['sdtdev_drawoff_flow_rate_LperH'][0]
+        mean1 = get_meta(timeseries_df_1, 'mean_drawoff_flow_rate_LperH')
+        sdtdev1 = get_meta(timeseries_df_1, 'sdtdev_drawoff_flow_rate_LperH')
         non_zero_min1 = timeseries_df_1[timeseries_df_1['Water_LperH'] > 0][
             'Water_LperH'].min()  # smallest entry that is not 0.
 
@@ -1245,8 +1759,8 @@ def compare_generators(timeseries_df_1, timeseries_df_2,
         bin_values1 = list(set(bin_values1))  # remove double entries
         bin_values1.sort()  # bins have to be sorted
 
-        mean2 = timeseries_df_2['mean_drawoff_flow_rate_LperH'][0]
-        sdtdev2 = timeseries_df_2['sdtdev_drawoff_flow_rate_LperH'][0]
+        mean2 = get_meta(timeseries_df_2, 'mean_drawoff_flow_rate_LperH')
+        sdtdev2 = get_meta(timeseries_df_2, 'sdtdev_drawoff_flow_rate_LperH')
         non_zero_min2 = timeseries_df_2[timeseries_df_2['Water_LperH'] > 0][
             'Water_LperH'].min()  # smallest entry that is not 0.
 
@@ -1329,9 +1843,9 @@ def plot_three_histplots(timeseries_df_1, timeseries_df_2, timeseries_df_3):
 
     # plot the distribution
     # https://seaborn.pydata.org/generated/seaborn.displot.html
-    ax1 = sns.histplot(ax=ax1, data=drawoffs_1, kde=True)
-    ax2 = sns.histplot(ax=ax2, data=drawoffs_2, kde=True)
-    ax3 = sns.histplot(ax=ax3, data=drawoffs_3, kde=True)
+    ax1 = draw_distribution(drawoffs_1, ax=ax1)
+    ax2 = draw_distribution(drawoffs_2, ax=ax2)
+    ax3 = draw_distribution(drawoffs_3, ax=ax3)
 
     # --- Set titles and Labels ---
     title_str_1 = make_title_str(timeseries_df=timeseries_df_1)
@@ -1399,6 +1913,47 @@ def jensen_shannon_distance(p, q):
     return round(distance, 4)
 
 
+def get_meta(timeseries_df, key=None):
+    """
+    get the metadata of a timeseries (method, categories, ...). It is kept
+    once in timeseries_df.attrs. Dataframes from older versions or loaded
+    from a csv keep it in constant columns, these are used instead.
+
+    :param timeseries_df:   df:     dataframe that holds the timeseries
+    :param key:             str:    only return this entry, f.e. 'method'
+    :return: meta:          dict:   all metadata, or the entry 'key'
+    """
+
+    if timeseries_df.attrs:
+        meta = dict(timeseries_df.attrs)
+    else:
+        meta = {col: timeseries_df[col].iloc[0] for col in meta_cols
+                if col in timeseries_df.columns}
+
+    if key is None:
+        return meta
+
+    return meta[key]
+
+
+def add_meta_cols(timeseries_df):
+    """
+    copy of a timeseries with its metadata in constant columns ('meta_cols'),
+    like dataframes of older versions. Used before saving to a csv, which
+    does not keep df.attrs.
+
+    :param timeseries_df:   df:     dataframe that holds the timeseries
+    :return: export_df:     df:     copy with the metadata columns
+    """
+
+    meta = get_meta(timeseries_df)
+    export_df = timeseries_df.assign(**{col: meta[col] for col in meta_cols
+                                        if col in meta})
+    export_df.attrs = {}
+
+    return export_df
+
+
 def get_s_step(timeseries_df):
     """
     get the seconds within a timestep from a pandas dataframe. When loading
@@ -1406,6 +1961,9 @@ def get_s_step(timeseries_df):
     just a workaround when loading Timeseries from csv.
     """
 
+    if 's_step' in timeseries_df.attrs:
+        return int(timeseries_df.attrs['s_step'])
+
     try:
         s_step = int(timeseries_df.index.freqstr[:-1])
         # todo: why doesnt this work for Dataframes loaded from a csv?
@@ -1434,8 +1992,8 @@ def make_title_str(timeseries_df):
     yearly_water_demand = timeseries_df['Water_L'].sum()  # in L
     drawoffs = timeseries_df[timeseries_df['Water_LperH'] != 0]['Water_LperH']
     max_water_flow = timeseries_df['Water_LperH'].max()
-    method = timeseries_df['method'][0]
-    cats = timeseries_df['categories'][0]
+    method = get_meta(timeseries_df, 'method')
+    cats = get_meta(timeseries_df, 'categories')
 
     if cats == 1:
         method = "{} ({} cat)".format(method, cats)
@@ -1456,16 +2014,19 @@ def make_title_str(timeseries_df):
             cols_LperH = [name for name in col_names if 'Water_L_' in name]
             water_LperH_df = timeseries_df[cols_LperH]
 
-            cats_str = ''
-            for col in cols_LperH:
-                cat_sum = water_LperH_df[col].sum()
-                cats_str += '{:.0f} L, '.format(cat_sum)
-            cats_str = cats_str[:-2]
-
             title_str = f'{method}, ∆t = {s_step}, No. Drawoffs =' \
                         f' {len(drawoffs)}, Peak = {max_water_flow:.1f} L/h ' \
-                        f'\n Yearly Demand = {yearly_water_demand:.0f} L (=' \
-                        f' {cats_str})'
+                        f'\n Yearly Demand = {yearly_water_demand:.0f} L'
+
+            # district profiles have no columns per category
+            if cols_LperH:
+                cats_str = ''
+                for col in cols_LperH:
+                    cat_sum = water_LperH_df[col].sum()
+                    cats_str += '{:.0f} L, '.format(cat_sum)
+                cats_str = cats_str[:-2]
+
+                title_str += f' (= {cats_str})'
 
         elif 'DHWcalc' in method:
 
@@ -1481,78 +2042,212 @@ def make_title_str(timeseries_df):
     return title_str
 
 
-def resample_water_series(timeseries_df, s_step_output):
+def build_pyramid(timeseries_df, col='Water_LperH',
+                  s_steps=(360, 600, 900, 3600)):
+    """
+    builds a 'ProfilePyramid' of one column, f.e. to plot or check several
+    resolutions without resampling the whole dataframe each time.
+
+    :param timeseries_df:   df:     dataframe that holds the timeseries
+    :param col:             str:    column of the base profile
+    :param s_steps:         list:   timesteps of the levels
+    :return: pyramid:       ProfilePyramid
+    """
+
+    return ProfilePyramid(
+        values=timeseries_df[col].to_numpy(),
+        s_step=get_s_step(timeseries_df),
+        s_steps=s_steps,
+        start=timeseries_df.index[0]
+    )
+
+
+def query_pyramid(pyramid, s_step, start=None, end=None, col='Water_LperH'):
+    """
+    a time window of a pyramid level as a dataframe. The column holds the
+    mean (like 'resample_water_series'), the other columns the max, the sum
+    and the number of non-zero steps of the base profile.
+
+    :param pyramid:         ProfilePyramid
+    :param s_step:          int:    timestep of the level
+    :param start:           str:    first time, f.e. '2019-03-04'
+    :param end:             str:    end of the window (not included)
+    :param col:             str:    name of the column
+    :return: window_df:     df
+    """
+
+    window = pyramid.query(s_step, start, end)
+
+    window_df = pd.DataFrame({
+        col: window['mean'],
+        col + '_max': window['max'],
+        col + '_sum': window['sum'],
+        col + '_count': window['count']
+    }, index=window['index'])
+
+    return window_df
+
+
+def resample_water_series(timeseries_df, s_step_output, schema=None):
     """
     Before resampling a dataframe, we have to choose which data has to be
     resampled in what way. some columns list constants, some list intensive
     properties (like L/h, kW) and some list extensive properties (Like
     Liters/kWh).
     Constants should stay the same, intensive properties should be averaged
-    and extensive properties should be summed up.
+    and extensive properties should be summed up. Constant flow rates (like
+    the mean drawoff flow rate) are divided by the conversion factor, also
+    in the metadata. Which column is which is given by the schema, see
+    'get_column_schema'.
+
+    If the output timestep is a multiple of the input timestep, each column
+    is reshaped to one row per output timestep and reduced along the rows,
+    without pandas resample.
 
     :param timeseries_df:       df:     dataframe that holds the timeseries
     :param s_step_output:       int:    desired output seconds in a timestep
+    :param schema:              dict:   'intensive', 'extensive',
+                                        'constant' or 'constant_flow' for
+                                        some or all columns
     :return: timeseries_df_re:  df:     resampled dataframe
     """
 
     s_step_old = get_s_step(timeseries_df)
     conversion_factor = s_step_output / s_step_old
 
-    if conversion_factor != 1:
-        # separate constants from variables
-        cols_consts = list(timeseries_df.columns[timeseries_df.nunique() <= 1])
-        cols_vars = list(timeseries_df.columns[timeseries_df.nunique() > 1])
+    if conversion_factor == 1:
+        return timeseries_df
+
+    schema = get_column_schema(timeseries_df, schema)
+    cols = {kind: [col for col in timeseries_df.columns if schema[col] == kind]
+            for kind in column_kinds}
+
+    rule = str(s_step_output) + 'S'
+    index = timeseries_df.index
+    n_steps = len(index)
+    first_step_s = (index[0] - index[0].normalize()).total_seconds()
+
+    if conversion_factor % 1 == 0 and n_steps % conversion_factor == 0 \
+            and first_step_s % s_step_output == 0:
 
-        # separate flows (intensive) from sums (extensive)
-        cols_flows = [i for i in cols_vars if 'Lper' in i]
-        cols_sums = [i for i in cols_vars if i not in cols_flows]
+        # --- reshape each column to (output timesteps, factor) ---
+        n_steps_re = int(n_steps / conversion_factor)
+        resampled_index = pd.date_range(start=index[0], periods=n_steps_re,
+                                        freq=rule)
+        columns = {}
 
-        # separate constants that change with the timestep (intensive
-        # properties)
-        cols_const_flows = [i for i in cols_consts if 'Lper' in i]
-        cols_consts = [i for i in cols_consts if i not in cols_const_flows]
+        for col in cols['intensive'] + cols['extensive']:
+            values = timeseries_df[col].to_numpy().reshape(n_steps_re, -1)
+            if values.dtype.kind == 'f' and np.isnan(values).any():
+                reduce = np.nanmean if col in cols['intensive'] else np.nansum
+            else:
+                reduce = np.mean if col in cols['intensive'] else np.sum
+            columns[col] = reduce(values, axis=1)
+
+        for col in cols['constant']:
+            columns[col] = timeseries_df[col].to_numpy()[:n_steps_re]
+
+        for col in cols['constant_flow']:
+            columns[col] = \
+                timeseries_df[col].to_numpy()[:n_steps_re] / conversion_factor
 
-        # make new sub-dataframes
-        timeseries_df_sum = timeseries_df[cols_sums]
-        timeseries_df_flows = timeseries_df[cols_flows]
-        timeseries_df_consts = timeseries_df[cols_consts]
-        timeseries_df_const_flows = timeseries_df[cols_const_flows]
+        timeseries_df_re = pd.DataFrame(columns, index=resampled_index)
 
+    else:
         # resample them according to their physical properties
-        rule = str(s_step_output) + 'S'
-        timeseries_df_sum_re = timeseries_df_sum.resample(rule=rule).sum()
-        timeseries_df_flows_re = timeseries_df_flows.resample(rule=rule).mean()
+        timeseries_df_flows_re = \
+            timeseries_df[cols['intensive']].resample(rule=rule).mean()
+        timeseries_df_sum_re = \
+            timeseries_df[cols['extensive']].resample(rule=rule).sum()
 
         # cut the dataframe with the constant variables and update the index
         resampled_index = timeseries_df_sum_re.index
-        timeseries_df_consts_cut = timeseries_df_consts[0:len(resampled_index)]
-        timeseries_df_consts_re \
-            = timeseries_df_consts_cut.set_index(resampled_index)
+        timeseries_df_consts_re = timeseries_df[cols['constant']][
+            0:len(resampled_index)].set_index(resampled_index)
 
         # update the constants that change with the timestep (intensive
         # properties) with the conversion factor
-        timeseries_df_consts_flows_cut \
-            = timeseries_df_const_flows[0:len(resampled_index)]
-        timeseries_df_consts_flows_re \
-            = timeseries_df_consts_flows_cut.set_index(resampled_index)
-        timeseries_df_consts_flows_re \
-            = timeseries_df_consts_flows_re / conversion_factor
+        timeseries_df_const_flows_re = timeseries_df[cols['constant_flow']][
+            0:len(resampled_index)].set_index(resampled_index) \
+            / conversion_factor
 
         timeseries_df_re = pd.concat(
             [timeseries_df_flows_re, timeseries_df_sum_re,
-             timeseries_df_consts_re, timeseries_df_consts_flows_re],
-            axis=1)
-
-        # add 'resampled' tag to method column
-        timeseries_df_re['method'] = timeseries_df['method'][0] + ' (resampled)'
-
+             timeseries_df_consts_re, timeseries_df_const_flows_re], axis=1)
+
+    timeseries_df_re = timeseries_df_re[
+        cols['intensive'] + cols['extensive'] + cols['constant']
+        + cols['constant_flow']]
+
+    # add 'resampled' tag to the method
+    meta = get_meta(timeseries_df)
+    meta['method'] = meta['method'] + ' (resampled)'
+    meta['s_step'] = s_step_output
+    for key in meta:
+        if 'Lper' in key and meta[key] is not None:
+            meta[key] = meta[key] / conversion_factor
+    if 'method' in timeseries_df_re.columns:
+        timeseries_df_re['method'] = meta['method']
     else:
-        timeseries_df_re = timeseries_df
+        timeseries_df_re.attrs = meta
 
     return timeseries_df_re
 
 
-def reduce_no_drawoffs(timeseries_df):
+def get_column_schema(timeseries_df, schema=None):
+    """
+    how each column is resampled:
+    'intensive': averaged, flow rates (all columns with 'Lper').
+    'extensive': summed up, like volumes and energies.
+    'constant': the value is kept, like metadata in older dataframes.
+    'constant_flow': the value is divided by the conversion factor, like the
+    mean drawoff flow rate in the metadata.
+
+    Columns that are not in the given schema are classified by their name.
+    A column is constant (constant_flow with 'Lper') if it is in
+    'meta_cols' or if all its values are the same. Otherwise columns with
+    'Lper' are intensive, the others extensive.
+
+    :param timeseries_df:   df:     dataframe that holds the timeseries
+    :param schema:          dict:   kinds of some columns, these are kept
+    :return: schema:        dict:   kind of each column
+    """
+
+    schema = dict(schema or {})
+
+    for col in timeseries_df.columns:
+        if col in schema:
+            if schema[col] not in column_kinds:
+                raise Exception('Unknown kind {} of column {}'.format(
+                    schema[col], col))
+        elif col in meta_cols or is_constant(timeseries_df[col]):
+            schema[col] = 'constant_flow' if 'Lper' in col else 'constant'
+        elif 'Lper' in col:
+            schema[col] = 'intensive'
+        else:
+            schema[col] = 'extensive'
+
+    return schema
+
+
+def is_constant(series):
+    """
+    all values of a series are the same (NaN ignored), checked with min and
+    max instead of hashing all values.
+    """
+
+    values = series.to_numpy()
+
+    if values.dtype.kind in 'biuf':
+        if len(values) == 0 or np.isnan(values.astype(float, copy=False)) \
+                .all():
+            return True
+        return np.nanmin(values) == np.nanmax(values)
+
+    return series.nunique() <= 1
+
+
+def reduce_no_drawoffs(timeseries_df, seed=None):
     """
     for some reason, DHWcalc still yields less yearly drawoffs than OpenDHW.
     In case the yearly water demand is higher in an OpenDHW timeseries than
@@ -1562,11 +2257,13 @@ def reduce_no_drawoffs(timeseries_df):
     drawoffs.
 
     :param timeseries_df:           df: input dataframe
+    :param seed:                    int: seed or Generator for the shuffle
     :return: timeseries_df_cleaned: df  output dataframe
     """
 
     # get the expected yearly water demand
-    expected_yearly_water = timeseries_df['mean_drawoff_vol_per_day'][0] * 365
+    expected_yearly_water = \
+        get_meta(timeseries_df, 'mean_drawoff_vol_per_day') * 365
     actual_yearly_water = timeseries_df['Water_L'].sum()
 
     if expected_yearly_water < actual_yearly_water:
@@ -1579,7 +2276,8 @@ def reduce_no_drawoffs(timeseries_df):
         cut_off_flow_rate = max(min_flow_rate * 5, max_flow_rate / 200)
 
         # shuffle df so random days are selected when iterated over.
-        timeseries_df_shuffled = timeseries_df.sample(frac=1).reset_index(
+        timeseries_df_shuffled = timeseries_df.sample(
+            frac=1, random_state=np.random.default_rng(seed)).reset_index(
             drop=False)
 
         # loop over the shuffled timeseries and set some vales to 0.
@@ -1597,6 +2295,7 @@ def reduce_no_drawoffs(timeseries_df):
         # un-shuffle df
         timeseries_df_shuffled = timeseries_df_shuffled.set_index('index')
         timeseries_df_cleaned = timeseries_df_shuffled.sort_index()
+        timeseries_df_cleaned.attrs = get_meta(timeseries_df)
 
     else:
         timeseries_df_cleaned = timeseries_df
@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 """
 This package contains the script that stores all function of the DHWcalc package
-as well as a utils package.
+as well as a utils package. The NumPy kernels are in OpenDHW.core.
 """
 
 from OpenDHW.OpenDHW import *
+from OpenDHW import core
 
 __version__ = '0.1'
@@ -0,0 +1,2412 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from pathlib import Path
+import functools
+import math
+import dataclasses
+import scipy
+
+"""
+Array core of OpenDHW. The functions in this script take and return NumPy
+arrays and a small metadata record (ProfileMeta) instead of Pandas
+Dataframes. They can be used directly in a simulation loop. The Dataframe
+functions of OpenDHW.py and OpenDHW_Utilities.py are wrappers around them.
+"""
+
+# --- Constants ---
+rho = 980 / 1000  # kg/L for Water (at 60°C? at 10°C its = 1)
+cp = 4180  # J/kgK
+
+# --- Cache sizes (number of parameter sets kept per cached artifact). They
+# are passed to lru_cache when the modules are imported, also by OpenDHW.py.
+cache_size_profiles = 16
+cache_size_categories = 64
+
+# --- Storage model: shorter stretches without demand are simulated stepwise ---
+min_storage_jump = 8
+
+# --- Storage sweep: drawoffs looked ahead per storage and iteration ---
+sweep_window = 16
+
+
+@dataclasses.dataclass
+class ProfileMeta:
+    """
+    Input parameters of a DHW profile. They define the profile together
+    with the seed and run number.
+    """
+
+    s_step: int
+    categories: int
+    weekend_weekday_factor: float = 1.2
+    mean_drawoff_vol_per_day: float = 200
+    initial_day: int = 0
+    method: str = 'OpenDHW'
+
+    @property
+    def n_steps(self):
+        """
+        number of timesteps in a year
+        """
+        return int(365 * 24 * 3600 / self.s_step)
+
+    def to_dict(self):
+        """
+        all fields as a dictionary
+        """
+        return dataclasses.asdict(self)
+
+    def generation_params(self):
+        """
+        keyword arguments for 'generate_dhw_profiles'
+        """
+        params = self.to_dict()
+        params.pop('method')
+        return params
+
+
+def generate_profile(meta, seed=None, run=0, dtype=np.int16):
+    """
+    Generates one DHW profile as an array. Same profile as
+    'generate_dhw_profile' with the same key (seed, run).
+
+    :param meta:            ProfileMeta:    input parameters
+    :param seed:            int:            seed, SeedSequence or
+                                            Generator. None: random.
+    :param run:             int:            run number, part of the key
+    :param dtype:           dtype:          dtype of the returned array
+    :return: water_LperH:   array:          flow rates in L/h
+    """
+
+    return generate_dhw_profiles(n_runs=1, dtype=dtype, seed=seed,
+                                 first_run=run,
+                                 **meta.generation_params())[0]
+
+
+def generate_dhw_profiles(n_runs, s_step, categories,
+                          weekend_weekday_factor=1.2,
+                          mean_drawoff_vol_per_day=200, initial_day=0,
+                          dtype=np.int16, max_block_mb=256, seed=None,
+                          first_run=0, return_events=False):
+    """
+    Generates multiple DHW profiles with the same input parameters at once.
+    The deterministic parts (drawoff categories and the yearly probability
+    profile) are only built once. Drawoffs of all runs are then placed
+    together. Instead of a dataframe, a compact 2-D array with one row per
+    run is returned. It can be passed directly to 'compute_heat_profiles',
+    'resample_profiles' and 'get_profile_stats'.
+
+    Run r (counted from first_run) and category i draw from the stream with
+    the key (seed, r, i). Any row can thus be regenerated on its own with
+    'generate_dhw_profile(seed=seed, run=r)'.
+
+    :param n_runs:                      int:    number of profiles
+    :param s_step:                      int:    timestep width in seconds.
+    :param categories:                  int:    1 or 4 (see DHWcalc)
+    :param weekend_weekday_factor:      int:    taken from DHWcalc
+    :param mean_drawoff_vol_per_day:    int:    function of number of people in
+                                                the house of floor area.
+    :param initial_day:                 int:    0:Mon - 1:Tues ... 6:Sun
+    :param dtype:                       dtype:  dtype of the returned array.
+                                                flow rates are whole numbers
+                                                in L/h, so int16 is lossless.
+    :param max_block_mb:                int:    memory used for placing the
+                                                drawoffs. runs are placed in
+                                                blocks that fit into it.
+    :param seed:                        int:    seed, SeedSequence or
+                                                Generator. None: random.
+    :param first_run:                   int:    run number of the first row
+    :param return_events:               bool:   return the sparse drawoff
+                                                events (DrawoffEvents) of all
+                                                runs instead of the array.
+    :return: water_LperH:               array:  flow rates in L/h, one row
+                                                per run.
+    """
+
+    seed_seq = get_seed_sequence(seed)
+
+    # --- holds statistic info about the drawoffs
+    cats_df = get_data_drawoff_categories(
+        s_step=s_step,
+        categories=categories,
+        mean_drawoff_vol_per_day=mean_drawoff_vol_per_day
+    )
+
+    # --- deterministic function
+    p_norm_integral = get_p_norm_integral(
+        s_step=s_step,
+        weekend_weekday_factor=weekend_weekday_factor,
+        initial_day=initial_day
+    )
+
+    n_steps = len(p_norm_integral)
+    min_rand = p_norm_integral.min()
+    max_rand = p_norm_integral.max()
+
+    if return_events:
+        events_lst = []
+    else:
+        water_LperH = np.zeros((n_runs, n_steps), dtype=dtype)
+
+    # the placement works on two float arrays (sum and category) per run.
+    block_rows = max(1, int(max_block_mb * 1e6 / (2 * 8 * n_steps)))
+
+    for first_row in range(0, n_runs, block_rows):
+        last_row = min(first_row + block_rows, n_runs)
+        water_LperH_block = np.zeros((last_row - first_row, n_steps))
+
+        # --- for each category, generate and distribute drawoffs.
+        for i in range(len(cats_df)):
+            cats_series = cats_df.iloc[i]
+            drawoff_steps = int(cats_series['drawoff_duration_min'] * 60
+                                / s_step)
+
+            # every run and category has its own random stream
+            drawoffs_lst = []
+            p_drawoffs_lst = []
+            for row in range(first_row, last_row):
+                rng = get_rng(seed_seq, first_run + row, i)
+                drawoffs = generate_drawoffs_inside_boundaries(
+                    cats_series, s_step, rng=rng)
+                drawoffs_lst.append(drawoffs)
+                p_drawoffs_lst.append(rng.uniform(min_rand, max_rand,
+                                                  size=len(drawoffs)))
+
+            runs = np.repeat(np.arange(len(drawoffs_lst)),
+                             [len(drawoffs) for drawoffs in drawoffs_lst])
+            drawoffs = np.concatenate(drawoffs_lst)
+            p_drawoffs = np.concatenate(p_drawoffs_lst)
+
+            placed = place_drawoffs(
+                p_norm_integral=p_norm_integral,
+                p_drawoffs=p_drawoffs,
+                drawoffs=drawoffs,
+                drawoff_steps=drawoff_steps,
+                max_flow_rate=cats_series['max_flow_rate_per_drawoff_LperH'],
+                water_LperH=water_LperH_block,
+                runs=runs,
+                return_events=return_events
+            )
+            water_LperH_block = placed[0]
+
+            if return_events:
+                runs_placed, starts, flows = placed[2]
+                cat_id = int(cats_series['mean_flow_rate_per_drawoff_LperH'])
+                events_lst.append((first_row + runs_placed, starts, flows,
+                                   drawoff_steps, cat_id))
+
+        if not return_events:
+            water_LperH[first_row:last_row] = water_LperH_block
+
+    if return_events:
+        events = DrawoffEvents(
+            start=np.concatenate([e[1] for e in events_lst]),
+            duration=np.concatenate(
+                [np.full(len(e[1]), e[3]) for e in events_lst]),
+            flow_rate=np.concatenate([e[2] for e in events_lst]),
+            category=np.concatenate(
+                [np.full(len(e[1]), e[4]) for e in events_lst]),
+            s_step=s_step,
+            n_steps=n_steps,
+            run=np.concatenate([e[0] for e in events_lst]),
+            n_runs=n_runs
+        )
+        return events.sort()
+
+    return water_LperH
+
+
+class DrawoffEvents:
+    """
+    Sparse representation of one or more DHW profiles. Instead of dense
+    timeseries, only the drawoff events are stored in typed arrays: start
+    timestep, duration in timesteps, flow rate in L/h, category (same id as
+    in the 'Water_LperH_cat' columns) and run. A year has some ten thousand
+    events compared to 525600 timesteps at s_step=60. The dense flow rates
+    are only computed when they are asked for, at any resolution
+    ('to_dense').
+    """
+
+    def __init__(self, start, duration, flow_rate, category, s_step,
+                 n_steps=None, run=None, n_runs=None):
+        """
+        :param start:       array:  start timestep of each event
+        :param duration:    array:  number of timesteps of each event
+        :param flow_rate:   array:  flow rate of each event in L/h
+        :param category:    array:  category id of each event
+        :param s_step:      int:    seconds in a timestep
+        :param n_steps:     int:    timesteps of a run. Default: one year
+        :param run:         array:  run of each event. Default: all run 0
+        :param n_runs:      int:    number of runs
+        """
+
+        self.start = np.asarray(start, dtype=np.int32)
+        self.duration = np.asarray(duration, dtype=np.int16)
+        self.flow_rate = np.asarray(flow_rate, dtype=np.float32)
+        self.category = np.asarray(category, dtype=np.int16)
+
+        if run is None:
+            run = np.zeros(len(self.start))
+        self.run = np.asarray(run, dtype=np.int32)
+
+        if n_steps is None:
+            n_steps = int(365 * 24 * 3600 / s_step)
+        if n_runs is None:
+            n_runs = int(self.run.max()) + 1 if len(self.run) else 1
+
+        self.s_step = int(s_step)
+        self.n_steps = int(n_steps)
+        self.n_runs = int(n_runs)
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return 'DrawoffEvents({} events, {} runs, s_step={})'.format(
+            len(self), self.n_runs, self.s_step)
+
+    @property
+    def volume(self):
+        """
+        volume of each event in L
+        """
+        return self.flow_rate.astype(float) * self.duration \
+            * (self.s_step / 3600)
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in [self.start, self.duration,
+                                          self.flow_rate, self.category,
+                                          self.run])
+
+    def _subset(self, mask):
+        return DrawoffEvents(
+            start=self.start[mask],
+            duration=self.duration[mask],
+            flow_rate=self.flow_rate[mask],
+            category=self.category[mask],
+            s_step=self.s_step,
+            n_steps=self.n_steps,
+            run=self.run[mask],
+            n_runs=self.n_runs
+        )
+
+    def sort(self):
+        """
+        returns the events sorted by run and start timestep.
+        """
+        return self._subset(np.lexsort((self.start, self.run)))
+
+    def select_run(self, run):
+        """
+        returns the events of a single run.
+        """
+        events = self._subset(self.run == run)
+        events.run[:] = 0
+        events.n_runs = 1
+        return events
+
+    def volume_per_category(self):
+        """
+        yearly volume in L of each category, summed over all runs.
+
+        :return: volumes:   dict:   {category id: volume in L}
+        """
+        cats, cat_idx = np.unique(self.category, return_inverse=True)
+        volumes = np.bincount(cat_idx, weights=self.volume,
+                              minlength=len(cats))
+        return {int(cat): vol for cat, vol in zip(cats, volumes)}
+
+    def count_per_category(self):
+        """
+        number of events of each category, summed over all runs.
+
+        :return: counts:    dict:   {category id: number of events}
+        """
+        cats, counts = np.unique(self.category, return_counts=True)
+        return {int(cat): int(count) for cat, count in zip(cats, counts)}
+
+    @classmethod
+    def concatenate(cls, events_lst, n_runs=None):
+        """
+        Joins event tables with the same timestep. The run numbers are kept,
+        so they should already be distinct.
+
+        :param events_lst:  list:   DrawoffEvents
+        :param n_runs:      int:    number of runs of the joined table
+        :return: events:    DrawoffEvents
+        """
+
+        if n_runs is None:
+            n_runs = max(events.n_runs for events in events_lst)
+
+        return cls(
+            start=np.concatenate([e.start for e in events_lst]),
+            duration=np.concatenate([e.duration for e in events_lst]),
+            flow_rate=np.concatenate([e.flow_rate for e in events_lst]),
+            category=np.concatenate([e.category for e in events_lst]),
+            s_step=events_lst[0].s_step,
+            n_steps=events_lst[0].n_steps,
+            run=np.concatenate([e.run for e in events_lst]),
+            n_runs=n_runs
+        )
+
+    def to_dense(self, s_step=None, category=None, sum_runs=False):
+        """
+        Computes the dense flow rates in L/h. For a coarser timestep, the
+        flow rates are averaged (the volume stays the same), for a finer
+        timestep they are repeated. Coarser timesteps have to be a multiple,
+        finer timesteps a divisor of the timestep of the events.
+
+        :param s_step:          int:    seconds in a timestep of the output.
+                                        Default: timestep of the events.
+        :param category:        int:    only use events of one category
+        :param sum_runs:        bool:   add up all runs into one profile
+        :return: water_LperH:   array:  one row per run, 1-D for one run
+        """
+
+        n_runs = 1 if sum_runs else self.n_runs
+
+        if s_step is None:
+            s_step = self.s_step
+
+        events = self if category is None else self._subset(
+            self.category == category)
+
+        # --- expand the events to all timesteps they occupy ---
+        durations = events.duration.astype(np.int64)
+        event_idx = np.repeat(np.arange(len(events)), durations)
+        step_in_event = np.arange(len(event_idx)) - np.repeat(
+            np.cumsum(durations) - durations, durations)
+        steps = events.start[event_idx] + step_in_event
+        if sum_runs:
+            runs = np.zeros(len(steps), dtype=np.int64)
+        else:
+            runs = events.run[event_idx].astype(np.int64)
+        flows = events.flow_rate[event_idx].astype(float)
+
+        if s_step >= self.s_step:
+            factor = s_step / self.s_step
+            assert factor % 1 == 0, \
+                's_step has to be a multiple of the events timestep'
+            factor = int(factor)
+            n_steps = self.n_steps // factor
+            steps = steps // factor
+            flows = flows / factor
+        else:
+            factor = self.s_step / s_step
+            assert factor % 1 == 0, \
+                's_step has to be a divisor of the events timestep'
+            n_steps = self.n_steps
+
+        # each run is binned on its own. Steps after the last complete
+        # output timestep of a run are dropped.
+        inside = steps < n_steps
+        water_LperH = np.bincount(runs[inside] * n_steps + steps[inside],
+                                  weights=flows[inside],
+                                  minlength=n_runs * n_steps)
+        water_LperH = water_LperH.reshape(n_runs, n_steps)
+
+        if s_step < self.s_step:
+            water_LperH = np.repeat(water_LperH, int(self.s_step / s_step),
+                                    axis=1)
+
+        if n_runs == 1:
+            water_LperH = water_LperH[0]
+
+        return water_LperH
+
+
+def get_data_drawoff_categories(s_step, categories, mean_drawoff_vol_per_day):
+    """
+    Get some data for each drawoff category. If only one category is chosen,
+    a simplified datafarme is returned. The table is cached (see
+    'clear_cache'), every call returns its own copy.
+
+    :param s_step:                      int:    seconds in a timestep. f.e 900
+    :param categories:                  int:    1 or 4, see DHWcalc
+    :param mean_drawoff_vol_per_day:    int:    volume per day used in house
+    :return: cats_df:                   df:     Categores Data
+    """
+
+    return _get_data_drawoff_categories(
+        s_step, categories, mean_drawoff_vol_per_day).copy()
+
+
+@functools.lru_cache(maxsize=cache_size_categories)
+def _get_data_drawoff_categories(s_step, categories, mean_drawoff_vol_per_day):
+    """
+    Builds the table of 'get_data_drawoff_categories'. Cached, so the
+    returned dataframe must not be changed.
+    """
+    if categories == 4:
+        cats_data_60 = {'mean_flow_rate_per_drawoff_LperH': [60, 360, 840, 480],
+                        'drawoff_duration_min': [1, 1, 10, 5],
+                        'portion': [0.14, 0.36, 0.1, 0.4],
+                        'stddev_flow_rate_per_drawoff_LperH': [120, 120, 12,
+                                                               24],
+                        'min_flow_rate_per_drawoff_LperH': [1, 1, 1, 1]
+                        }
+
+        cats_df = pd.DataFrame(data=cats_data_60)
+        # sort by duration distributes long drawoff types first.
+        # todo: second sort by portion, biggest portion distributed first
+        cats_df.sort_values(by=['drawoff_duration_min'], ascending=False,
+                            inplace=True)
+
+    elif categories == 1:
+        cats_data_60 = {'mean_flow_rate_per_drawoff_LperH': [480],
+                        'drawoff_duration_min': [1],
+                        'portion': [1],
+                        'stddev_flow_rate_per_drawoff_LperH': [120],
+                        'min_flow_rate_per_drawoff_LperH': [6]
+                        }
+
+        cats_df = pd.DataFrame(data=cats_data_60)
+    else:
+        raise Exception('unkown number of categories')
+
+    # if DHWcalc uses 4 categories with a timestep other than 60s,
+    # the drawoffs data has to be altered.
+    if s_step != 60:
+        cats_df['drawoff_duration_min_old'] = cats_df['drawoff_duration_min']
+
+        cats_df['drawoff_duration_min'] = int(s_step / 60)
+
+        cats_df['conversion_factor'] = cats_df['drawoff_duration_min'] / \
+                                       cats_df['drawoff_duration_min_old']
+
+        cats_df['mean_flow_rate_per_drawoff_LperH'] \
+            = cats_df['mean_flow_rate_per_drawoff_LperH'] / cats_df[
+            'conversion_factor']
+        cats_df['stddev_flow_rate_per_drawoff_LperH'] = \
+            cats_df['stddev_flow_rate_per_drawoff_LperH'] / cats_df[
+                'conversion_factor']
+
+    # add more data to the category dataframe.
+    cats_df['mean_vol_per_drawoff'] = \
+        cats_df['mean_flow_rate_per_drawoff_LperH'] \
+        / 60 * cats_df['drawoff_duration_min']
+
+    cats_df['mean_vol_per_day'] = mean_drawoff_vol_per_day * cats_df[
+        'portion']
+
+    cats_df['mean_vol_per_year'] = cats_df['mean_vol_per_day'] * 365
+
+    cats_df['mean_no_drawoffs_per_day'] = \
+        cats_df['mean_vol_per_day'] / cats_df['mean_vol_per_drawoff']
+
+    cats_df['mean_no_drawoffs_per_year'] = \
+        cats_df['mean_no_drawoffs_per_day'] * 365
+
+    # add max flow rate: Max(1200, highest category mean flow rate)
+    cats_df['max_flow_rate_per_drawoff_LperH'] \
+        = max(cats_df['mean_flow_rate_per_drawoff_LperH'].max(), 1200)
+
+    return cats_df
+
+
+def generate_daily_probability_step_function(mode, s_step, save_fig=False,
+                                             test_concentrated_ps=False):
+    """
+    Generates probabilities for a day with 6 periods. Corresponds to the mode
+    "step function for weekdays and weekends" in DHWcalc and uses the same
+    standard values. Each Day starts at 0:00. Steps in hours. Sum of steps
+    has to be 24. Sum of probabilities has to be 1.
+
+    :param test_concentrated_ps:    bool:   different probabilities,
+                                            very concentrated in the morning
+    :param mode:                    string: weekday or weekend day
+    :param s_step:                  int:    seconds within a timestep
+    :param save_fig:                Bool:   plot the probability distribution
+    :return: p_day                  list:   distribution for one day.
+    """
+
+    # todo: add profiles for non-residential buildings, no more heavy periods
+    #  in the morning and evening? different for every industry type? more
+    #  during the night?
+
+    if s_step <= 1800:
+        if mode == 'weekday':
+            steps_and_ps = [(6.5, 0.01), (1, 0.5), (4.5, 0.06), (1, 0.16),
+                            (5, 0.06), (4, 0.2), (2, 0.01)]
+
+        elif mode == 'weekend':
+            steps_and_ps = [(7, 0.02), (2, 0.475), (6, 0.071), (2, 0.237),
+                            (3, 0.036), (3, 0.143), (1, 0.018)]
+
+        else:
+            raise Exception('Unknown Mode. Please Choose "Weekday" or '
+                            '"Weekend".')
+    else:
+        # no more half-hourly steps
+        if mode == 'weekday':
+            steps_and_ps = [(7, 0.01), (1, 0.5), (4, 0.06), (1, 0.16),
+                            (5, 0.06), (4, 0.2), (2, 0.01)]
+
+        elif mode == 'weekend':
+            steps_and_ps = [(7, 0.02), (2, 0.475), (6, 0.071), (2, 0.237),
+                            (3, 0.036), (3, 0.143), (1, 0.018)]
+
+        else:
+            raise Exception('Unknown Mode. Please Choose "Weekday" or '
+                            '"Weekend".')
+
+    if test_concentrated_ps:
+        # just as a test, if p is very concentrated, only 2 hours in the morning
+        steps_and_ps = [(7, 0), (2, 1), (15, 0)]
+
+    steps = [tup[0] for tup in steps_and_ps]
+    ps = [tup[1] for tup in steps_and_ps]
+
+    assert sum(steps) == 24
+    assert sum(ps) == 1
+
+    p_day = []
+
+    for tup in steps_and_ps:
+        p_lst = [tup[1] for _ in range(int(tup[0] * 3600 / s_step))]
+        p_day.extend(p_lst)
+
+    # check if length of daily intervals fits into the stepwidth.
+    assert len(p_day) == 24 * 3600 / s_step
+
+    if save_fig:
+        fig, ax = plt.subplots()
+        plt.plot(p_day)
+        plt.show()
+        dir_output = Path.cwd() / "plots"
+        dir_output.mkdir(exist_ok=True)
+        fname = "Daily_Probability_Profile_{}S_{}".format(s_step, mode)
+        fig.savefig(dir_output / (fname + '.pdf'))
+        fig.savefig(dir_output / (fname + '.svg'))
+        fig.savefig(dir_output / (fname + '.png'))
+
+    return p_day
+
+
+@functools.lru_cache(maxsize=cache_size_profiles)
+def get_p_norm_integral(s_step, weekend_weekday_factor=1.2, initial_day=0):
+    """
+    Computes the summed yearly probability profile of
+    'generate_yearly_probability_profile' as an array. The array is cached
+    and read-only, so it can be shared between runs.
+
+    :param s_step:                  int:    seconds in a timestep
+    :param weekend_weekday_factor:  float:  shift probabilities towards weekend
+    :param initial_day:             int:    Mon: 0 ... Sun: 6
+    :return: p_norm_integral:       array:  read-only, one value per timestep
+    """
+
+    profile = generate_factorized_probability_profile(
+        s_step=s_step,
+        weekend_weekday_factor=weekend_weekday_factor,
+        initial_day=initial_day
+    )
+
+    # sum and normalize to range between 0 and 1.
+    p_norm_integral = profile.integral()
+    p_norm_integral.flags.writeable = False
+
+    return p_norm_integral
+
+
+def shift_weekend_weekday(p_weekday, p_weekend, factor=1.2):
+    """
+    Shifts the probabilities between the weekday list and the weekend list by a
+    defined factor. If the factor is bigger than 1, the probability on the
+    weekend is increased. If its smaller than 1, the probability on the
+    weekend is decreased.
+
+    :param p_weekday:   list:   probabilities for 1 day of the week [0...1]
+    :param p_weekend:   list:   probabilities for 1 day of the weekend [0...1]
+    :param factor:      float:  factor to shift the probabilities between
+                                weekdays and weekend-days
+    :return: p_wd_weighted:         array:  shifted weekday probabilities
+    :return: p_we_weighted:         array:  shifted weekend probabilities
+    :return: av_p_week_weighted:    float:  mean probability of a week
+    """
+
+    p_wd_factor = 1 / (5 / 7 + factor * 2 / 7)
+    p_we_factor = 1 / (1 / factor * 5 / 7 + 2 / 7)
+
+    assert p_wd_factor * 5 / 7 + p_we_factor * 2 / 7 == 1
+
+    p_wd_weighted = np.asarray(p_weekday) * p_we_factor
+    p_we_weighted = np.asarray(p_weekend) * p_we_factor
+
+    av_p_wd_weighted = p_wd_weighted.mean()
+    av_p_we_weighted = p_we_weighted.mean()
+
+    av_p_week_weighted = av_p_wd_weighted * 5 / 7 + av_p_we_weighted * 2 / 7
+
+    return p_wd_weighted, p_we_weighted, av_p_week_weighted
+
+
+def generate_yearly_probabilities(initial_day, p_weekend, p_weekday,
+                                  s_step, plot_p_yearly=False):
+    """
+    Takes the probabilities of a weekday and a weekendday and generates a
+    list of yearly probabilities by adding a seasonal probability factor.
+    The seasonal factor is a sine-function, like in DHWcalc.
+
+    :param initial_day:     int:    0: Mon, 1: Tue, 2: Wed, 3: Thur, 4: Fri,
+                                    5 : Sat, 6 : Sun
+    :param p_weekend:       list:   probabilities of a weekend day
+    :param p_weekday:       list:   probabilities of a weekday
+    :param s_step:          int:    seconds within a timestep
+    :param plot_p_yearly:   bool:   plot the yearly probabilities
+
+    :return: p_final:       array:  probabilities of a full year
+    """
+
+    profile = FactorizedProfile(
+        p_days=[p_weekday, p_weekend],
+        day_types=get_day_types(initial_day),
+        season=get_seasonal_factors(),
+        s_step=s_step
+    )
+    p_final = profile.expand()
+
+    if plot_p_yearly:
+        fig, ax = plt.subplots()
+        plt.plot(p_final)
+        plt.show()
+        dir_output = Path.cwd() / "plots"
+        dir_output.mkdir(exist_ok=True)
+        fname = "Yearly_Probability_Profile_{}initalday_{}S".format(
+            initial_day, s_step)
+        fig.savefig(dir_output / (fname + '.pdf'))
+        fig.savefig(dir_output / (fname + '.svg'))
+        fig.savefig(dir_output / (fname + '.png'))
+
+    return p_final
+
+
+class FactorizedProfile:
+    """
+    Probability profile in factorized form: the probability of step k on
+    day d is p_days[day_types[d], k] * season[d]. Only the day templates
+    (one row per day type), the day type of each day and the seasonal factor
+    of each day are stored. The full profile is only built on 'expand' or
+    'integral', optionally for a range of days.
+    """
+
+    def __init__(self, p_days, day_types, season, s_step):
+        """
+        :param p_days:      array:  probabilities of each day type and step
+        :param day_types:   array:  row of p_days for each day
+        :param season:      array:  seasonal factor of each day
+        :param s_step:      int:    seconds in a timestep
+        """
+
+        self.p_days = np.asarray(p_days, dtype=float)
+        self.day_types = np.asarray(day_types, dtype=int)
+        self.season = np.asarray(season, dtype=float)
+        self.s_step = s_step
+
+        assert self.p_days.shape[1] == int(24 * 3600 / s_step)
+        assert len(self.day_types) == len(self.season)
+
+    def __len__(self):
+        return len(self.day_types) * self.p_days.shape[1]
+
+    def __repr__(self):
+        return 'FactorizedProfile({} days, {} day types, s_step={})'.format(
+            len(self.day_types), len(self.p_days), self.s_step)
+
+    @property
+    def day_sums(self):
+        """
+        sum of the (not normalized) probabilities of each day
+        """
+        return self.p_days.sum(axis=1)[self.day_types] * self.season
+
+    def expand(self, days=None):
+        """
+        Builds the (not normalized) probabilities of each timestep.
+
+        :param days:        slice:  only build these days. Default: all.
+        :return: p_final:   array
+        """
+
+        if days is None:
+            days = slice(None)
+
+        return (self.p_days[self.day_types[days]]
+                * self.season[days, None]).ravel()
+
+    def integral(self, days=None):
+        """
+        Builds the normalized and summed profile, like
+        'normalize_and_sum_list' of the expanded profile. The sum before
+        each day is taken from the day sums, so a range of days can be built
+        without the days before it.
+
+        :param days:                slice:  only build these days
+        :return: p_norm_integral:   array
+        """
+
+        if days is None:
+            days = slice(None)
+
+        cumsum_days = np.cumsum(self.p_days, axis=1)
+        day_sums = cumsum_days[self.day_types, -1] * self.season
+        day_ends = np.cumsum(day_sums)
+        day_starts = day_ends - day_sums
+
+        p_norm_integral = day_starts[days, None] \
+            + cumsum_days[self.day_types[days]] * self.season[days, None]
+
+        return p_norm_integral.ravel() / day_ends[-1]
+
+    def resample(self, s_step):
+        """
+        Sums the day templates into a coarser timestep. s_step has to be a
+        multiple of the current timestep.
+
+        :param s_step:      int:                seconds in the new timestep
+        :return: profile:   FactorizedProfile
+        """
+
+        assert s_step % self.s_step == 0
+        factor = int(s_step / self.s_step)
+        p_days = self.p_days.reshape(len(self.p_days), -1, factor).sum(axis=2)
+
+        return FactorizedProfile(p_days, self.day_types, self.season, s_step)
+
+
+def generate_factorized_probability_profile(s_step, weekend_weekday_factor=1.2,
+                                            initial_day=0, n_days=365):
+    """
+    Builds the yearly probability profile of
+    'generate_yearly_probability_profile' in factorized form. Row 0 of the
+    day templates is the weekday, row 1 the weekend day.
+
+    :param s_step:                  int:    seconds in a timestep
+    :param weekend_weekday_factor:  float:  shift probabilities towards weekend
+    :param initial_day:             int:    Mon: 0 ... Sun: 6
+    :param n_days:                  int:    number of days
+    :return: profile:               FactorizedProfile
+    """
+
+    p_wd_weighted, p_we_weighted, _ = shift_weekend_weekday(
+        p_weekday=generate_daily_probability_step_function(
+            mode='weekday', s_step=s_step),
+        p_weekend=generate_daily_probability_step_function(
+            mode='weekend', s_step=s_step),
+        factor=weekend_weekday_factor
+    )
+
+    profile = FactorizedProfile(
+        p_days=[p_wd_weighted, p_we_weighted],
+        day_types=get_day_types(initial_day, n_days),
+        season=get_seasonal_factors(n_days),
+        s_step=s_step
+    )
+
+    return profile
+
+
+def get_day_types(initial_day=0, n_days=365):
+    """
+    day type of each day, 0: weekday, 1: weekend day (Sat, Sun).
+
+    :param initial_day:     int:    Mon: 0 ... Sun: 6
+    :param n_days:          int:    number of days
+    :return: day_types:     array
+    """
+
+    return ((np.arange(n_days) + initial_day) % 7 >= 5).astype(int)
+
+
+def get_seasonal_factors(n_days=365):
+    """
+    seasonal factor of each day. Like in DHWcalc, it is a sine-function with
+    a maximum in february and an amplitude of 10 %.
+
+    :param n_days:          int:    number of days
+    :return: season:        array
+    """
+
+    return 1 + 0.1 * np.cos(np.pi * (2 / 365 * np.arange(n_days) - 1 / 4))
+
+
+def normalize_and_sum_list(lst, save_fig=False):
+    """
+    takes a list and normalizes it based on the sum of all list elements.
+    then generates a new list based on the current sum of each list entry.
+
+    :param lst:                 list:   input list
+    :param save_fig:            bool:   plot the output list
+    :return: lst_norm_integral: array   output list
+    """
+
+    lst = np.asarray(lst, dtype=float)
+    lst_norm_integral = np.cumsum(lst / lst.sum())
+
+    if save_fig:
+        fig, ax = plt.subplots()
+        plt.plot(lst_norm_integral)
+        plt.show()
+        dir_output = Path.cwd() / "plots"
+        dir_output.mkdir(exist_ok=True)
+        fname = "Normed_and_summed_probability_profile"
+        fig.savefig(dir_output / (fname + '.pdf'))
+        fig.savefig(dir_output / (fname + '.svg'))
+        fig.savefig(dir_output / (fname + '.png'))
+
+    return lst_norm_integral
+
+
+def get_seed_sequence(seed=None):
+    """
+    Converts a seed into a SeedSequence, the root of all random streams of a
+    profile. A Generator is not reused directly, a new SeedSequence is drawn
+    from it instead (this advances the Generator).
+
+    :param seed:        int:    int, SeedSequence, Generator or None (random)
+    :return: seed_seq:  SeedSequence
+    """
+
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2 ** 32, size=4))
+
+    return np.random.SeedSequence(seed)
+
+
+def get_rng(seed_seq, *key):
+    """
+    Returns the random stream for a key, f.e. (run, category). The stream is
+    the child of seed_seq with that spawn key, so it is independent of all
+    other keys and can be recreated without generating the other streams.
+
+    :param seed_seq:    SeedSequence:   root of the streams
+    :param key:         int:            f.e. run and category
+    :return: rng:       Generator
+    """
+
+    return np.random.default_rng(get_child_seed_sequence(seed_seq, *key))
+
+
+def get_child_seed_sequence(seed_seq, *key):
+    """
+    Returns the child of seed_seq with the spawn key 'key' (see 'get_rng').
+
+    :param seed_seq:    SeedSequence:   root of the streams
+    :param key:         int:            f.e. run and category
+    :return: child_seq: SeedSequence
+    """
+
+    return np.random.SeedSequence(
+        entropy=seed_seq.entropy,
+        spawn_key=seed_seq.spawn_key + tuple(int(k) for k in key),
+        pool_size=seed_seq.pool_size
+    )
+
+
+def place_drawoffs(p_norm_integral, p_drawoffs, drawoffs, drawoff_steps,
+                   max_flow_rate, water_LperH, runs=None, return_events=False):
+    """
+    Places drawoffs into the summed probability profile. Each drawoff gets
+    the first timestep at which p_norm_integral surpasses its probability as
+    a candidate (searchsorted). Conflicts with the max flow rate are then
+    resolved in bulk passes: at every timestep, drawoffs are accepted in the
+    order of their probability as long as the flow rate stays below the
+    maximum in all timesteps they occupy. Rejected drawoffs are moved one
+    timestep further and tried again in the next pass, like in the original
+    loop over p_norm_integral. Drawoffs that do not fit into the year anymore
+    are dropped.
+
+    Several runs can be placed at once: water_LperH is then a 2-D array with
+    one row per run and 'runs' holds the row of each drawoff. Runs do not
+    interfere with each other.
+
+    :param p_norm_integral:     array:  summed probability profile (sorted)
+    :param p_drawoffs:          array:  probability of each drawoff
+    :param drawoffs:            array:  flow rate of each drawoff in L/h
+    :param drawoff_steps:       int:    timesteps occupied by one drawoff
+    :param max_flow_rate:       float:  max flow rate of a timestep in L/h
+    :param water_LperH:         array:  flow rates that are already placed
+    :param runs:                array:  run (row) of each drawoff, optional
+    :param return_events:       bool:   also return the placed drawoffs
+    :return: water_LperH:       array:  flow rates including the new drawoffs
+    :return: water_LperH_cat:   array:  flow rates of the new drawoffs only
+    :return: events:            tuple:  (runs, starts, flow rates) of the
+                                        placed drawoffs, if return_events
+    """
+
+    p_norm_integral = np.asarray(p_norm_integral)
+    dtype = np.asarray(water_LperH).dtype
+    shape = np.shape(water_LperH)
+    n_steps = len(p_norm_integral)
+
+    # all runs are placed in one flat array, each run has its own segment.
+    water_LperH = np.array(water_LperH, dtype=float).ravel()
+    water_LperH_cat = np.zeros(len(water_LperH))
+
+    p_drawoffs = np.asarray(p_drawoffs)
+    if runs is None:
+        runs = np.zeros(len(p_drawoffs), dtype=int)
+    runs = np.asarray(runs)
+
+    # --- sort the drawoffs by their probability, which is their priority ---
+    order = np.lexsort((p_drawoffs, runs))
+    flows = np.asarray(drawoffs, dtype=float)[order]
+    run_offsets = runs[order] * n_steps
+
+    # --- candidate timestep: first one that surpasses the probability ---
+    candidates = np.searchsorted(p_norm_integral, p_drawoffs[order],
+                                 side='right')
+
+    last_start = n_steps - drawoff_steps
+    step_offsets = np.arange(drawoff_steps)
+    placed_lst = []
+
+    while True:
+
+        # drawoffs that would reach beyond the end of the year are dropped
+        inside = candidates <= last_start
+        candidates = candidates[inside]
+        flows = flows[inside]
+        run_offsets = run_offsets[inside]
+
+        if len(candidates) == 0:
+            break
+
+        # every drawoff occupies drawoff_steps rows. Rows are sorted by
+        # timestep, the priority order is kept inside each timestep.
+        row_steps = (run_offsets[:, None] + candidates[:, None]
+                     + step_offsets).ravel()
+        row_flows = np.repeat(flows, drawoff_steps)
+        row_order = np.argsort(row_steps, kind='stable')
+        sorted_steps = row_steps[row_order]
+        sorted_flows = row_flows[row_order]
+
+        # flow rate in each timestep if all drawoffs with a higher priority
+        # at that timestep would be placed as well.
+        new_step = np.ones(len(sorted_steps), dtype=bool)
+        new_step[1:] = sorted_steps[1:] != sorted_steps[:-1]
+        cum_flows = np.cumsum(sorted_flows)
+        group_offset = (cum_flows - sorted_flows)[new_step]
+        group_cum_flows = cum_flows - group_offset[np.cumsum(new_step) - 1]
+
+        sorted_fits = water_LperH[sorted_steps] + group_cum_flows \
+            <= max_flow_rate
+        row_fits = np.empty_like(sorted_fits)
+        row_fits[row_order] = sorted_fits
+
+        # a drawoff is placed if it fits into all timesteps it occupies
+        accepted = row_fits.reshape(-1, drawoff_steps).all(axis=1)
+        accepted_rows = np.repeat(accepted, drawoff_steps)
+        np.add.at(water_LperH, row_steps[accepted_rows],
+                  row_flows[accepted_rows])
+        np.add.at(water_LperH_cat, row_steps[accepted_rows],
+                  row_flows[accepted_rows])
+
+        if return_events:
+            placed_lst.append((run_offsets[accepted] // n_steps,
+                               candidates[accepted], flows[accepted]))
+
+        # rejected drawoffs try again in the next timestep
+        candidates = candidates[~accepted] + 1
+        flows = flows[~accepted]
+        run_offsets = run_offsets[~accepted]
+
+    water_LperH = water_LperH.reshape(shape).astype(dtype)
+    water_LperH_cat = water_LperH_cat.reshape(shape).astype(dtype)
+
+    if return_events:
+        events = tuple(np.concatenate([placed[i] for placed in placed_lst])
+                       if placed_lst else np.empty(0) for i in range(3))
+        return water_LperH, water_LperH_cat, events
+
+    return water_LperH, water_LperH_cat
+
+
+def generate_single_drawoff_inside_boundaries(cats_series, s_step, rng=None):
+    """
+    From the data of one category, generate a drawoff inside the defined
+    boundaries, similar to DHWcalc.
+
+    :param cats_series: df:     pandas series that holds the drawoff data
+    :param s_step:      int:    seconds in a timestep
+    :param rng:         rng:    Generator or seed
+    :return: drawoff:   int:    drawoff eevnt in L/h
+    """
+
+    rng = np.random.default_rng(rng)
+
+    # --- get mean and stddev from series ---
+    mu = cats_series['mean_flow_rate_per_drawoff_LperH']  # in L/h
+    sig = cats_series['stddev_flow_rate_per_drawoff_LperH']  # in L/h
+
+    # --- generate drawoff
+    drawoff = rng.normal(mu, sig)
+
+    # --- get min and max allowed flowrate
+    max_drawoff_flow_rate = cats_series['max_flow_rate_per_drawoff_LperH']
+    min_drawoff_flow_rate = cats_series['min_flow_rate_per_drawoff_LperH']
+
+    # --- set boundaries for drawoff
+    low_lim = max(float(mu - 2 * sig), min_drawoff_flow_rate)
+    up_lim = min(float(mu + 2 * sig), max_drawoff_flow_rate)
+
+    # --- if drawoff is outside boundaries, generate it again until its inside.
+    while drawoff < low_lim or drawoff > up_lim:
+        drawoff = rng.normal(mu, sig)
+
+    # --- DHWcalc uses a fixed flow rate step width rather than floats.
+    if s_step == 60:
+        flow_rate_step = 6
+    else:
+        flow_rate_step = 1
+    drawoff = flow_rate_step * round(drawoff / flow_rate_step)
+
+    return drawoff  # in L/h
+
+
+def generate_drawoffs_inside_boundaries(cats_series, s_step, rng=None,
+                                        V_max=None):
+    """
+    From the data of one category, generate all drawoffs of a year at once.
+    The flow rates are drawn from a normal distribution that is truncated to
+    the same boundaries as in 'generate_single_drawoff_inside_boundaries',
+    so no drawoff has to be generated again. Drawoffs are added until the
+    yearly volume of the category (mean_vol_per_year) is surpassed.
+
+    :param cats_series: df:     pandas series that holds the drawoff data
+    :param s_step:      int:    seconds in a timestep
+    :param rng:         rng:    Generator or seed
+    :param V_max:       float:  volume in L to surpass instead of the yearly
+                                volume, f.e. for a single day.
+    :return: drawoffs:  array:  drawoff events in L/h
+    """
+
+    rng = np.random.default_rng(rng)
+
+    # --- get mean and stddev from series ---
+    mu = cats_series['mean_flow_rate_per_drawoff_LperH']  # in L/h
+    sig = cats_series['stddev_flow_rate_per_drawoff_LperH']  # in L/h
+
+    # --- get min and max allowed flowrate
+    max_drawoff_flow_rate = cats_series['max_flow_rate_per_drawoff_LperH']
+    min_drawoff_flow_rate = cats_series['min_flow_rate_per_drawoff_LperH']
+
+    # --- set boundaries for drawoff, in units of the stddev
+    low_lim = max(float(mu - 2 * sig), min_drawoff_flow_rate)
+    up_lim = min(float(mu + 2 * sig), max_drawoff_flow_rate)
+    a, b = (low_lim - mu) / sig, (up_lim - mu) / sig
+
+    # --- DHWcalc uses a fixed flow rate step width rather than floats.
+    if s_step == 60:
+        flow_rate_step = 6
+    else:
+        flow_rate_step = 1
+
+    # --- volume of a drawoff with a flow rate of 1 L/h
+    drawoff_steps = int(cats_series['drawoff_duration_min'] * 60 / s_step)
+    vol_per_LperH = s_step / 3600 * drawoff_steps
+
+    if V_max is None:
+        V_max = cats_series['mean_vol_per_year']
+    drawoffs = np.empty(0, dtype=int)
+    V_curr = 0
+
+    # the batch size is estimated from the mean volume of a drawoff. If the
+    # truncation shifts the mean, another (smaller) batch is drawn.
+    while V_curr <= V_max:
+        size = int((V_max - V_curr) / cats_series['mean_vol_per_drawoff']
+                   * 1.1) + 10
+
+        batch = scipy.stats.truncnorm.rvs(a, b, loc=mu, scale=sig, size=size,
+                                          random_state=rng)
+        batch = (flow_rate_step * np.round(batch / flow_rate_step)).astype(int)
+
+        # stop at the first drawoff that surpasses V_max
+        V_cum = V_curr + np.cumsum(batch * vol_per_LperH)
+        no_drawoffs = np.searchsorted(V_cum, V_max, side='right') + 1
+        no_drawoffs = min(no_drawoffs, size)
+
+        drawoffs = np.concatenate([drawoffs, batch[:no_drawoffs]])
+        V_curr = V_cum[no_drawoffs - 1]
+
+    return drawoffs  # in L/h
+
+
+def compute_heat_profiles(water_LperH, temp_dT=35):
+    """
+    Array version of 'compute_heat'. Works on a single profile as well as on
+    the 2-D array of 'generate_dhw_profiles'. The heat per timestep in J is
+    Heat_W * s_step.
+
+    :param water_LperH:     array:  flow rates in L/h
+    :param temp_dT:         int:    temperature difference between freshwater
+                                    and average DHW outlet temperature. F.e.
+                                    35°C.
+
+    :return: heat_W:        array:  heat flow rates in W
+    """
+
+    return np.asarray(water_LperH) / 3600 * rho * cp * temp_dT
+
+
+def resample_profiles(water_LperH, s_step, s_step_output):
+    """
+    Array version of 'resample_water_series' for flow rates. The output
+    timestep has to be a multiple of the input timestep. The flow rates of
+    each output timestep are averaged along the last axis, so the volume
+    stays the same.
+
+    :param water_LperH:     array:  flow rates in L/h, one row per run
+    :param s_step:          int:    seconds in a timestep of the input
+    :param s_step_output:   int:    desired output seconds in a timestep
+    :return: water_LperH:   array:  resampled flow rates in L/h
+    """
+
+    water_LperH = np.asarray(water_LperH)
+    conversion_factor = s_step_output / s_step
+
+    assert conversion_factor % 1 == 0, \
+        's_step_output has to be a multiple of s_step'
+
+    if conversion_factor == 1:
+        return water_LperH
+
+    conversion_factor = int(conversion_factor)
+    shape = water_LperH.shape[:-1] + (-1, conversion_factor)
+
+    return water_LperH.reshape(shape).mean(axis=-1)
+
+
+class ProfilePyramid:
+    """
+    A profile at several resolutions. Each level stores per timestep the
+    sum, the max and the number of non-zero values of the base profile,
+    the mean follows from the sum. A level is built from the coarsest
+    level that is already built and whose timestep divides its timestep,
+    so the base profile is only read once. Levels are cached in the
+    pyramid, 'query' reads a time window of any level without touching the
+    base profile.
+    """
+
+    def __init__(self, values, s_step, s_steps=(360, 600, 900, 3600),
+                 start='2019-01-01'):
+        """
+        :param values:      array:  base profile, f.e. flow rates in L/h.
+                                    One row per run for multiple runs.
+        :param s_step:      int:    seconds in a timestep of the base
+        :param s_steps:     list:   timesteps of the levels that are built
+                                    right away
+        :param start:       str:    time of the first step
+        """
+
+        values = np.asarray(values)
+        self.s_step = s_step
+        self.start = pd.Timestamp(start)
+        self.levels = {
+            s_step: {
+                'sum': values,
+                'max': values,
+                'count': (values != 0).astype(np.int32)
+            }
+        }
+
+        for s_step_level in sorted(s_steps):
+            self.get_level(s_step_level)
+
+    def __repr__(self):
+        return 'ProfilePyramid(s_step={}, levels={})'.format(
+            self.s_step, sorted(self.levels))
+
+    @property
+    def n_steps(self):
+        """
+        number of timesteps of the base profile
+        """
+        return self.levels[self.s_step]['sum'].shape[-1]
+
+    def get_level(self, s_step):
+        """
+        sums, maxima and non-zero counts with a timestep of s_step, built
+        and cached on the first call.
+
+        :param s_step:      int:    a multiple of the base timestep that
+                                    divides the length of the profile
+        :return: level:     dict:   arrays 'sum', 'max' and 'count'
+        """
+
+        if s_step in self.levels:
+            return self.levels[s_step]
+
+        factor = s_step / self.s_step
+        if factor % 1 != 0 or self.n_steps % factor != 0:
+            raise Exception('s_step {} does not fit the base timestep {} and '
+                            '{} steps'.format(s_step, self.s_step,
+                                              self.n_steps))
+
+        # --- the coarsest level that divides the new one ---
+        s_step_parent = max(level for level in self.levels
+                            if s_step % level == 0)
+        parent = self.levels[s_step_parent]
+        factor = s_step // s_step_parent
+        shape = parent['sum'].shape[:-1] + (-1, factor)
+
+        sums = parent['sum'].reshape(shape)
+        if s_step_parent == self.s_step and sums.dtype.kind in 'iub':
+            sums = sums.astype(np.int64)  # no overflow of f.e. int16
+
+        self.levels[s_step] = {
+            'sum': sums.sum(axis=-1),
+            'max': parent['max'].reshape(shape).max(axis=-1),
+            'count': parent['count'].reshape(shape).sum(axis=-1)
+        }
+
+        return self.levels[s_step]
+
+    def get_index(self, s_step, start=None, end=None):
+        """
+        positions of the timesteps of a level in a time window.
+
+        :param s_step:      int:    timestep of the level
+        :param start:       str:    first time of the window, default: start
+        :param end:         str:    end of the window (not included),
+                                    default: end of the profile
+        :return: window:    slice
+        """
+
+        n_steps = self.n_steps * self.s_step // s_step
+
+        first = 0
+        if start is not None:
+            first = (pd.Timestamp(start) - self.start).total_seconds() \
+                // s_step
+        last = n_steps
+        if end is not None:
+            last = -((self.start - pd.Timestamp(end)).total_seconds()
+                     // s_step)
+
+        return slice(int(min(max(first, 0), n_steps)),
+                     int(min(max(last, 0), n_steps)))
+
+    def query(self, s_step, start=None, end=None):
+        """
+        a time window of a level. Only the window is read.
+
+        :param s_step:      int:    timestep of the level
+        :param start:       str:    first time of the window, default: start
+        :param end:         str:    end of the window (not included),
+                                    default: end of the profile
+        :return: window:    dict:   'index' (DatetimeIndex) and the arrays
+                                    'sum', 'mean', 'max' and 'count'
+        """
+
+        level = self.get_level(s_step)
+        window = self.get_index(s_step, start, end)
+
+        sums = level['sum'][..., window]
+
+        return {
+            'index': pd.date_range(
+                start=self.start + pd.Timedelta(seconds=window.start * s_step),
+                periods=window.stop - window.start, freq=str(s_step) + 'S'),
+            'sum': sums,
+            'mean': sums / (s_step // self.s_step),
+            'max': level['max'][..., window],
+            'count': level['count'][..., window]
+        }
+
+
+def compute_storage_load(heat_J, s_step, V_stor=300, dT_stor=55,
+                         dT_threshhold=10, Qcon_flow_max=5000,
+                         with_losses=True):
+    """
+    Array version of the storage model in 'convert_dhw_load_to_storage_load'
+    (see OpenDHW_Utilities) for a whole profile, see 'StorageModel'. The
+    storage starts full.
+
+    :param heat_J:              array:  DHW demand in J per timestep
+    :param s_step:              int:    seconds in a timestep
+    :param V_stor:              float:  storage volume in L
+    :param dT_stor:             float:  max dT in the storage
+    :param dT_threshhold:       float:  max dT drop before re-heating
+    :param Qcon_flow_max:       float:  heat flow rate of the heat pump in W
+    :param with_losses:         bool:   0.1 % of the content is lost per hour
+    :return: storage_load_J:    array:  heat added to the storage per step
+    :return: losses_J:          array:  losses per timestep
+    :return: level_J:           array:  content at the start of each step
+    """
+
+    storage = StorageModel(s_step=s_step, V_stor=V_stor, dT_stor=dT_stor,
+                           dT_threshhold=dT_threshhold,
+                           Qcon_flow_max=Qcon_flow_max,
+                           with_losses=with_losses)
+
+    return storage.step_block(heat_J)
+
+
+@dataclasses.dataclass
+class StorageModel:
+    """
+    Storage model of 'convert_dhw_load_to_storage_load' with an explicit
+    state, so it can also be driven step by step, f.e. from a co-simulation.
+    Once the content drops below the dT threshold, the storage is re-heated
+    with Qcon_flow_max until it is full again. The heat of a step is added
+    in the following step. The storage starts full.
+
+    The state is the content (Q_storr_curr), the heat that is added in the
+    next step (load_prev) and whether the heater is on (fill_storage).
+    'to_dict' and 'from_dict' save and restore the parameters together with
+    the state.
+
+    'step' simulates one timestep. 'step_block' simulates many timesteps,
+    where only drawoffs and heater switches are simulated one by one and
+    longer stretches in between follow the loss decay (with or without
+    heating) in closed form. Both match the stepwise model up to floating
+    point rounding.
+    """
+
+    s_step: int
+    V_stor: float = 300
+    dT_stor: float = 55
+    dT_threshhold: float = 10
+    Qcon_flow_max: float = 5000
+    with_losses: bool = True
+    Q_storr_curr: float = None
+    load_prev: float = 0
+    fill_storage: bool = False
+
+    def __post_init__(self):
+        if self.Q_storr_curr is None:
+            self.Q_storr_curr = self.Q_full
+
+    @property
+    def Q_full(self):
+        """
+        content of the full storage in J
+        """
+        return self.V_stor * rho * cp * self.dT_stor
+
+    @property
+    def dQ_threshhold(self):
+        """
+        drop of the content in J before the storage is re-heated
+        """
+        return self.V_stor * rho * cp * self.dT_threshhold
+
+    @property
+    def Q_dh_timestep(self):
+        """
+        heat added in one timestep while the heater is on
+        """
+        return self.Qcon_flow_max * self.s_step
+
+    @property
+    def loss_rate(self):
+        """
+        share of the content lost per timestep, 0.1 % per hour
+        """
+        return 0.001 * self.s_step / 3600 if self.with_losses else 0
+
+    def get_state(self):
+        """
+        the state as a dictionary of plain Python values
+        """
+        return {'Q_storr_curr': float(self.Q_storr_curr),
+                'load_prev': float(self.load_prev),
+                'fill_storage': bool(self.fill_storage)}
+
+    def set_state(self, state):
+        """
+        restores a state from 'get_state'
+        """
+        self.Q_storr_curr = state['Q_storr_curr']
+        self.load_prev = state['load_prev']
+        self.fill_storage = state['fill_storage']
+
+    def to_dict(self):
+        """
+        parameters and state, f.e. to save them as json
+        """
+        return {**dataclasses.asdict(self), **self.get_state()}
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        storage from 'to_dict'
+        """
+        return cls(**params)
+
+    def step(self, dem_step):
+        """
+        one timestep.
+
+        :param dem_step:            float:  DHW demand in J in this step
+        :return: storage_load_J:    float:  heat added to the storage
+        :return: losses_J:          float:  losses in this step
+        :return: level_J:           float:  content at the start of the step
+        """
+
+        level_J = self.Q_storr_curr
+        if self.with_losses:
+            losses_J = (level_J * 0.001 * self.s_step) / 3600
+        else:
+            losses_J = 0
+
+        self.Q_storr_curr, self.load_prev, self.fill_storage = step_storage(
+            self.Q_storr_curr, self.load_prev, self.fill_storage, dem_step,
+            self.s_step, self.Q_full, self.dQ_threshhold, self.Q_dh_timestep,
+            self.with_losses)
+
+        return self.load_prev, losses_J, level_J
+
+    def step_block(self, heat_J):
+        """
+        many timesteps, starting from the current state.
+
+        :param heat_J:              array:  DHW demand in J per timestep
+        :return: storage_load_J:    array:  heat added to the storage
+        :return: losses_J:          array:  losses per timestep
+        :return: level_J:           array:  content at the start of each step
+        """
+
+        s_step = self.s_step
+        Q_full = self.Q_full
+        dQ_threshhold = self.dQ_threshhold
+        Q_dh_timestep = self.Q_dh_timestep
+        loss_rate = self.loss_rate
+        with_losses = self.with_losses
+
+        heat_J = np.asarray(heat_J, dtype=float)
+        n_steps = len(heat_J)
+
+        # --- steps with a drawoff, the state is simulated stepwise there ---
+        demand_steps = np.flatnonzero(heat_J).tolist() + [n_steps]
+        demand = heat_J[demand_steps[:-1]].tolist()
+
+        # stepwise simulated steps: index, level at the start, load
+        step_t, step_level, step_load = [], [], []
+        # stretches in closed form: first index, length, start level, load
+        jump_t, jump_n, jump_level, jump_load = [], [], [], []
+
+        Q_storr_curr = self.Q_storr_curr
+        load_prev = self.load_prev
+        fill_storage = self.fill_storage
+        t_step = 0
+
+        for i, next_demand in enumerate(demand_steps):
+
+            while t_step <= next_demand and t_step < n_steps:
+                n_free = next_demand - t_step
+
+                # --- jump to the next switch of the heater or drawoff ---
+                if n_free > min_storage_jump:
+                    n_free = min(n_free, get_steps_to_storage_switch(
+                        Q_storr_curr, load_prev, fill_storage, loss_rate,
+                        Q_full, dQ_threshhold) - 1)
+                    if n_free > 0:
+                        jump_t.append(t_step)
+                        jump_n.append(n_free)
+                        jump_level.append(Q_storr_curr)
+                        jump_load.append(load_prev)
+                        Q_storr_curr = get_storage_level(
+                            Q_storr_curr, load_prev, loss_rate, n_free)
+                        t_step += n_free
+                        continue
+
+                # --- one step, with the drawoff at the end of the stretch ---
+                step_t.append(t_step)
+                step_level.append(Q_storr_curr)
+                dem_step = demand[i] if t_step == next_demand else 0
+                Q_storr_curr, load_prev, fill_storage = step_storage(
+                    Q_storr_curr, load_prev, fill_storage, dem_step, s_step,
+                    Q_full, dQ_threshhold, Q_dh_timestep, with_losses)
+                step_load.append(load_prev)
+                t_step += 1
+
+        self.Q_storr_curr = Q_storr_curr
+        self.load_prev = load_prev
+        self.fill_storage = fill_storage
+
+        # --- dense arrays ---
+        storage_load_J = np.zeros(n_steps)
+        level_J = np.zeros(n_steps)
+
+        storage_load_J[step_t] = step_load
+        level_J[step_t] = step_level
+
+        jump_n = np.array(jump_n, dtype=int)
+        jump_id = np.repeat(np.arange(len(jump_n)), jump_n)
+        k = np.arange(jump_n.sum()) - np.repeat(jump_n.cumsum() - jump_n,
+                                                jump_n)
+        t_jump = np.array(jump_t, dtype=int)[jump_id] + k
+        storage_load_J[t_jump] = np.array(jump_load, dtype=float)[jump_id]
+        level_J[t_jump] = get_storage_level(
+            np.array(jump_level, dtype=float)[jump_id],
+            storage_load_J[t_jump], loss_rate, k)
+
+        if with_losses:
+            losses_J = (level_J * 0.001 * s_step) / 3600  # 0,1% Loss/Hour
+        else:
+            losses_J = np.zeros(n_steps)
+
+        return storage_load_J, losses_J, level_J
+
+
+@dataclasses.dataclass(eq=False)
+class StratifiedStorageModel:
+    """
+    Stratified storage (german: "Schichtspeicher") with n_layers layers of
+    the same volume, layer 0 at the bottom. The layer temperatures are
+    given as dT above the cold water. The storage starts full (all layers
+    at dT_stor).
+
+    A drawoff takes hot water from the top and lets cold water in at the
+    bottom. The volume follows from the actual temperatures of the top
+    layers, so the demand is met as long as there is heat in the storage
+    (see 'get_draw_shift'). The layers move up by this share of a layer,
+    mixing the neighbouring layers. What the storage can not deliver is
+    the unmet demand. The inflowing cold water mixes with the
+    mixing_layers lowest layers.
+
+    The heater takes water at the heater_layer and returns it heated to
+    dT_stor at the top, so the layers above the heater move down with a
+    flow that transfers Qcon_flow_max. Layers below the heater are not
+    heated. The heater is switched on once the sensor_layer (default: the
+    middle) drops below dT_stor - dT_threshhold, and switched off once
+    the heater_layer is within dT_off of dT_stor.
+
+    Like 'StorageModel', 0.1 % of the content is lost per hour, and 'step'
+    and 'step_block' continue from the current state. All layers are
+    updated together with array operations. step_block also simulates many
+    profiles at once, with one row per profile. Stretches where all heaters
+    are off and there is no demand follow the loss decay in closed form.
+    """
+
+    s_step: int
+    V_stor: float = 300
+    dT_stor: float = 55
+    dT_threshhold: float = 10
+    Qcon_flow_max: float = 5000
+    with_losses: bool = True
+    n_layers: int = 10
+    heater_layer: int = 0
+    sensor_layer: int = None
+    mixing_layers: int = 1
+    dT_off: float = 1
+    dT_layers: np.ndarray = None
+    fill_storage: np.ndarray = False
+
+    def __post_init__(self):
+        if self.sensor_layer is None:
+            self.sensor_layer = self.n_layers // 2
+        if self.dT_layers is None:
+            self.dT_layers = np.full(self.n_layers, float(self.dT_stor))
+        self.dT_layers = np.array(self.dT_layers, dtype=float)
+        self.fill_storage = np.array(self.fill_storage, dtype=bool)
+
+        if not 0 <= self.heater_layer < self.n_layers or \
+                not 0 <= self.sensor_layer < self.n_layers:
+            raise Exception('heater_layer and sensor_layer have to be '
+                            'between 0 and n_layers - 1')
+
+    @property
+    def Q_full(self):
+        """
+        content of the full storage in J
+        """
+        return self.V_stor * rho * cp * self.dT_stor
+
+    @property
+    def C_layer(self):
+        """
+        heat capacity of one layer in J/K
+        """
+        return self.V_stor * rho * cp / self.n_layers
+
+    @property
+    def Q_dh_timestep(self):
+        """
+        heat added in one timestep while the heater is on
+        """
+        return self.Qcon_flow_max * self.s_step
+
+    @property
+    def loss_rate(self):
+        """
+        share of the content lost per timestep, 0.1 % per hour
+        """
+        return 0.001 * self.s_step / 3600 if self.with_losses else 0
+
+    @property
+    def Q_storr_curr(self):
+        """
+        content in J
+        """
+        return self.C_layer * self.dT_layers.sum(axis=-1)
+
+    def get_state(self):
+        """
+        the state as a dictionary of plain Python values
+        """
+        return {'dT_layers': self.dT_layers.tolist(),
+                'fill_storage': self.fill_storage.tolist()}
+
+    def set_state(self, state):
+        """
+        restores a state from 'get_state'
+        """
+        self.dT_layers = np.array(state['dT_layers'], dtype=float)
+        self.fill_storage = np.array(state['fill_storage'], dtype=bool)
+
+    def to_dict(self):
+        """
+        parameters and state, f.e. to save them as json
+        """
+        params = {field.name: getattr(self, field.name)
+                  for field in dataclasses.fields(self)}
+        return {**params, **self.get_state()}
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        storage from 'to_dict'
+        """
+        return cls(**params)
+
+    def step(self, dem_step, return_unmet=False):
+        """
+        one timestep.
+
+        :param dem_step:            float:  DHW demand in J in this step,
+                                            one per profile
+        :param return_unmet:        bool:   also return the unmet demand
+        :return: storage_load_J:    float:  heat added to the storage
+        :return: losses_J:          float:  losses in this step
+        :return: level_J:           float:  content at the start of the step
+        :return: unmet_J:           float:  demand the storage could not
+                                            deliver (only with return_unmet)
+        """
+
+        dem_step = np.asarray(dem_step, dtype=float)[..., np.newaxis]
+        results = self.step_block(dem_step, return_unmet=return_unmet)
+
+        return tuple(result[..., 0] for result in results)
+
+    def step_block(self, heat_J, return_unmet=False):
+        """
+        many timesteps, starting from the current state.
+
+        :param heat_J:              array:  DHW demand in J per timestep, or
+                                            one row per profile
+        :param return_unmet:        bool:   also return the unmet demand
+        :return: storage_load_J:    array:  heat added to the storage
+        :return: losses_J:          array:  losses per timestep
+        :return: level_J:           array:  content at the start of each step
+        :return: unmet_J:           array:  demand the storage could not
+                                            deliver (only with return_unmet)
+        """
+
+        heat_J = np.asarray(heat_J, dtype=float)
+        single = heat_J.ndim == 1
+        heat_J = np.atleast_2d(heat_J)
+        n_profiles, n_steps = heat_J.shape
+
+        dT_layers = np.broadcast_to(
+            self.dT_layers, (n_profiles, self.n_layers)).copy()
+        fill_storage = np.broadcast_to(
+            self.fill_storage, (n_profiles,)).copy()
+
+        C_layer = self.C_layer
+        loss_rate = self.loss_rate
+        dT_on = self.dT_stor - self.dT_threshhold
+        above_heater = np.arange(self.n_layers) >= self.heater_layer
+
+        storage_load_J = np.zeros((n_profiles, n_steps))
+        losses_J = np.zeros((n_profiles, n_steps))
+        level_J = np.zeros((n_profiles, n_steps))
+        unmet_J = np.zeros((n_profiles, n_steps))
+
+        demand_steps = np.flatnonzero(heat_J.any(axis=0))
+
+        t_step = 0
+        while t_step < n_steps:
+            Q_storr_curr = C_layer * dT_layers.sum(axis=1)
+
+            # --- jump while all heaters are off and there is no demand ---
+            if not fill_storage.any():
+                i = np.searchsorted(demand_steps, t_step)
+                next_demand = demand_steps[i] if i < len(demand_steps) \
+                    else n_steps
+                n_free = next_demand - t_step
+                if n_free > 1:
+                    n_free = min(n_free, get_steps_to_sensor_switch(
+                        dT_layers[:, self.sensor_layer], dT_on,
+                        loss_rate) - 2)
+
+                if n_free > 1:
+                    decay = (1 - loss_rate) ** np.arange(n_free)
+                    levels = Q_storr_curr[:, np.newaxis] * decay
+                    level_J[:, t_step:t_step + n_free] = levels
+                    losses_J[:, t_step:t_step + n_free] = levels * loss_rate
+                    dT_layers *= (1 - loss_rate) ** n_free
+                    t_step += n_free
+                    continue
+
+            # --- one step ---
+            level_J[:, t_step] = Q_storr_curr
+            losses_J[:, t_step] = Q_storr_curr * loss_rate
+            dT_layers *= 1 - loss_rate
+
+            dem_step = heat_J[:, t_step]
+            if dem_step.any():
+                # hot water out at the top, cold water in at the bottom
+                shift, unmet_J[:, t_step] = get_draw_shift(
+                    dT_layers, dem_step, C_layer)
+                dT_layers = shift_layers(dT_layers, shift, 0, self.dT_stor)
+                if self.mixing_layers > 1:
+                    mixed = dT_layers[:, :self.mixing_layers]
+                    mixed[dem_step > 0] = mixed[dem_step > 0].mean(
+                        axis=1, keepdims=True)
+
+            if fill_storage.any():
+                # heated water in at the top, out at the heater
+                dT_heater = dT_layers[:, self.heater_layer]
+                shift = self.Q_dh_timestep / (C_layer * np.maximum(
+                    self.dT_stor - dT_heater, self.dT_off))
+                shift = np.minimum(shift, self.n_layers - self.heater_layer)
+                Q_before = C_layer * dT_layers.sum(axis=1)
+                dT_layers = np.where(
+                    fill_storage[:, np.newaxis] & above_heater,
+                    shift_layers(dT_layers, -shift, 0, self.dT_stor),
+                    dT_layers)
+                storage_load_J[:, t_step] = \
+                    C_layer * dT_layers.sum(axis=1) - Q_before
+
+            # --- heater control ---
+            fill_storage = np.where(
+                dT_layers[:, self.heater_layer] >= self.dT_stor - self.dT_off,
+                False,
+                fill_storage | (dT_layers[:, self.sensor_layer] < dT_on))
+            t_step += 1
+
+        self.dT_layers = dT_layers[0] if single else dT_layers
+        self.fill_storage = fill_storage[0] if single else fill_storage
+
+        results = (storage_load_J, losses_J, level_J)
+        if return_unmet:
+            results += (unmet_J,)
+
+        if single:
+            return tuple(result[0] for result in results)
+
+        return results
+
+
+def get_draw_shift(dT_layers, dem_step, C_layer):
+    """
+    share of the layers a drawoff takes from the top of a stratified
+    storage, so that the heat of the water taken equals the demand. The
+    heat of the top k layers is known for whole k, in between it is linear
+    (like the mixing in 'shift_layers'). If the whole storage holds less
+    heat than the demand, all of it is taken and the rest is unmet.
+
+    :param dT_layers:       array:  dT of the layers, one row per profile
+    :param dem_step:        array:  demand in J, one per profile
+    :param C_layer:         float:  heat capacity of one layer in J/K
+    :return: shift:         array:  layers to move up, one per profile
+    :return: unmet_J:       array:  demand that can not be delivered
+    """
+
+    n_profiles, n_layers = dT_layers.shape
+    rows = np.arange(n_profiles)
+
+    # heat of the top k layers, k = 0 ... n_layers
+    Q_top = np.zeros((n_profiles, n_layers + 1))
+    np.cumsum(dT_layers[:, ::-1], axis=1, out=Q_top[:, 1:])
+    Q_top *= C_layer
+
+    delivered = np.minimum(dem_step, Q_top[:, -1])
+
+    # first k whose top layers hold the delivered heat
+    k = np.count_nonzero(Q_top < delivered[:, np.newaxis], axis=1)
+    k_lower = np.maximum(k - 1, 0)
+    Q_lower = Q_top[rows, k_lower]
+    dQ = Q_top[rows, k] - Q_lower
+
+    shift = k_lower + np.divide(delivered - Q_lower, dQ,
+                                out=np.zeros(n_profiles), where=dQ > 0)
+
+    return shift, dem_step - delivered
+
+
+def shift_layers(dT_layers, shift, dT_bottom, dT_top):
+    """
+    moves the water in the layers of a stratified storage up (shift > 0,
+    inflow at the bottom) or down (shift < 0, inflow at the top) by a share
+    of a layer. Between the layers, the temperatures are interpolated
+    linearly, which mixes neighbouring layers.
+
+    :param dT_layers:       array:  dT of the layers, one row per profile
+    :param shift:           array:  layers to move, one per profile
+    :param dT_bottom:       float:  dT of the water flowing in at the bottom
+    :param dT_top:          float:  dT of the water flowing in at the top
+    :return: dT_layers:     array
+    """
+
+    n_profiles, n_layers = dT_layers.shape
+
+    dT_padded = np.empty((n_profiles, n_layers + 2))
+    dT_padded[:, 0] = dT_bottom
+    dT_padded[:, 1:-1] = dT_layers
+    dT_padded[:, -1] = dT_top
+    dT_padded = dT_padded.ravel()
+
+    # position of the water that ends up in each layer, -1 and n_layers are
+    # the inflows at the bottom and the top
+    position = np.arange(n_layers) - shift[:, np.newaxis]
+    np.maximum(position, -1, out=position)
+    np.minimum(position, n_layers, out=position)
+    lower = np.floor(position)
+    weight = position - lower
+
+    # index in the flat padded array
+    lower = lower.astype(np.intp) + 1
+    lower += (n_layers + 2) * np.arange(n_profiles)[:, np.newaxis]
+    upper = lower + (position < n_layers)
+
+    return dT_padded[lower] + weight * (dT_padded[upper] - dT_padded[lower])
+
+
+def get_steps_to_sensor_switch(dT_sensor, dT_on, loss_rate):
+    """
+    number of steps without demand and heating until the first sensor of a
+    stratified storage drops below dT_on by losses alone.
+
+    :return: k:     int:    a large number if it never happens
+    """
+
+    if loss_rate == 0 or dT_on <= 0:
+        return 2 ** 62
+    if np.any(dT_sensor < dT_on):
+        return 1
+
+    k = np.log(dT_on / dT_sensor) / np.log(1 - loss_rate)
+
+    return int(np.floor(k.min())) + 1
+
+
+def step_storage(Q_storr_curr, load_prev, fill_storage, dem_step, s_step,
+                 Q_full, dQ_threshhold, Q_dh_timestep, with_losses):
+    """
+    one timestep of the storage model in 'StorageModel'.
+
+    :return: Q_storr_curr:  float:  content after the step
+    :return: load_prev:     float:  heat added in the step
+    :return: fill_storage:  bool:   heater is on
+    """
+
+    if with_losses:
+        Q_loss = (Q_storr_curr * 0.001 * s_step) / 3600  # 0,1% Loss/Hour
+    else:
+        Q_loss = 0
+
+    Q_storr_curr = Q_storr_curr - dem_step - Q_loss + load_prev
+
+    if Q_storr_curr >= Q_full:  # storage full, dont fill it!
+        fill_storage = False
+        load_prev = 0
+
+    elif Q_storr_curr > Q_full - dQ_threshhold:  # between thresholds
+        load_prev = Q_dh_timestep if fill_storage else 0
+
+    else:  # storage below dT Threshhold, fill it!
+        fill_storage = True
+        load_prev = Q_dh_timestep
+
+    return Q_storr_curr, load_prev, fill_storage
+
+
+def get_storage_level(Q_storr_curr, load_prev, loss_rate, k):
+    """
+    content of the storage after k steps without demand, with a constant
+    load per step: Q_k+1 = (1 - loss_rate) * Q_k + load_prev. Works on
+    floats and on arrays.
+    """
+
+    if loss_rate == 0:
+        return Q_storr_curr + load_prev * k
+
+    Q_steady = load_prev / loss_rate  # content where load and losses match
+
+    return Q_steady + (Q_storr_curr - Q_steady) * (1 - loss_rate) ** k
+
+
+def get_steps_to_storage_switch(Q_storr_curr, load_prev, fill_storage,
+                                loss_rate, Q_full, dQ_threshhold):
+    """
+    number of steps without demand until the heater switches: a heated
+    storage is switched off once it is full, an unheated one is switched on
+    once its losses pull it below the threshold. The step is estimated in
+    closed form and then checked against 'get_storage_level'.
+
+    :return: k:     int:    the switch happens in the k-th step, a large
+                            number if it never happens
+    """
+
+    never = 2 ** 62
+
+    if fill_storage:
+        def switched(k):
+            return get_storage_level(
+                Q_storr_curr, load_prev, loss_rate, k) >= Q_full
+
+        if loss_rate == 0:
+            if load_prev <= 0:
+                return never
+            k = (Q_full - Q_storr_curr) / load_prev
+        else:
+            Q_steady = load_prev / loss_rate
+            if Q_steady <= Q_full:
+                return never
+            k = math.log((Q_steady - Q_full) / (Q_steady - Q_storr_curr)) \
+                / math.log(1 - loss_rate)
+    else:
+        threshhold = Q_full - dQ_threshhold
+
+        def switched(k):
+            return get_storage_level(
+                Q_storr_curr, load_prev, loss_rate, k) <= threshhold
+
+        if loss_rate == 0 or load_prev != 0 or threshhold <= 0:
+            return never
+        k = math.log(threshhold / Q_storr_curr) / math.log(1 - loss_rate)
+
+    # --- rounding of the estimate ---
+    k = max(math.ceil(k), 1)
+    while k > 1 and switched(k - 1):
+        k -= 1
+    while not switched(k):
+        k += 1
+
+    return k
+
+
+@dataclasses.dataclass
+class StorageSummary:
+    """
+    Post-processing of a storage load (see 'summarize_storage_load'): the
+    cumulative curves (german: "Summenlinien") and the energy balance in
+    kWh, and the number of peaks of the demand and of heating cycles of the
+    storage.
+    """
+
+    heat_sumline_kWh: np.ndarray
+    storage_load_sumline_kWh: np.ndarray
+    heat_kWh: float
+    storage_load_kWh: float
+    losses_kWh: float
+    dhw_peaks: int
+    storage_cycles: int
+    days: float
+    unmet_kWh: float = 0.0
+
+    @property
+    def balance_kWh(self):
+        """
+        DHW - Unmet + Losses - StorageLoad. Positive if the storage ends up
+        emptier than it started.
+        """
+        return self.heat_kWh - self.unmet_kWh + self.losses_kWh \
+            - self.storage_load_kWh
+
+    @property
+    def dhw_peaks_per_day(self):
+        return self.dhw_peaks / self.days
+
+    @property
+    def storage_cycles_per_day(self):
+        return self.storage_cycles / self.days
+
+
+def summarize_storage_load(heat_J, storage_load_J, losses_J, s_step,
+                           Q_full, unmet_J=None):
+    """
+    cumulative curves, energy balance and peak counts of a storage load,
+    see 'StorageSummary'.
+
+    :param heat_J:              array:  DHW demand in J per timestep
+    :param storage_load_J:      array:  heat added to the storage per step
+    :param losses_J:            array:  losses per timestep
+    :param s_step:              int:    seconds in a timestep
+    :param Q_full:              float:  content of the full storage in J
+    :param unmet_J:             array:  demand the storage could not deliver
+    :return: summary:           StorageSummary
+    """
+
+    heat_kWh = np.asarray(heat_J, dtype=float) / (3600 * 1000)
+    storage_load_kWh = np.asarray(storage_load_J, dtype=float) / (3600 * 1000)
+    losses_kWh = np.asarray(losses_J, dtype=float) / (3600 * 1000)
+
+    if unmet_J is None:
+        unmet_kWh = 0.0
+    else:
+        unmet_kWh = float(np.sum(unmet_J)) / (3600 * 1000)
+
+    # the storage starts full
+    storage_load_sumline_kWh = np.cumsum(storage_load_kWh - losses_kWh) \
+        + Q_full / (3600 * 1000)
+
+    return StorageSummary(
+        heat_sumline_kWh=np.cumsum(heat_kWh),
+        storage_load_sumline_kWh=storage_load_sumline_kWh,
+        heat_kWh=float(heat_kWh.sum()),
+        storage_load_kWh=float(storage_load_kWh.sum()),
+        losses_kWh=float(losses_kWh.sum()),
+        dhw_peaks=count_peaks(heat_J),
+        storage_cycles=count_peaks(storage_load_J),
+        days=len(heat_kWh) * s_step / (24 * 3600),
+        unmet_kWh=unmet_kWh
+    )
+
+
+def count_peaks(values):
+    """
+    number of clusters of non-zero values ("peaks"). One peak is comprised
+    by 2 HP mode switches.
+
+    :param values:      array
+    :return: n_peaks:   int
+    """
+
+    non_zero = np.asarray(values) != 0
+    if len(non_zero) == 0:
+        return 0
+
+    return int(non_zero[0]) + int(np.count_nonzero(non_zero[1:] &
+                                                   ~non_zero[:-1]))
+
+
+def get_storage_configs(**params):
+    """
+    all combinations of storage parameters, f.e.
+    get_storage_configs(V_stor=[150, 300], Qcon_flow_max=[2000, 5000]).
+    Parameters that are not given keep the defaults of
+    'compute_storage_load'.
+
+    :param params:          list:   values of V_stor, dT_stor, dT_threshhold
+                                    and Qcon_flow_max
+    :return: configs_df:    df:     one row per storage configuration
+    """
+
+    values = {'V_stor': [300], 'dT_stor': [55], 'dT_threshhold': [10],
+              'Qcon_flow_max': [5000]}
+
+    for key, value in params.items():
+        if key not in values:
+            raise Exception('Unknown storage parameter {}'.format(key))
+        values[key] = np.atleast_1d(value)
+
+    index = pd.MultiIndex.from_product(list(values.values()),
+                                       names=list(values.keys()))
+
+    return index.to_frame(index=False)
+
+
+def sweep_storage_load(heat_J, s_step, configs_df, with_losses=True):
+    """
+    Simulates one DHW demand with many storage configurations at once (see
+    'compute_storage_load' for the model). The state of all storages is
+    kept in arrays. While its heater does not switch, the content of a
+    storage after each drawoff follows in closed form from the demand
+    filtered by the losses (see 'get_sweep_events'). So each storage runs
+    on its own from heater switch to heater switch, every iteration looks
+    ahead 'sweep_window' drawoffs for all storages that are not done yet.
+
+    The minimum state of charge is the lowest content at the start of a
+    step relative to the full storage. The model lets the content drop below
+    zero, the unmet demand is the part of the drawoffs that was taken from
+    an empty storage.
+
+    :param heat_J:              array:  DHW demand in J per timestep
+    :param s_step:              int:    seconds in a timestep
+    :param configs_df:          df:     one row per storage with the columns
+                                        V_stor, dT_stor, dT_threshhold and
+                                        Qcon_flow_max, see
+                                        'get_storage_configs'
+    :param with_losses:         bool:   0.1 % of the content is lost per hour
+    :return: kpis_df:           df:     configs_df with the annual storage
+                                        load, losses and unmet demand in kWh,
+                                        the charge cycles and the min SOC
+    """
+
+    configs_df = pd.DataFrame(configs_df).reset_index(drop=True)
+    for key, default in [('V_stor', 300), ('dT_stor', 55),
+                         ('dT_threshhold', 10), ('Qcon_flow_max', 5000)]:
+        if key not in configs_df:
+            configs_df[key] = default
+
+    n_configs = len(configs_df)
+    m_w = configs_df['V_stor'].to_numpy(dtype=float) * rho
+    Q_full = m_w * cp * configs_df['dT_stor'].to_numpy(dtype=float)
+
+    # --- parameters, state and kpis of the storages that are not done ---
+    storages = {
+        'config': np.arange(n_configs),
+        'Q_full': Q_full,
+        'threshhold': Q_full - m_w * cp * configs_df[
+            'dT_threshhold'].to_numpy(dtype=float),
+        'Q_dh_timestep': configs_df['Qcon_flow_max'].to_numpy(
+            dtype=float) * s_step,
+        'Q': Q_full.copy(),  # the storages start full
+        'fill': np.zeros(n_configs, dtype=bool),
+        't_step': np.zeros(n_configs, dtype=np.int64),
+        'event': np.zeros(n_configs, dtype=np.int64),
+        'y': np.zeros(n_configs),
+        'storage_load_J': np.zeros(n_configs),
+        'losses_J': np.zeros(n_configs),
+        'unmet_J': np.zeros(n_configs),
+        'charge_cycles': np.zeros(n_configs, dtype=int),
+        'min_level_J': Q_full.copy()
+    }
+    kpis = {key: storages[key].copy() for key in [
+        'storage_load_J', 'losses_J', 'unmet_J', 'charge_cycles',
+        'min_level_J']}
+
+    heat_J = np.asarray(heat_J, dtype=float)
+    n_steps = len(heat_J)
+    loss_rate = 0.001 * s_step / 3600 if with_losses else 0
+    events = get_sweep_events(heat_J, loss_rate)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while len(storages['config']):
+            advance_storage_configs(storages, events, loss_rate)
+
+            done = storages['t_step'] >= n_steps
+            if done.any():
+                for key in kpis:
+                    kpis[key][storages['config'][done]] = storages[key][done]
+                storages = {key: value[~done]
+                            for key, value in storages.items()}
+
+    kpis_df = configs_df.copy()
+    kpis_df['storage_load_kWh'] = kpis['storage_load_J'] / (3600 * 1000)
+    kpis_df['losses_kWh'] = kpis['losses_J'] / (3600 * 1000)
+    kpis_df['charge_cycles'] = kpis['charge_cycles']
+    kpis_df['min_soc'] = kpis['min_level_J'] / Q_full
+    kpis_df['unmet_kWh'] = kpis['unmet_J'] / (3600 * 1000)
+
+    return kpis_df
+
+
+def get_sweep_events(heat_J, loss_rate):
+    """
+    the drawoffs of a DHW demand for 'sweep_storage_load'. The last step is
+    always an event, so the events reach the end of the demand. y is the
+    demand filtered by the losses, y_t = (1 - loss_rate) * y_t-1 + heat_t.
+    With it, the content of a storage with a constant load after step t
+    follows from the content Q_t0 at the start of step t0:
+    Q_t+1 = (Q_t0 + y_t0-1 - Q_steady) * decay + Q_steady - y_t, with
+    decay = (1 - loss_rate) ** (t + 1 - t0) and Q_steady = load / loss_rate.
+
+    :param heat_J:          array:  DHW demand in J per timestep
+    :param loss_rate:       float:  share of the content lost per timestep
+    :return: events:        dict:   'step', 'gap' (steps without demand
+                                    before), 'demand', 'y' and 'decay'
+                                    ((1 - loss_rate) ** (step + 1)) of each
+                                    event, padded by 'sweep_window' entries
+                                    behind the last one. Their number
+                                    'n_events', 'n_steps' and the cumulated
+                                    demand 'heat_cum_J'.
+    """
+
+    n_steps = len(heat_J)
+    steps = np.flatnonzero(heat_J)
+    if not len(steps) or steps[-1] != n_steps - 1:
+        steps = np.append(steps, n_steps - 1)
+    demand = heat_J[steps]
+
+    decay = ((1 - loss_rate) ** np.diff(steps, prepend=steps[0])).tolist()
+    y = []
+    y_curr = 0.0
+    for decay_step, dem_step in zip(decay, demand.tolist()):
+        y_curr = y_curr * decay_step + dem_step
+        y.append(y_curr)
+
+    padding = np.zeros(sweep_window)
+
+    return {
+        'step': np.append(steps, padding + n_steps).astype(np.int64),
+        'gap': np.append(np.diff(steps, prepend=-1) - 1, padding).astype(
+            np.int64),
+        'demand': np.append(demand, padding),
+        'y': np.append(y, padding),
+        'decay': np.append(np.exp((steps + 1) * math.log1p(-loss_rate)),
+                           padding),
+        'n_events': len(steps),
+        'n_steps': n_steps,
+        'heat_cum_J': np.concatenate([[0], np.cumsum(heat_J)])
+    }
+
+
+def advance_storage_configs(storages, events, loss_rate):
+    """
+    one iteration of 'sweep_storage_load': each storage runs over the next
+    'sweep_window' events, or up to the step where its heater switches.
+    A switch between two drawoffs is found by
+    'get_steps_to_storage_switches'. Updates the storages in place.
+    """
+
+    Q, fill, y = storages['Q'], storages['fill'], storages['y']
+    t_step, event = storages['t_step'], storages['event']
+    Q_full, threshhold = storages['Q_full'], storages['threshhold']
+    load = np.where(fill, storages['Q_dh_timestep'], 0)
+    n_storages = len(Q)
+    rows = np.arange(n_storages)
+    decay = 1 - loss_rate
+    log_decay = math.log1p(-loss_rate)
+
+    # --- content after the next drawoffs, if the heater does not switch ---
+    window = event[:, np.newaxis] + np.arange(sweep_window)
+    valid = window < events['n_events']
+    steps = events['step'][window]
+    demand = events['demand'][window]
+    y_after = events['y'][window]
+    load_n = load[:, np.newaxis]
+
+    if loss_rate:
+        Q_steady = load_n / loss_rate
+        decay_n = events['decay'][window] * np.exp(-t_step * log_decay)[
+            :, np.newaxis]
+        Q_after = ((Q + y)[:, np.newaxis] - Q_steady) * decay_n \
+            + Q_steady - y_after
+    else:
+        Q_after = (Q + y)[:, np.newaxis] \
+            + load_n * (steps + 1 - t_step[:, np.newaxis]) - y_after
+
+    # content at the start of each drawoff, one step back
+    Q_drawoff = (Q_after + demand - load_n) / decay
+    gaps = events['gap'][window]
+    gaps[:, 0] = steps[:, 0] - t_step
+
+    # --- first switch: between the drawoffs (even) or at a drawoff (odd) ---
+    fill_n = fill[:, np.newaxis]
+    Q_off = np.where(fill_n, Q_full[:, np.newaxis], np.inf)
+    Q_on = np.where(fill_n, -np.inf, np.minimum(
+        threshhold, np.nextafter(Q_full, -np.inf))[:, np.newaxis])
+
+    crossed = np.empty((n_storages, sweep_window, 2), dtype=bool)
+    crossed[:, :, 0] = ((Q_drawoff >= Q_off) | (Q_drawoff <= Q_on)) \
+        & (gaps > 0)
+    crossed[:, :, 1] = (Q_after >= Q_off) | (Q_after <= Q_on)
+    crossed &= valid[:, :, np.newaxis]
+    crossed = crossed.reshape(n_storages, 2 * sweep_window)
+
+    first = crossed.argmax(axis=1)
+    switched = crossed[rows, first]
+    n_done = np.where(switched, (first + 1) // 2, valid.sum(axis=1))
+
+    # --- the drawoffs that are done ---
+    done = np.arange(sweep_window) < n_done[:, np.newaxis]
+    unmet = np.minimum(np.maximum(-Q_after, 0), demand)
+    storages['unmet_J'] += unmet.sum(axis=1, where=done)
+
+    # the content is monotonic between drawoffs, so the lowest content at
+    # the start of a step is at the start of a drawoff or right after one
+    level_min = np.minimum(Q_drawoff, Q_after, where=steps < events[
+        'n_steps'] - 1, out=Q_drawoff.copy())
+    np.minimum(storages['min_level_J'], level_min.min(
+        axis=1, where=done, initial=np.inf), out=storages['min_level_J'])
+
+    last = np.maximum(n_done - 1, 0)
+    any_done = n_done > 0
+    Q_new = np.where(any_done, Q_after[rows, last], Q)
+    t_new = np.where(any_done, steps[rows, last] + 1, t_step)
+    y_new = np.where(any_done, y_after[rows, last], y)
+
+    # --- switch between two drawoffs ---
+    in_gap = switched & (first % 2 == 0)
+    if in_gap.any():
+        idx = np.flatnonzero(in_gap)
+        gap = gaps[idx, n_done[idx]]
+        k = np.minimum(gap, get_steps_to_storage_switches(
+            Q_new[idx], load[idx], fill[idx], gap,
+            {'loss_rate': loss_rate, 'Q_full': Q_full[idx],
+             'threshhold': threshhold[idx]}))
+        Q_new[idx] = get_storage_level(Q_new[idx], load[idx], loss_rate, k)
+        t_new[idx] += k
+        y_new[idx] *= decay ** k
+        storages['min_level_J'][idx] = np.minimum(
+            storages['min_level_J'][idx], Q_new[idx])
+
+    # --- storage load and losses (by the energy balance) of the steps ---
+    n_run = t_new - t_step
+    storages['storage_load_J'] += load * n_run
+    if loss_rate:
+        storages['losses_J'] += Q - Q_new + load * n_run \
+            - (events['heat_cum_J'][t_new] - events['heat_cum_J'][t_step])
+
+    # --- heater switches, the switch step already has the new load ---
+    storages['charge_cycles'] += switched & ~fill
+    fill = fill ^ switched
+    storages['storage_load_J'] += switched * (
+        np.where(fill, storages['Q_dh_timestep'], 0) - load)
+
+    storages['Q'], storages['fill'], storages['y'] = Q_new, fill, y_new
+    storages['t_step'], storages['event'] = t_new, event + n_done
+
+
+def get_steps_to_storage_switches(Q, load, fill, remaining, storages):
+    """
+    array version of 'get_steps_to_storage_switch' for the storages in
+    'sweep_storage_load'. Only looks ahead for the remaining steps.
+
+    :return: k:     array:  the switch happens in the k-th step,
+                            remaining + 1 if not before the end
+    """
+
+    loss_rate = storages['loss_rate']
+    Q_full = storages['Q_full']
+    threshhold = storages['threshhold']
+    never = remaining + 1
+
+    # invalid logarithms (no switch) become NaN, which fmin drops
+    if loss_rate == 0:
+        k = np.where(fill & (load > 0), (Q_full - Q) / load, never)
+
+        def crossed(k):
+            Q_k = Q + load * k
+            return np.where(fill, Q_k >= Q_full, Q_k <= threshhold)
+    else:
+        Q_steady = load / loss_rate
+        k = np.where(fill, np.where(Q_steady > Q_full, np.log(
+            (Q_steady - Q_full) / (Q_steady - Q)), np.nan),
+            np.log(threshhold / Q)) / np.log(1 - loss_rate)
+
+        def crossed(k):
+            Q_k = Q_steady + (Q - Q_steady) * (1 - loss_rate) ** k
+            return np.where(fill, Q_k >= Q_full, Q_k <= threshhold)
+
+    k = np.maximum(np.fmin(np.ceil(k), never), 1).astype(int)
+
+    # --- rounding of the estimate ---
+    k -= (k > 1) & crossed(k - 1)
+    while True:
+        late = (k <= remaining) & ~crossed(k)
+        if not late.any():
+            return k
+        k += late
+
+
+def clear_cache():
+    """
+    Empties the caches of the probability profiles and category tables.
+    """
+
+    get_p_norm_integral.cache_clear()
+    _get_data_drawoff_categories.cache_clear()
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import re
+import json
+import warnings
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from OpenDHW.dhwcalc_library import get_dhwcalc_dir, cache_dir_name
+
+"""
+Catalog of the DHWcalc reference profiles. Every profile in DHWcalc_Files
+comes with a logfile that lists the DHWcalc settings (flow rates, sigma,
+probability step functions, daylight saving, ...). The logfiles are parsed
+once into an index (catalog.json in the cache directory), which is rebuilt
+when a logfile changes. Queries then only use the index.
+"""
+
+# --- Name of the persisted index, inside the cache directory ---
+catalog_file_name = 'catalog.json'
+
+# --- Version of the index format, older indices are rebuilt ---
+catalog_version = 2
+
+# --- Numbers in a line of a logfile, f.e. '120   120   12   24  l/h'. Some
+# logfiles write decimal commas, f.e. '3,8 %' ---
+number_pattern = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+# --- Period of a probability step function, f.e. '22:00-06:30      2 %' ---
+period_pattern = re.compile(
+    r'(\d\d:\d\d)-(\d\d:\d\d)\s+(\d+(?:[.,]\d+)?)\s*%')
+
+# --- Deviation of the sum of a step function from 100 %, which is accepted
+# (the logfiles round each period to 0.1 %) ---
+step_function_tolerance = 1
+
+_catalog_memo = {}
+
+
+def get_log_files(dir_dhwcalc=None):
+    """
+    all logfiles in the DHWcalc directory, sorted by name.
+
+    :param dir_dhwcalc:     Path:   default: get_dhwcalc_dir()
+    :return: log_files:     list:   Paths
+    """
+
+    if dir_dhwcalc is None:
+        dir_dhwcalc = get_dhwcalc_dir()
+
+    return sorted(Path(dir_dhwcalc).glob('*_log.txt'))
+
+
+def get_profile_file(log_file):
+    """
+    name of the profile that belongs to a logfile. Some logfiles were saved
+    as 'name.txt_log.txt' instead of 'name_log.txt'.
+
+    :param log_file:        Path:   logfile
+    :return: file:          str:    f.e. 200L_1min_4cat_sf_nods_max1200.txt
+    """
+
+    name = Path(log_file).name[:-len('_log.txt')]
+    if name.endswith('.txt'):
+        name = name[:-len('.txt')]
+
+    return name + '.txt'
+
+
+def parse_dhwcalc_log(log_file):
+    """
+    reads the settings of a DHWcalc run from its logfile.
+
+    :param log_file:    Path:   DHWcalc logfile
+    :return: record:    dict:   settings of the run. Lists hold one entry
+                                per category, the step functions one
+                                [start, end, percent] entry per period.
+    """
+
+    record = {
+        'file': get_profile_file(log_file),
+        'p_weekday': [],
+        'p_weekend': []
+    }
+
+    p_day = None
+
+    with open(log_file) as f:
+        for line in f:
+            line = line.strip()
+            key, _, value = line.partition(':')
+            numbers = [to_float(n) for n in number_pattern.findall(value)]
+
+            if line.startswith('Total duration'):
+                record['days'] = int(numbers[0])
+            elif line.startswith('Start day'):
+                record['start_day'] = int(numbers[0])
+            elif line.startswith('Mean daily draw-off vol.'):
+                record['mean_drawoff_vol_per_day'] = numbers[0]
+            elif line.startswith('No. of categories'):
+                record['categories'] = int(numbers[0])
+            elif line.startswith('Time step duration'):
+                record['s_step'] = int(numbers[0] * 60)
+            elif line.startswith('Daylight saving time'):
+                record['daylight_saving'] = value.strip() == 'applied'
+            elif line.startswith('Mean flow Rate'):
+                record['mean_flow_rate_LperH'] = numbers
+            elif line.startswith('Duration of draw-off'):
+                record['drawoff_duration_min'] = numbers
+            elif line.startswith('portion'):
+                record['portion'] = [n / 100 for n in numbers]
+            elif line.startswith('sigma'):
+                record['sigma_LperH'] = numbers
+            elif line.startswith('min. flow rate'):
+                record['min_flow_rate_LperH'] = numbers[0]
+            elif line.startswith('max. flow rate'):
+                record['max_flow_rate_LperH'] = numbers[0]
+            elif line.startswith('on weekend-days/on weekdays'):
+                record['weekend_weekday_factor'] = numbers[0] / 100
+            elif line.startswith('Sine amplitude'):
+                record['sine_amplitude'] = numbers[0] / 100
+            elif line.startswith('Day of sine maximum'):
+                record['sine_max_day'] = int(numbers[0])
+            elif line == 'weekdays':
+                p_day = record['p_weekday']
+            elif line == 'weekend-days':
+                p_day = record['p_weekend']
+            elif p_day is not None and period_pattern.match(line):
+                start, end, percent = period_pattern.match(line).groups()
+                p_day.append([start, end, to_float(percent)])
+
+    # with one category, DHWcalc does not log the portion
+    if 'portion' not in record:
+        record['portion'] = [1.0]
+
+    for key in ['p_weekday', 'p_weekend']:
+        total = sum(period[2] for period in record[key])
+        if abs(total - 100) > step_function_tolerance:
+            warnings.warn("{}: the step function '{}' adds up to {} % "
+                          "instead of 100 %".format(Path(log_file).name, key,
+                                                    round(total, 1)))
+
+    return record
+
+
+def to_float(number):
+    """
+    converts a number of a logfile to float, with a decimal point or comma.
+
+    :param number:      str:    f.e. '47,5'
+    :return: number:    float
+    """
+
+    return float(number.replace(',', '.'))
+
+
+def build_catalog(dir_dhwcalc=None):
+    """
+    parses all logfiles and saves the index as catalog.json in the cache
+    directory. Logfiles without a profile are skipped.
+
+    :param dir_dhwcalc:     Path:   default: get_dhwcalc_dir()
+    :return: records:       list:   one dict per profile
+    """
+
+    if dir_dhwcalc is None:
+        dir_dhwcalc = get_dhwcalc_dir()
+    dir_dhwcalc = Path(dir_dhwcalc)
+
+    log_files = get_log_files(dir_dhwcalc)
+    records = [parse_dhwcalc_log(log_file) for log_file in log_files
+               if (dir_dhwcalc / get_profile_file(log_file)).exists()]
+
+    index = {
+        'version': catalog_version,
+        'logs': {log_file.name: log_file.stat().st_mtime
+                 for log_file in log_files},
+        'records': records
+    }
+
+    cache_dir = dir_dhwcalc / cache_dir_name
+    cache_dir.mkdir(exist_ok=True)
+    with open(cache_dir / catalog_file_name, 'w') as f:
+        json.dump(index, f, indent=1)
+
+    return records
+
+
+def get_catalog(dir_dhwcalc=None, rebuild=False):
+    """
+    the catalog of all DHWcalc reference profiles, one row per profile. The
+    persisted index is used if it is still up to date with the logfiles,
+    otherwise it is rebuilt.
+
+    :param dir_dhwcalc:     Path:   default: get_dhwcalc_dir()
+    :param rebuild:         bool:   parse all logfiles again
+    :return: catalog_df:    df:     settings of each profile and its 'path'
+    """
+
+    if dir_dhwcalc is None:
+        dir_dhwcalc = get_dhwcalc_dir()
+    dir_dhwcalc = Path(dir_dhwcalc)
+    index_path = dir_dhwcalc / cache_dir_name / catalog_file_name
+
+    log_mtimes = {log_file.name: log_file.stat().st_mtime
+                  for log_file in get_log_files(dir_dhwcalc)}
+
+    records = None
+    if not rebuild and index_path.exists():
+        memo_key = (str(index_path), index_path.stat().st_mtime)
+        if memo_key in _catalog_memo:
+            index = _catalog_memo[memo_key]
+        else:
+            with open(index_path) as f:
+                index = json.load(f)
+            _catalog_memo[memo_key] = index
+
+        if index.get('version') == catalog_version \
+                and index['logs'] == log_mtimes:
+            records = index['records']
+
+    if records is None:
+        records = build_catalog(dir_dhwcalc)
+
+    catalog_df = pd.DataFrame(records)
+    catalog_df['path'] = [dir_dhwcalc / file for file in catalog_df['file']]
+
+    return catalog_df
+
+
+def find_dhwcalc_profiles(dir_dhwcalc=None, **params):
+    """
+    all reference profiles with the given settings, f.e.
+    find_dhwcalc_profiles(s_step=60, categories=4).
+
+    :param dir_dhwcalc:     Path:   default: get_dhwcalc_dir()
+    :param params:          any:    columns of the catalog and their values
+    :return: catalog_df:    df:     matching rows of the catalog
+    """
+
+    catalog_df = get_catalog(dir_dhwcalc)
+
+    mask = np.ones(len(catalog_df), dtype=bool)
+    for col, value in params.items():
+        mask &= (catalog_df[col] == value).to_numpy()
+
+    return catalog_df[mask]
+
+
+def find_nearest_dhwcalc_profile(s_step, categories,
+                                 mean_drawoff_vol_per_day=200,
+                                 daylight_saving=False, max_flowrate=1200,
+                                 dir_dhwcalc=None):
+    """
+    the reference profile closest to the given settings. The number of
+    categories has to match. The distance adds up the relative (log)
+    differences of the volume and the max flow rate, a differing daylight
+    saving counts as 1 and a differing timestep weighs ten times as much.
+
+    :param s_step:                      int:    seconds in a timestep
+    :param categories:                  int:    1 or 4
+    :param mean_drawoff_vol_per_day:    int:    daily water demand in Liters
+    :param daylight_saving:             bool:   daylight saving applied
+    :param max_flowrate:                int:    max flow rate in L/h
+    :param dir_dhwcalc:                 Path:   default: get_dhwcalc_dir()
+    :return: record:                    series: row of the catalog
+    """
+
+    catalog_df = find_dhwcalc_profiles(dir_dhwcalc, categories=categories)
+
+    if catalog_df.empty:
+        raise Exception('No DHWcalc File with {} categories'.format(
+            categories))
+
+    distance = \
+        10 * np.abs(np.log(catalog_df['s_step'] / s_step)) \
+        + np.abs(np.log(catalog_df['mean_drawoff_vol_per_day']
+                        / mean_drawoff_vol_per_day)) \
+        + np.abs(np.log(catalog_df['max_flow_rate_LperH'] / max_flowrate)) \
+        + (catalog_df['daylight_saving'] != daylight_saving)
+
+    return catalog_df.loc[distance.idxmin()]
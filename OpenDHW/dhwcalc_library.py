@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import gzip
+import warnings
+import numpy as np
+from pathlib import Path
+
+"""
+Access to the library of DHWcalc reference profiles in DHWcalc_Files. The
+text files hold one flow rate in L/h per line. They are converted once into
+int16 .npy files in a cache directory. Afterwards, a reference profile is
+opened as a read-only memory map, which takes well under a millisecond and
+can be shared between processes.
+
+Files with one flow rate per line (DHWcalc exports, metered series, also
+gzip compressed) are read in chunks straight into NumPy arrays by
+'read_flow_file'.
+"""
+
+# --- Cache directory inside DHWcalc_Files (see .gitignore) ---
+cache_dir_name = '.npy_cache'
+
+# --- Name of a profile file, f.e. 200L_1min_4cat_sf_nods_max1200.txt ---
+profile_file_pattern = re.compile(
+    r'^(\d+)L_(\d+)min_(\d+)cat_sf_(ds|nods)_max(\d+)\.txt$')
+
+# --- Bytes read at once by 'read_flow_file' ---
+chunk_bytes = 2 ** 24
+
+
+def get_dhwcalc_dir():
+    """
+    directory of the DHWcalc reference profiles. It is looked up next to
+    the package first, so it does not depend on the working directory.
+    Otherwise, like in the Examples, next to the current working directory.
+
+    :return: dir_dhwcalc:   Path
+    """
+
+    dir_dhwcalc = Path(__file__).resolve().parent.parent / "DHWcalc_Files"
+    if dir_dhwcalc.exists():
+        return dir_dhwcalc
+
+    return Path.cwd().parent / "DHWcalc_Files"
+
+
+def get_dhwcalc_file_name(s_step, daylight_saving, categories,
+                          mean_drawoff_vol_per_day=200, max_flowrate=1200):
+    """
+    name of a DHWcalc result file.
+
+    :param  s_step:                     int:    resolution of file in seconds
+    :param  daylight_saving:            Bool:   apply daylight saving or not
+    :param  categories:                 int:    either '1' or '4'
+    :param  mean_drawoff_vol_per_day:   int:    daily water demand in Liters
+    :param  max_flowrate:               int:    maximum water flowrate in L/h
+    :return: dhw_file:                  str
+    """
+
+    if daylight_saving:
+        ds_string = 'ds'
+    else:
+        ds_string = 'nods'
+
+    dhw_file = "{vol}L_{s_step}min_{cats}cat_sf_{ds}_max{max_flow}.txt".format(
+        vol=mean_drawoff_vol_per_day,
+        s_step=int(s_step / 60),
+        cats=categories,
+        ds=ds_string,
+        max_flow=max_flowrate,
+    )
+
+    return dhw_file
+
+
+def read_dhwcalc_txt(dhw_profile):
+    """
+    reads a DHWcalc text file. If the file name follows the naming scheme,
+    the length is checked against its timestep.
+
+    :param dhw_profile:     Path:   DHWcalc result file
+    :return: water_LperH:   array:  flow rates in L/h (int16)
+    """
+
+    match = profile_file_pattern.match(Path(dhw_profile).name)
+    s_step = int(match.group(2)) * 60 if match else None
+
+    return read_flow_file(dhw_profile, s_step=s_step, dtype=np.int16)
+
+
+def read_flow_file(path, s_step=None, days=365, dtype=np.int16,
+                   return_s_step=False):
+    """
+    reads a file with one value per line (f.e. flow rates in L/h) in chunks
+    of 'chunk_bytes' straight into an array, without holding the lines as
+    Python strings. Files ending with .gz are decompressed on the fly.
+
+    The number of values has to fit the days with a timestep. Without
+    s_step, the timestep is detected from the number of values (see
+    'detect_s_step').
+
+    :param path:            Path:   text file, optionally gzip compressed
+    :param s_step:          int:    if given, the number of values has to fit
+                                    days with this timestep
+    :param days:            int:    days in the file, for the length check
+    :param dtype:           dtype:  dtype of the returned array. For integer
+                                    dtypes, all values have to be whole
+                                    numbers inside the range of the dtype.
+    :param return_s_step:   bool:   also return the timestep
+    :return: values:        array
+    :return: s_step:        int:    seconds in a timestep, only with
+                                    return_s_step
+    """
+
+    path = Path(path)
+    if path.suffix == '.gz':
+        file = gzip.open(path, 'rb')
+    else:
+        file = open(path, 'rb')
+
+    chunks = []
+    rest = b''
+
+    with file:
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                break
+
+            # only parse complete lines, the rest goes into the next chunk
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            rest = block[cut:]
+            if cut:
+                chunks.append(parse_flow_chunk(block[:cut], path))
+
+    if rest.strip():
+        chunks.append(parse_flow_chunk(rest, path))
+
+    values = np.concatenate(chunks) if chunks else np.empty(0)
+
+    if s_step is None:
+        try:
+            s_step = detect_s_step(len(values), days)
+        except Exception:
+            raise Exception('{} has {} values, which do not fit a timestep '
+                            'over {} days'.format(path, len(values), days))
+    else:
+        n_steps = int(days * 24 * 3600 / s_step)
+        if len(values) != n_steps:
+            raise Exception('{} has {} values, expected {} for a timestep of '
+                            '{} s'.format(path, len(values), n_steps, s_step))
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or
+                            values.max() > info.max):
+            raise Exception('Values in {} do not fit into {}'.format(
+                path, np.dtype(dtype)))
+        if not np.array_equal(values, np.round(values)):
+            raise Exception('Values in {} are not whole numbers'.format(path))
+
+    if return_s_step:
+        return values.astype(dtype), s_step
+
+    return values.astype(dtype)
+
+
+def parse_flow_chunk(block, path=''):
+    """
+    parses the values in a block of complete lines. Each line holds at most
+    one number.
+
+    :param block:       bytes:  numbers separated by line breaks
+    :param path:        Path:   file name for the error message
+    :return: values:    array:  float64
+    """
+
+    # numpy only warns if it can not read a string to its end
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            values = np.fromstring(block.decode('ascii'), dtype=np.float64,
+                                   sep=' ')
+        except (DeprecationWarning, ValueError, UnicodeDecodeError):
+            raise Exception('{} is not a file with one number per '
+                            'line'.format(path))
+
+    # np.fromstring takes any whitespace as separator, so check that no
+    # two numbers start in the same line (whitespace is ' ' and below)
+    chars = np.frombuffer(block, dtype=np.uint8)
+    is_space = chars <= ord(' ')
+    starts = np.flatnonzero(~is_space & np.r_[True, is_space[:-1]])
+    lines = np.searchsorted(np.flatnonzero(chars == ord('\n')), starts)
+    if np.any(np.diff(lines) == 0):
+        raise Exception('{} is not a file with one number per '
+                        'line'.format(path))
+
+    return values
+
+
+def detect_s_step(n_values, days=365):
+    """
+    timestep of a series with n_values values over some days. It has to be
+    a whole number of seconds that fits into a day.
+
+    :param n_values:    int:    number of values, f.e. 525600
+    :param days:        int:    days in the series
+    :return: s_step:    int:    seconds in a timestep, f.e. 60
+    """
+
+    s_step = days * 24 * 3600 / n_values
+
+    if s_step % 1 != 0 or (24 * 3600) % s_step != 0:
+        raise Exception('{} values do not fit a timestep over {} '
+                        'days'.format(n_values, days))
+
+    return int(s_step)
+
+
+def get_cache_path(dhw_profile, cache_dir=None):
+    """
+    path of the .npy file of a DHWcalc text file.
+
+    :param dhw_profile:     Path:   DHWcalc result file
+    :param cache_dir:       Path:   default: .npy_cache next to the file
+    :return: cache_path:    Path
+    """
+
+    dhw_profile = Path(dhw_profile)
+
+    if cache_dir is None:
+        cache_dir = dhw_profile.parent / cache_dir_name
+
+    return Path(cache_dir) / (dhw_profile.stem + '.npy')
+
+
+def convert_dhwcalc_file(dhw_profile, cache_dir=None):
+    """
+    converts a DHWcalc text file into an int16 .npy file. The file is
+    written under a temporary name first, so processes that load the same
+    file at the same time never see a half written file.
+
+    :param dhw_profile:     Path:   DHWcalc result file
+    :param cache_dir:       Path:   default: .npy_cache next to the file
+    :return: cache_path:    Path
+    """
+
+    cache_path = get_cache_path(dhw_profile, cache_dir)
+    cache_path.parent.mkdir(exist_ok=True)
+
+    tmp_path = cache_path.with_name(
+        '{}.{}.tmp.npy'.format(cache_path.stem, os.getpid()))
+    np.save(tmp_path, read_dhwcalc_txt(dhw_profile))
+    os.replace(tmp_path, cache_path)
+
+    return cache_path
+
+
+def convert_dhwcalc_library(dir_dhwcalc=None, cache_dir=None,
+                            overwrite=False):
+    """
+    converts all DHWcalc result files of the library (not the logfiles).
+    Files that are already converted and up to date are skipped.
+
+    :param dir_dhwcalc:         Path:   default: get_dhwcalc_dir()
+    :param cache_dir:           Path:   default: .npy_cache in dir_dhwcalc
+    :param overwrite:           bool:   convert all files again
+    :return: cache_paths:       list:   paths of all .npy files
+    """
+
+    if dir_dhwcalc is None:
+        dir_dhwcalc = get_dhwcalc_dir()
+
+    cache_paths = []
+    for dhw_profile in sorted(Path(dir_dhwcalc).glob('*.txt')):
+        if not profile_file_pattern.match(dhw_profile.name):
+            continue
+
+        cache_path = get_cache_path(dhw_profile, cache_dir)
+        if overwrite or not is_cache_valid(dhw_profile, cache_path):
+            cache_path = convert_dhwcalc_file(dhw_profile, cache_dir)
+        cache_paths.append(cache_path)
+
+    return cache_paths
+
+
+def is_cache_valid(dhw_profile, cache_path):
+    """
+    the .npy file exists and is not older than the text file.
+    """
+
+    cache_path = Path(cache_path)
+
+    return cache_path.exists() and \
+        cache_path.stat().st_mtime >= Path(dhw_profile).stat().st_mtime
+
+
+def load_dhwcalc_profile(dhw_profile, cache_dir=None):
+    """
+    opens a DHWcalc result file as a read-only memory map. On the first
+    call, the text file is converted into the cache.
+
+    :param dhw_profile:     Path:   DHWcalc result file
+    :param cache_dir:       Path:   default: .npy_cache next to the file
+    :return: water_LperH:   memmap: flow rates in L/h (int16, read-only)
+    """
+
+    cache_path = get_cache_path(dhw_profile, cache_dir)
+
+    if not is_cache_valid(dhw_profile, cache_path):
+        cache_path = convert_dhwcalc_file(dhw_profile, cache_dir)
+
+    return np.load(cache_path, mmap_mode='r')
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import math
+import hashlib
+import collections
+import numpy as np
+import scipy.spatial
+
+"""
+Distributions of the drawoff flow rates. The flow rates of a profile are
+whole numbers in L/h, so they are counted once into bins of 1 L/h with
+np.bincount. Histograms with wider bins are sums of these counts, the KDE is
+the convolution of the counts with a Gaussian kernel (via FFT). For whole
+numbers the binned KDE is exact at each L/h, it does not depend on the
+number of drawoffs anymore.
+
+Distributions are cached by the content of the flow rates (see
+'get_flow_distribution'), so plots and distance metrics of the same profile
+share one distribution and its KDEs.
+"""
+
+# --- Number of distributions kept by 'get_flow_distribution' ---
+cache_size_distributions = 32
+
+# --- Width of the KDE grid beyond the data, in bandwidths (like seaborn) ---
+kde_cut = 3
+
+# --- Width of the truncated Gaussian kernel, in bandwidths ---
+kde_truncate = 4
+
+_distribution_cache = collections.OrderedDict()
+
+
+class FlowDistribution:
+    """
+    Distribution of the non-zero flow rates of a profile. The flow rates
+    are rounded to whole L/h and counted once per L/h, starting at the
+    smallest flow rate. Histograms and KDEs are computed from these counts,
+    KDEs are cached per bandwidth.
+    """
+
+    def __init__(self, values):
+        """
+        :param values:      array:  flow rates in L/h, zeros are left out
+        """
+
+        values = np.asarray(values)
+        values = np.rint(values[values != 0]).astype(np.int64)
+
+        if len(values):
+            self.offset = int(values.min())
+            self.counts = np.bincount(values - self.offset)
+        else:
+            self.offset = 0
+            self.counts = np.zeros(0, dtype=np.int64)
+
+        self.n = int(self.counts.sum())
+        flows = self.flows
+        if self.n:
+            self.mean = float(np.dot(flows, self.counts) / self.n)
+            self.std = float(np.sqrt(
+                np.dot((flows - self.mean) ** 2, self.counts) / self.n))
+        else:
+            self.mean = self.std = math.nan
+
+        self.kdes = {}
+
+    def __repr__(self):
+        return 'FlowDistribution(n={}, mean={:.1f}, std={:.1f})'.format(
+            self.n, self.mean, self.std)
+
+    @property
+    def flows(self):
+        """
+        flow rates of the counts in L/h, one per L/h
+        """
+        return np.arange(self.offset, self.offset + len(self.counts))
+
+    @property
+    def bin_width(self):
+        """
+        default bin width in whole L/h, the narrower of the Sturges and the
+        Freedman-Diaconis rule (like 'auto' of numpy and seaborn).
+        """
+
+        if self.n < 2:
+            return 1
+
+        value_range = len(self.counts) - 1
+        width = value_range / (math.log2(self.n) + 1)
+
+        q25, q75 = self.get_quantiles([0.25, 0.75])
+        if q75 > q25:
+            width = min(width, 2 * (q75 - q25) * self.n ** (-1 / 3))
+
+        return max(1, int(round(width)))
+
+    def get_quantiles(self, q):
+        """
+        quantiles of the flow rates, read from the cumulative counts.
+
+        :param q:               list:   quantiles between 0 and 1
+        :return: quantiles:     array:  flow rates in L/h
+        """
+
+        cum_counts = np.cumsum(self.counts)
+        idx = np.searchsorted(cum_counts, np.asarray(q) * self.n)
+
+        return self.offset + np.minimum(idx, len(self.counts) - 1)
+
+    def get_histogram(self, bin_width=None, start=None, stop=None):
+        """
+        counts per bin. The bins are centered on whole L/h, the edges lie in
+        between (f.e. 99.5, 109.5, ... for a bin width of 10).
+
+        :param bin_width:   int:    in L/h, default: 'bin_width'
+        :param start:       int:    first flow rate of the first bin,
+                                    default: the smallest flow rate
+        :param stop:        int:    first flow rate after the last bin,
+                                    default: after the largest flow rate
+        :return: edges:     array:  len(counts) + 1 bin edges in L/h
+        :return: counts:    array:  drawoffs per bin
+        """
+
+        if bin_width is None:
+            bin_width = self.bin_width
+        if start is None:
+            start = self.offset
+        if stop is None:
+            stop = self.offset + len(self.counts)
+
+        n_bins = max(1, -(-(stop - start) // bin_width))
+
+        # counts on the whole grid of the bins, then summed per bin
+        counts = np.zeros(n_bins * bin_width, dtype=np.int64)
+        lo = max(self.offset, start)
+        hi = min(self.offset + len(self.counts), start + len(counts))
+        if hi > lo:
+            counts[lo - start:hi - start] = \
+                self.counts[lo - self.offset:hi - self.offset]
+        counts = counts.reshape(n_bins, bin_width).sum(axis=1)
+
+        edges = start - 0.5 + bin_width * np.arange(n_bins + 1)
+
+        return edges, counts
+
+    def get_bandwidth(self, bw_adjust=1):
+        """
+        bandwidth of the Gaussian kernel after Scott's rule, like
+        scipy.stats.gaussian_kde and seaborn.
+
+        :param bw_adjust:       float:  factor on the bandwidth
+        :return: bandwidth:     float:  in L/h
+        """
+
+        if not self.n:
+            return math.nan
+
+        return bw_adjust * self.std * self.n ** (-1 / 5)
+
+    def get_kde(self, bw_adjust=1):
+        """
+        Gaussian KDE of the flow rates on a grid of 1 L/h, which reaches
+        'kde_cut' bandwidths beyond the data. The counts are convolved with
+        the kernel via FFT, the result is cached per bw_adjust.
+
+        :param bw_adjust:       float:  factor on the bandwidth, f.e. 0.05
+                                        for a detailed KDE
+        :return: flows:         array:  grid in L/h
+        :return: density:       array:  probability density per L/h
+        """
+
+        if bw_adjust in self.kdes:
+            return self.kdes[bw_adjust]
+
+        bandwidth = self.get_bandwidth(bw_adjust)
+
+        if not self.n or not bandwidth > 0:
+            kde = self.flows, self.counts / max(self.n, 1)
+            self.kdes[bw_adjust] = kde
+            return kde
+
+        # the kernel is normalized on the grid, so no drawoff is lost for
+        # small bandwidths
+        half_width = int(math.ceil(kde_truncate * bandwidth))
+        x = np.arange(-half_width, half_width + 1)
+        kernel = np.exp(-0.5 * (x / bandwidth) ** 2)
+        kernel /= kernel.sum()
+
+        n_full = len(self.counts) + len(kernel) - 1
+        n_fft = 1 << (n_full - 1).bit_length()
+        density = np.fft.irfft(np.fft.rfft(self.counts, n_fft)
+                               * np.fft.rfft(kernel, n_fft), n_fft)[:n_full]
+        density = np.maximum(density, 0) / self.n
+
+        # cut the grid 'kde_cut' bandwidths beyond the data
+        cut = min(half_width, int(math.ceil(kde_cut * bandwidth)))
+        density = density[half_width - cut:n_full - half_width + cut]
+        flows = np.arange(self.offset - cut,
+                          self.offset - cut + len(density))
+
+        kde = flows, density
+        self.kdes[bw_adjust] = kde
+
+        return kde
+
+
+def get_flow_distribution(values):
+    """
+    the distribution of the non-zero flow rates. Distributions are cached by
+    the content of values, the same profile (or the same drawoffs) always
+    returns the same distribution with the KDEs computed so far.
+
+    :param values:          array:  flow rates in L/h, f.e. a 'Water_LperH'
+                                    column or drawoffs from 'get_drawoffs'
+    :return: distribution:  FlowDistribution
+    """
+
+    values = np.ascontiguousarray(values)
+    key = (values.dtype.str, values.shape,
+           hashlib.blake2b(values.view(np.uint8), digest_size=16).digest())
+
+    if key in _distribution_cache:
+        _distribution_cache.move_to_end(key)
+        return _distribution_cache[key]
+
+    distribution = FlowDistribution(values)
+
+    _distribution_cache[key] = distribution
+    if len(_distribution_cache) > cache_size_distributions:
+        _distribution_cache.popitem(last=False)
+
+    return distribution
+
+
+def get_distribution_distance(distribution_1, distribution_2,
+                              bin_width=None):
+    """
+    Jensen-Shannon Distance between two flow rate distributions, computed
+    on a common histogram. 0 indicates that the two distributions are the
+    same, sqrt(ln(2)) that they do not overlap at all.
+
+    :param distribution_1:  FlowDistribution
+    :param distribution_2:  FlowDistribution
+    :param bin_width:       int:    in L/h, default: the wider default bin
+                                    width of both distributions
+    :return: distance:      float
+    """
+
+    if bin_width is None:
+        bin_width = max(distribution_1.bin_width, distribution_2.bin_width)
+
+    start = min(distribution_1.offset, distribution_2.offset)
+    stop = max(distribution_1.offset + len(distribution_1.counts),
+               distribution_2.offset + len(distribution_2.counts))
+
+    _, counts_1 = distribution_1.get_histogram(bin_width, start, stop)
+    _, counts_2 = distribution_2.get_histogram(bin_width, start, stop)
+
+    distance = scipy.spatial.distance.jensenshannon(counts_1, counts_2)
+
+    return round(float(distance), 4)
+
+
+def clear_cache():
+    """
+    Empties the cache of the flow rate distributions.
+    """
+
+    _distribution_cache.clear()
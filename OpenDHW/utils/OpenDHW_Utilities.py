@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import seaborn as sns
 from pathlib import Path
 from datetime import datetime
+from OpenDHW.core import (
+    StorageModel, StratifiedStorageModel, summarize_storage_load,
+    get_storage_configs, sweep_storage_load)
+from OpenDHW.OpenDHW import get_meta, get_s_step
 
 # use RWTH Colors
 rwth_blue = "#00549F"
@@ -23,7 +26,8 @@ def convert_dhw_load_to_storage_load(timeseries_df, start_plot, end_plot,
                                      dir_output, V_stor=300, dT_stor=55,
                                      dT_threshhold=10, Qcon_flow_max=5000,
                                      plot_cum_demand=False, with_losses=True,
-                                     save_fig=True):
+                                     save_fig=True, return_summary=False,
+                                     n_layers=1, heater_layer=0):
     """
     Converts the input DHW-Profile without a DHW-Storage to a DHW-Profile
     with a DHW-Storage. The output profile looks as if the HP would not
@@ -45,65 +49,48 @@ def convert_dhw_load_to_storage_load(timeseries_df, start_plot, end_plot,
     :param start_plot:      e.g. '2019-08-02'
     :param end_plot:        e.g. '2019-08-03'
     :param save_fig:        decide to save the fig as a pdf and png
+    :param return_summary:  also return the StorageSummary with the sums,
+                            the energy balance and the peak counts
+    :param n_layers:        1: one mixed storage, more: stratified storage
+                            (see StratifiedStorageModel) with this number
+                            of layers
+    :param heater_layer:    layer (from the bottom) where the heater takes
+                            the water of a stratified storage
     :return: storage_load:  DHW-profile that re-heats a storage.
     """
 
     # --- convert the DHW Demand ---
-    s_step = int(timeseries_df.index.freqstr[:-1])
+    s_step = get_s_step(timeseries_df)
     timeseries_df['Heat_J'] = timeseries_df['Heat_W'] * s_step
     timeseries_df['Heat_kW'] = timeseries_df['Heat_W'] / 1000
     timeseries_df['Heat_kWh'] = timeseries_df['Heat_J'] / (3600 * 1000)
 
     # --- Storage Data ---
-    # Todo: think about how Parameters should be for Schichtspeicher
-    rho = 980 / 1000  # kg/L for Water (at 60°C? at 10°C its = 1)
-    m_w = V_stor * rho  # Mass Water in Storage
-    c_p = 4180  # Heat Capacity Water in [J/kgK]
-    Q_full = m_w * c_p * dT_stor
-    Q_full_kWh = Q_full / (3600 * 1000)
-    dQ_threshhold = m_w * c_p * dT_threshhold
-    Q_dh_timestep = Qcon_flow_max * s_step  # energy added in 1 timestep
-    # Todo: implement a ramp-up period?
+    storage_params = dict(
+        s_step=s_step,
+        V_stor=V_stor,
+        dT_stor=dT_stor,
+        dT_threshhold=dT_threshhold,
+        Qcon_flow_max=Qcon_flow_max,
+        with_losses=with_losses
+    )
+    if n_layers > 1:
+        storage = StratifiedStorageModel(n_layers=n_layers,
+                                         heater_layer=heater_layer,
+                                         **storage_params)
+    else:
+        storage = StorageModel(**storage_params)
+    Q_full = storage.Q_full
 
     # ---------- write storage load time series, with Losses --------
-    Q_storr_curr = Q_full  # tracks the Storage Filling
-    storage_load = []  # new time series
-    storage_level = []
-    loss_load = []
-    fill_storage = False
-
-    for t_step, dem_step in enumerate(timeseries_df['Heat_J'], start=0):
-        storage_level.append(Q_storr_curr)
-        if with_losses:
-            Q_loss = (Q_storr_curr * 0.001 * s_step) / 3600  # 0,1% Loss/Hour
-        else:
-            Q_loss = 0
-        loss_load.append(Q_loss)
-
-        # for initial condition, when storage_load is still empty
-        if len(storage_load) == 0:
-            Q_storr_curr = Q_storr_curr - dem_step - Q_loss
-        else:
-            Q_storr_curr = Q_storr_curr - dem_step - Q_loss \
-                           + storage_load[t_step - 1]
-
-        if Q_storr_curr >= Q_full:  # storage full, dont fill it!
-            fill_storage = False
-            storage_load.append(0)
-            continue
-
-        # storage above dT Threshhold, but not full.
-        # depending if is charging or discharging, storage_load is appended
-        elif Q_storr_curr > Q_full - dQ_threshhold:
-            if fill_storage:
-                storage_load.append(Q_dh_timestep)
-            else:
-                storage_load.append(0)
-                continue
-
-        else:  # storage below dT Threshhold, fill it!
-            fill_storage = True
-            storage_load.append(Q_dh_timestep)
+    if n_layers > 1:
+        storage_load, loss_load, storage_level, unmet_load = \
+            storage.step_block(timeseries_df['Heat_J'].to_numpy(),
+                               return_unmet=True)
+    else:
+        storage_load, loss_load, storage_level = storage.step_block(
+            timeseries_df['Heat_J'].to_numpy())
+        unmet_load = None
 
     # append new Storage lists to Dataframe
     timeseries_df['StorageLoad_J'] = storage_load
@@ -116,38 +103,36 @@ def convert_dhw_load_to_storage_load(timeseries_df, start_plot, end_plot,
     timeseries_df['StorageLosses_kWh'] = timeseries_df['StorageLosses_J'] / (
             3600 * 1000)
 
-    # print out total demands and Difference between them
-    print("Sum DHW Demand = {:.2f} kWh".format(sum(timeseries_df['Heat_kWh'])))
-    print("Sum Storage Demand = {:.2f} kWh".format(sum(timeseries_df[
-                                                           'StorageLoad_kWh'])))
-    print("Sum Storage Losses = {:.2f} kWh".format(sum(timeseries_df[
-                                                           'StorageLosses_kWh'])))
+    # cumulative demand (german: "Summenlinien"), sums and peaks
+    summary = summarize_storage_load(
+        heat_J=timeseries_df['Heat_J'].to_numpy(),
+        storage_load_J=storage_load,
+        losses_J=loss_load,
+        s_step=s_step,
+        Q_full=Q_full,
+        unmet_J=unmet_load
+    )
+    timeseries_df['Heat_Sumline_kWh'] = summary.heat_sumline_kWh
+    timeseries_df['StorageLoad_Sumline_kWh'] = summary.storage_load_sumline_kWh
 
-    diff = timeseries_df['Heat_kWh'].sum() + timeseries_df[
-        'StorageLosses_kWh'].sum() - timeseries_df['StorageLoad_kWh'].sum()
-    print("DHW + Losses - StorageLoad = {:.2f} "
-          "kWh".format(diff))
+    # print out total demands and Difference between them
+    print("Sum DHW Demand = {:.2f} kWh".format(summary.heat_kWh))
+    print("Sum Storage Demand = {:.2f} kWh".format(summary.storage_load_kWh))
+    print("Sum Storage Losses = {:.2f} kWh".format(summary.losses_kWh))
+
+    diff = summary.balance_kWh
+    if unmet_load is None:
+        print("DHW + Losses - StorageLoad = {:.2f} "
+              "kWh".format(diff))
+    else:
+        print("Sum Unmet DHW Demand = {:.2f} kWh".format(summary.unmet_kWh))
+        print("DHW - Unmet + Losses - StorageLoad = {:.2f} "
+              "kWh".format(diff))
 
     if diff < 0:
         print("More heat than dhw demand is added to the storage in"
               "loss-less mode!")
 
-    # cumulative demand (german: "Summenlinien")
-    dhw_demand_sumline = []
-    acc_dem = 0  # accumulated demand
-    for dem_step in timeseries_df['Heat_kWh']:
-        acc_dem += dem_step
-        dhw_demand_sumline.append(acc_dem)
-    timeseries_df['Heat_Sumline_kWh'] = dhw_demand_sumline
-
-    storage_load_sumline = []
-    acc_load = 0  # accumulated load
-    for i, stor_step in enumerate(timeseries_df['StorageLoad_kWh']):
-        acc_load += stor_step - timeseries_df['StorageLosses_kWh'][i]
-        storage_load_sumline.append(acc_load)
-    storage_load_sumline = [Q + Q_full_kWh for Q in storage_load_sumline]
-    timeseries_df['StorageLoad_Sumline_kWh'] = storage_load_sumline
-
     # Todo: Fill storage so that at the end of the year its full again
     fill_storage = False
     if fill_storage:
@@ -232,19 +217,14 @@ def convert_dhw_load_to_storage_load(timeseries_df, start_plot, end_plot,
         ax1.xaxis.set_major_locator(locator)
         ax1.xaxis.set_major_formatter(formatter)
 
-        # Count number of clusters of non-zero values ("peaks").
-        # One Peak is comprised by 2 HP mode switches.
-        dhw_peaks = int(np.diff(np.concatenate(
-            [[0], list(timeseries_df['Heat_J']), [0]]) == 0).sum() / 2)
-        stor_peaks = int(np.diff(np.concatenate(
-            [[0], list(timeseries_df['StorageLoad_J']), [0]]) == 0).sum() / 2)
-
-        method = timeseries_df['method'][0]
+        method = get_meta(timeseries_df, 'method')
 
         plt.title('{} Demand ({} Peaks, {} per Day) and Storage ({} Peaks, '
-                  '{} per Day)'.format(method, dhw_peaks, round(dhw_peaks /
-                                                               365, 2),
-                                       stor_peaks, round(stor_peaks / 365, 2)))
+                  '{} per Day)'.format(
+                      method, summary.dhw_peaks,
+                      round(summary.dhw_peaks_per_day, 2),
+                      summary.storage_cycles,
+                      round(summary.storage_cycles_per_day, 2)))
         plt.show()
 
         if save_fig:
@@ -252,4 +232,40 @@ def convert_dhw_load_to_storage_load(timeseries_df, start_plot, end_plot,
                 '%Y_%m_%d_%H_%M_%S')) + '.pdf'
             fig.savefig(dir_output / save_name)
 
+    if return_summary:
+        return timeseries_df, summary
+
     return timeseries_df
+
+
+def size_storage(timeseries_df, configs_df=None, with_losses=True,
+                 **params):
+    """
+    Compares storage configurations for one DHW-profile in a single pass,
+    instead of calling 'convert_dhw_load_to_storage_load' for each of them.
+    The DataFrame is not changed.
+
+    f.e. size_storage(timeseries_df, V_stor=[150, 200, 300],
+                      Qcon_flow_max=[2000, 5000])
+
+    :param timeseries_df:   stores the DHW-demand profile in [W] per Timestep
+    :param configs_df:      one row per storage with the columns V_stor,
+                            dT_stor, dT_threshhold and Qcon_flow_max
+    :param with_losses:     Boolean if the storages should have losses
+    :param params:          if no configs_df is given, all combinations of
+                            these storage parameters are compared
+    :return: kpis_df:       configs with annual storage load, losses, charge
+                            cycles, min state of charge and unmet demand
+    """
+
+    if configs_df is None:
+        configs_df = get_storage_configs(**params)
+
+    s_step = get_s_step(timeseries_df)
+
+    return sweep_storage_load(
+        heat_J=timeseries_df['Heat_W'].to_numpy() * s_step,
+        s_step=s_step,
+        configs_df=configs_df,
+        with_losses=with_losses
+    )